@@ -0,0 +1,151 @@
+""" phycam benchmark
+Scan performance benchmark of the margin analysis without hardware.
+
+Every configuration runs the whole command line tool against the simulated
+DS90UB954 and reports the wall time, the virtual scan time, the I2C
+transactions, the bus opens/closes and the bytes written to the result
+files and the cell log. The results are written as JSON, so regressions
+of the scan engine show up as numbers.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from phycam import margin_analysis
+from phycam.simulator import Simulation
+
+# name: arguments of phycam-margin-analysis
+CONFIGURATIONS = {
+    "default": [],
+    "window-strobe-4-10": ["--strobe-begin", "4", "--strobe-end", "10"],
+    "window-eq-3-10": ["--eq-begin", "3", "--eq-end", "10"],
+    "window-center": ["--strobe-begin", "5", "--strobe-end", "9",
+                      "--eq-begin", "5", "--eq-end", "9"],
+    "clock-base-delay": ["--clock-base-delay"],
+    "data-base-delay": ["--data-base-delay"],
+    "lock-runs-20": ["--lock-runs", "20"],
+    "lock-time-0.2": ["--lock-time", "0.2"],
+    "early-stop-95": ["--early-stop", "95"],
+    "poll-lock": ["--poll-lock", "--dwell-time", "0.5"],
+    "trace": ["--trace"],
+    "order-serpentine": ["--order", "serpentine"],
+    "order-column": ["--order", "column"],
+    "order-column-serpentine": ["--order", "column-serpentine"],
+    "both-ports": ["-p", "both"],
+    "two-targets": ["-b", "1", "2"],
+}
+
+
+class SessionRecorder:
+    """I2C factory on a simulation which keeps all created sessions"""
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.sessions = []
+
+    def __call__(self, bus):
+        i2c = self.simulation.i2c(bus)
+        self.sessions.append(i2c)
+        return i2c
+
+    def total(self, counter):
+        """sum of a counter over all sessions"""
+        return sum(getattr(i2c, counter) for i2c in self.sessions)
+
+
+def run_configuration(arguments, seed=1, simulation_options=None):
+    """run the margin analysis once, returns the measured numbers"""
+    simulation = Simulation(seed=seed, **(simulation_options or {}))
+    recorder = SessionRecorder(simulation)
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "ma_lock_result.txt")
+        argv = ["-b", "1", "-n", "-o", output] + arguments
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            returncode = margin_analysis.main(argv, recorder)
+        wall_time = time.perf_counter() - start
+        sizes = {name: os.path.getsize(os.path.join(directory, name))
+                 for name in os.listdir(directory)}
+    log_bytes = sizes.pop("ma_lock_result.log", 0)
+    return {
+        "returncode": returncode,
+        "wall_time": wall_time,
+        # buses are scanned in parallel, the slowest one takes the longest
+        "virtual_time": max(clock.monotonic()
+                            for clock in simulation.clocks.values()),
+        "transactions": recorder.total("reads") + recorder.total("writes"),
+        "reads": recorder.total("reads"),
+        "writes": recorder.total("writes"),
+        "retries": recorder.total("retries"),
+        "opens": recorder.total("opens"),
+        "closes": recorder.total("closes"),
+        "bytes_written": sum(sizes.values()),
+        "log_bytes": log_bytes,
+    }
+
+
+def run_benchmark(names=None, repeat=1, seed=1):
+    """run the configurations, the best wall time of repeat runs counts"""
+    results = {}
+    for name in names or CONFIGURATIONS:
+        runs = [run_configuration(CONFIGURATIONS[name], seed)
+                for _ in range(repeat)]
+        result = runs[0]
+        result["wall_time"] = min(run["wall_time"] for run in runs)
+        result["arguments"] = CONFIGURATIONS[name]
+        results[name] = result
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    """benchmark command line"""
+    parser = argparse.ArgumentParser(
+        prog="python -m phycam.benchmark",
+        description="scan performance benchmark on the simulated DS90UB954")
+    parser.add_argument("-o", "--output", default="ma_benchmark.json",
+                        help="JSON result file, - for stdout")
+    parser.add_argument("-r", "--repeat", type=int, default=1,
+                        help="runs per configuration")
+    parser.add_argument("-s", "--seed", type=int, default=1,
+                        help="random seed of the simulation")
+    parser.add_argument("configurations", nargs="*",
+                        help="configurations to run, all by default: " +
+                        ", ".join(CONFIGURATIONS))
+    args = parser.parse_args(argv)
+    for name in args.configurations:
+        if name not in CONFIGURATIONS:
+            parser.error(f"unknown configuration {name}")
+
+    report = run_benchmark(args.configurations, args.repeat, args.seed)
+    for name, result in report["results"].items():
+        print(f"{name:24} wall {result['wall_time'] * 1000:8.1f} ms  "
+              f"virtual {result['virtual_time']:7.1f} s  "
+              f"i2c {result['transactions']:6}  "
+              f"opens {result['opens']:2}  "
+              f"bytes {result['bytes_written']:6}")
+    if args.output == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+            report_file.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
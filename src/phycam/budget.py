@@ -0,0 +1,192 @@
+""" phycam budget
+Cost model of the scan duration and the choice of parameters for a time budget.
+
+A scan takes the waits after the digital resets of the setup and the
+teardown plus, per area, the dwell time, the lock runs of 3 lock times
+each (or the parity window) and the I2C overhead of the area and of
+every status sample. The overheads are calibrated from the cell logs of
+past runs, which hold the measured duration of every area.
+The estimate is an upper bound: polling for the lock and the early stop
+only end an area sooner.
+
+Within a time budget the largest scan window is chosen, the given one
+shrunk towards the eye center if needed, with as many lock runs as fit.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import copy
+
+from phycam.checkpoint import read_records
+from phycam.verdict import MIN_EQ_LINES, RUN_LENGTH
+
+RESET_SECONDS = 0.1 # wait after a digital reset including registers
+CELL_OVERHEAD = 0.004 # I2C time of an area: register writes and reset
+SAMPLE_OVERHEAD = 0.001 # I2C time of a status snapshot of a port
+LOCK_RUNS_MIN = 10 # lower limit of the prompt
+LOCK_RUNS_MAX = 100 # a lock ratio in steps of 1 %
+RELOCK_MARGIN = 1.5 # dwell time per longest logged relock latency
+CENTER = 7 # EQ and strobe position the window is shrunk towards
+
+
+class CostModel:
+    """scan duration of the parameters of a run
+
+    relock is the longest relock latency of the calibration, None if no
+    run polled the lock. areas is the number of areas the overheads are
+    calibrated from.
+    """
+    def __init__(self, cell_overhead=CELL_OVERHEAD,
+                 sample_overhead=SAMPLE_OVERHEAD, relock=None, areas=0):
+        self.cell_overhead = cell_overhead
+        self.sample_overhead = sample_overhead
+        self.relock = relock
+        self.areas = areas
+
+    def cell_seconds(self, params, ports=1):
+        """duration of an area"""
+        if params.parity_window:
+            # a status snapshot before and after the window
+            return (params.dwell_time + self.cell_overhead +
+                    params.parity_window + 2 * ports * self.sample_overhead)
+        return (params.dwell_time + self.cell_overhead + params.lock_runs *
+                (3 * params.lock_time + ports * self.sample_overhead))
+
+    def scan_seconds(self, params, ports=1):
+        """duration of a whole scan of params.order"""
+        areas = ((params.eq_end + 1 - params.eq_begin) *
+                 (params.strobe_end + 1 - params.strobe_begin))
+        # the teardown resets the registers unless it restores them
+        resets = params.digital_reset + (not params.restore)
+        return (RESET_SECONDS * resets +
+                areas * self.cell_seconds(params, ports))
+
+    def dwell_floor(self, dwell_min):
+        """shortest dwell time safe for the logged relock latencies"""
+        if self.relock is None:
+            return None
+        return max(dwell_min, RELOCK_MARGIN * self.relock)
+
+    @classmethod
+    def calibrate(cls, paths):
+        """model fitted to the measured areas of the cell logs in paths
+
+        The overhead of an area is its duration minus the dwell time and
+        the sampling waits. A least squares line over the number of status
+        snapshots splits it into the overhead of the area and of a
+        snapshot. Runs which polled the lock only give the relock
+        latencies, their dwell is cut short. Missing logs leave the
+        defaults.
+        """
+        points = []
+        for path in paths:
+            try:
+                points += read_points(path)
+            except OSError:
+                continue
+        relock = max((latency for _, _, _, latency, _ in points
+                      if latency is not None), default=None)
+        pairs = []
+        for params, duration, samples, _, ports in points:
+            if params.get("poll_lock"):
+                continue
+            if params.get("parity_window"):
+                # the snapshots before and after the window
+                pairs.append((2 * ports, duration - params["dwell_time"] -
+                              params["parity_window"]))
+            else:
+                pairs.append((samples * ports, duration -
+                              params["dwell_time"] -
+                              samples * 3 * params["lock_time"]))
+        if not pairs:
+            return cls(relock=relock)
+        mean_x = sum(x for x, _ in pairs) / len(pairs)
+        mean_y = sum(y for _, y in pairs) / len(pairs)
+        variance = sum((x - mean_x) ** 2 for x, _ in pairs)
+        slope = 0.0
+        if variance:
+            slope = max(0.0, sum((x - mean_x) * (y - mean_y)
+                                 for x, y in pairs) / variance)
+        return cls(max(0.0, mean_y - slope * mean_x), slope, relock,
+                   len(pairs))
+
+
+def read_points(path):
+    """measured points of a cell log
+
+    Returns (parameters, duration, samples, relock latency, ports) per
+    point, the ports of a point are logged as consecutive cells.
+    """
+    points = []
+    parameters = None
+    last = None
+    for record in read_records(path):
+        if record.get("type") == "run":
+            parameters = record.get("parameters")
+            last = None
+        elif (record.get("type") == "cell" and parameters and
+              "duration" in record):
+            key = (record["bus"], record["addr"], record["eq"],
+                   record["strobe"], record["duration"])
+            latency = record["latency"]
+            if key == last:
+                # another port of the point, the last to relock counts
+                params, duration, samples, longest, ports = points[-1]
+                if latency is not None and longest is not None:
+                    latency = max(latency, longest)
+                else:
+                    latency = None
+                points[-1] = (params, duration,
+                              max(samples, record["samples"]), latency,
+                              ports + 1)
+            else:
+                points.append((parameters, record["duration"],
+                               record["samples"], latency, 1))
+            last = key
+    return points
+
+
+def windows(params):
+    """scan windows from the given one down to the smallest with a verdict
+
+    Every step drops the outer line of the longer axis which is farther
+    from the eye center.
+    """
+    window = [params.eq_begin, params.eq_end,
+              params.strobe_begin, params.strobe_end]
+    while (window[1] + 1 - window[0] >= MIN_EQ_LINES and
+           window[3] + 1 - window[2] >= RUN_LENGTH):
+        yield tuple(window)
+        axis = 0 if window[1] - window[0] > window[3] - window[2] else 2
+        if CENTER - window[axis] >= window[axis + 1] - CENTER:
+            window[axis] += 1
+        else:
+            window[axis + 1] -= 1
+
+
+def choose_parameters(params, budget, model, ports=1, dwell_min=0.5):
+    """parameters of the highest map resolution within budget seconds
+
+    The dwell time is cut to the calibrated floor, then the largest
+    window is chosen for which at least LOCK_RUNS_MIN lock runs fit, then
+    the most lock runs up to LOCK_RUNS_MAX. Returns None if even the
+    smallest window does not fit.
+    """
+    chosen = copy.copy(params)
+    floor = model.dwell_floor(dwell_min)
+    if floor is not None and floor < chosen.dwell_time:
+        chosen.dwell_time = floor
+    for window in windows(params):
+        (chosen.eq_begin, chosen.eq_end,
+         chosen.strobe_begin, chosen.strobe_end) = window
+        chosen.lock_runs = LOCK_RUNS_MIN
+        if model.scan_seconds(chosen, ports) > budget:
+            continue
+        while chosen.lock_runs < LOCK_RUNS_MAX and not chosen.parity_window:
+            chosen.lock_runs += 1
+            if model.scan_seconds(chosen, ports) > budget:
+                chosen.lock_runs -= 1
+                break
+        return chosen
+    return None
@@ -0,0 +1,136 @@
+""" phycam checkpoint
+Append-only log of the measured eye cells, to resume an interrupted scan.
+
+Every run starts with a run record holding its targets and parameters,
+followed by one cell record per measured area and port. A record is a
+JSON line. The log is flushed after every record and synced to the disk
+in batches, so an interruption loses at most the cell being measured.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import json
+import os
+import threading
+import time
+
+SYNC_RECORDS = 16 # records written before the log is synced
+SYNC_INTERVAL = 5.0 # seconds after which the log is synced anyway
+
+
+def read_records(path):
+    """records of a cell log, a line cut off by an interruption is skipped"""
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue # cut off by the interruption
+
+
+class CellLog:
+    """append-only cell log of a run
+
+    Use the instance as a context manager to open and close the log.
+    load() reads the last run of an existing log to resume it.
+    """
+    def __init__(self, path, sync_records=SYNC_RECORDS,
+                 sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.sync_records = sync_records
+        self.sync_interval = sync_interval
+        self.file = None
+        self.header = None
+        self.cells = {}
+        self.pending = 0
+        self.synced = time.monotonic()
+        self.lock = threading.Lock() # targets are scanned in threads
+
+    def __enter__(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """sync and close the log"""
+        if self.file is not None:
+            with self.lock:
+                self.sync()
+                self.file.close()
+                self.file = None
+
+    def sync(self):
+        """write the pending records to the disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.synced = time.monotonic()
+
+    def write(self, record):
+        """append a record, sync if the batch is full or old enough"""
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+            self.pending += 1
+            if (self.pending >= self.sync_records or
+                    time.monotonic() - self.synced >= self.sync_interval):
+                self.sync()
+
+    def start(self, header):
+        """start a new run with the targets and parameters in header"""
+        self.header = header
+        self.cells = {}
+        self.write(dict(header, type="run", time=time.time()))
+
+    def load(self):
+        """read the header and the cells of the last run in the log"""
+        self.header = None
+        self.cells = {}
+        for record in read_records(self.path):
+            if record.get("type") == "run":
+                self.header = record
+                self.cells = {}
+            elif record.get("type") == "cell" and self.header:
+                target = (record["bus"], record["addr"], record["port"])
+                self.cells.setdefault(target, {})[
+                    (record["eq"], record["strobe"])] = (
+                        record["ratio"], record["samples"],
+                        record["latency"], record.get("errors"))
+        if self.header is None:
+            raise ValueError(f"no run to resume in {self.path}")
+        return self.header
+
+    def known(self, bus, addr, port):
+        """cells of a port measured so far, by (eq, strobe), as
+        (ratio, samples, latency, parity error rate)"""
+        return self.cells.get((bus, addr, port), {})
+
+    def preset(self, bus, addr, port, cells, source):
+        """log cells of a port taken from source instead of measuring them"""
+        known = self.cells.setdefault((bus, addr, port), {})
+        for (eq, strobe), (ratio, samples, latency) in cells.items():
+            if (eq, strobe) not in known:
+                known[(eq, strobe)] = (ratio, samples, latency, None)
+                self.write({"type": "cell", "bus": bus, "addr": addr,
+                            "port": port, "eq": eq, "strobe": strobe,
+                            "ratio": ratio, "samples": samples,
+                            "latency": latency, "source": source})
+
+    def recorder(self, bus, addr, ports):
+        """record function for the points measured on ports of a target"""
+        def record(step, point, duration):
+            """log the cell of every port of a measured point"""
+            for port, (ratio, samples, latency, errors) in zip(ports, point):
+                self.write({"type": "cell", "bus": bus, "addr": addr,
+                            "port": port, "eq": step.eq,
+                            "strobe": step.strobe,
+                            "eq_value": step.eq_value,
+                            "strobe_value": step.strobe_value,
+                            "ratio": ratio, "samples": samples,
+                            "latency": latency, "errors": errors,
+                            "time": time.time(),
+                            "duration": duration})
+        return record
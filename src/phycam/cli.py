@@ -0,0 +1,492 @@
+""" phycam cli
+Command line, profile and prompts of the margin analysis.
+
+A parameter is taken from the command line, else from the
+[margin-analysis] section of the profile, else it is asked for
+interactively or left at its default.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import argparse
+import configparser
+from phycam.render import cell_glyph
+from phycam.scan import POLL_INTERVAL, SCAN_ORDERS, MarginParameters
+
+
+class MarginRequest:
+    """question for optional parameter request"""
+    def __init__(self, question):
+        self.question = question + " (y/N)"
+        self.variable = 0
+
+    def yes_no(self):
+        """input: yes or no"""
+        while True:
+            print()
+            print(self.question)
+            ma_input = input()
+            if (str(ma_input) == "y" or str(ma_input) == "Y" or
+                    str(ma_input) == "j" or str(ma_input) == "Yes" or
+                    str(ma_input) == "yes"):
+                self.variable = 1
+                break
+            if (str(ma_input) == "n" or str(ma_input) == "N" or
+                    str(ma_input) == "no" or str(ma_input) == "No" or
+                    str(ma_input) == "NO" or str(ma_input) == ""):
+                self.variable = 0
+                break
+            print("Incorrect input, please try again!")
+        return self.variable
+
+    @staticmethod
+    def color_output(s_c_output, eq_value):
+        """map output"""
+        print(cell_glyph(s_c_output, eq_value), end=" ")
+
+    @staticmethod
+    def inferred_output(s_c_output, eq_value):
+        """map output of an area inferred from the traced eye boundary"""
+        print(cell_glyph(s_c_output, eq_value, True), end=" ")
+
+    def output(self):
+        """value return"""
+        return self.variable
+
+
+class MarginInput:
+    """question for optional parameter input"""
+    def __init__(self, article, what, variable):
+        self.article = article
+        self.what = what
+        self.variable = variable
+
+    def float_input(self, start, end, unit="ms", scale=1000,
+                    result_unit="second(s)"):
+        """range between and insert of float value"""
+        while True:
+            print("\nDo you want to set", self.article, self.what, "? (y/N)")
+            ma_input = input()
+            if (str(ma_input) == "y" or str(ma_input) == "Y" or
+                    str(ma_input) == "j" or str(ma_input) == "Yes" or
+                    str(ma_input) == "yes"):
+                print()
+                while True:
+                    print("Enter a value between", start, "and", end,
+                          f"({unit}):")
+                    variable = input()
+                    try:
+                        variable = float(variable)
+                        if start <= variable <= end:
+                            self.variable = variable / scale
+                            break
+                        print("\nPlease try again!")
+                    except ValueError:
+                        print("\nPlease try again!")
+                break
+            if (str(ma_input) == "n" or str(ma_input) == "N" or
+                    str(ma_input) == "no" or str(ma_input) == "No" or
+                    str(ma_input) == "NO" or str(ma_input) == ""):
+                print("The", self.what, "value",
+                      self.variable, "is set by default")
+                break
+            print("Incorrect input, please try again!")
+        print("current", self.what, ": ", self.variable, result_unit + "\n")
+        return self.variable
+
+    def int_input(self):
+        """only a minimum value for the integer parameter"""
+        while True:
+            print("\nDo you want to set", self.article, self.what, "? (y/N)")
+            ma_input = input()
+            if (str(ma_input) == "y" or str(ma_input) == "Y" or
+                    str(ma_input) == "j" or str(ma_input) == "Yes" or
+                    str(ma_input) == "yes"):
+                print()
+                while True:
+                    print("Enter an integer value greater than",
+                          self.variable, ":")
+                    variable = input()
+                    try:
+                        variable = int(variable)
+                        if variable >= self.variable:
+                            self.variable = variable
+                            break
+                        print("\nPlease try again!")
+                    except ValueError:
+                        print("\nPlease try again!")
+                break
+            if (str(ma_input) == "n" or str(ma_input) == "N" or
+                    str(ma_input) == "no" or str(ma_input) == "No" or
+                    str(ma_input) == "NO" or str(ma_input) == ""):
+                print("The", self.what, "value",
+                      self.variable, "is set by default")
+                break
+            print("Incorrect input, please try again!")
+        print("current", self.what, ": ", self.variable, "\n")
+        return self.variable
+
+    def output(self):
+        """parameter return"""
+        return self.variable
+
+
+class MarginPosition:
+    """optional map range"""
+    def __init__(self, what):
+        self.what = what
+        self.begin_variable = 0
+        self.end_variable = 14
+        self.variable = 0
+
+    def yes_no(self):
+        """input: yes or no"""
+        while True:
+            print("\nDo you want to set", self.what, "? (y/N)")
+            ma_input = input()
+            if (str(ma_input) == "y" or str(ma_input) == "Y" or
+                    str(ma_input) == "j" or str(ma_input) == "Yes" or
+                    str(ma_input) == "yes"):
+                print()
+                self.variable = 1
+                break
+            if (str(ma_input) == "n" or str(ma_input) == "N" or
+                    str(ma_input) == "no" or str(ma_input) == "No" or
+                    str(ma_input) == "NO" or str(ma_input) == ""):
+                print("The", self.what, "start value", self.begin_variable,
+                      "and", self.what, "end value",
+                      self.end_variable, "is set by default.")
+                self.variable = 0
+                break
+            print("Incorrect input, please try again!")
+        return self.variable
+
+    def output(self):
+        """parameter return"""
+        return self.variable
+
+    def begin_end(self, start, end):
+        """set map range integer values"""
+        while True:
+            print("Enter integer values from", start,
+                  "to", end, ":")
+            print(self.what, "Begin:")
+            begin_variable = input()
+            try:
+                begin_variable = int(begin_variable)
+                if start <= begin_variable <= end:
+                    self.begin_variable = begin_variable
+                    print(self.what, "End:")
+                    end_variable = input()
+                    try:
+                        end_variable = int(end_variable)
+                        if (start <= end_variable <= end and
+                                begin_variable <= end_variable):
+                            self.end_variable = end_variable
+                            break
+                        print()
+                        print("Please try again! The values can not be equal!")
+                    except ValueError:
+                        print("\nPlease try again!")
+                else:
+                    print("\nPlease try again!")
+            except ValueError:
+                print("\nPlease try again!")
+        return self.begin_variable, self.end_variable
+
+    def begin(self):
+        """return begin parameter of the map range"""
+        return self.begin_variable
+
+    def end(self):
+        """return end parameter of the map range"""
+        return self.end_variable
+
+
+FLAG_PARAMETERS = ("digital_reset", "color", "poll_lock",
+                   "clock_base_delay", "data_base_delay", "trace", "restore")
+FLOAT_PARAMETERS = ("dwell_time", "lock_time", "early_stop", "time_budget",
+                    "parity_window")
+INT_PARAMETERS = ("lock_runs", "strobe_begin", "strobe_end",
+                  "eq_begin", "eq_end", "rescan_ring")
+TEXT_PARAMETERS = ("bus", "port", "output", "order", "log", "history",
+                   "cable", "rescan", "metrics", "record")
+PROFILE_SECTION = "margin-analysis"
+RESULT_FILE = "./ma_lock_result.txt"
+
+
+def parse_arguments(argv=None):
+    """command line arguments, every parameter left out is asked for"""
+    parser = argparse.ArgumentParser(
+        prog="phycam-margin-analysis",
+        description="phyCAM-L margin analysis of the DS90UB954 " +
+        "FPD-Link III deserializer. Parameters which are neither given " +
+        "as argument nor in the profile are asked for interactively.")
+    parser.add_argument("-c", "--profile",
+                        help="profile file with the parameters of the run")
+    parser.add_argument("-b", "--bus", nargs="+",
+                        help="I2C bus number, or several " +
+                        "BUS[:ADDRESS[:PORT]] targets")
+    parser.add_argument("-p", "--port", choices=("0", "1", "both"),
+                        help="FPD-Link III port to test")
+    parser.add_argument("-o", "--output",
+                        help=f"result file, default {RESULT_FILE}")
+    parser.add_argument("--simulate", action="store_true",
+                        help="scan simulated deserializers on a virtual " +
+                        "clock instead of the hardware")
+    parser.add_argument("--simulate-seed", type=int,
+                        help="random seed of the simulation")
+    parser.add_argument("--record", metavar="TRACE",
+                        help="record all I2C transactions to a trace file")
+    parser.add_argument("--replay", metavar="TRACE",
+                        help="replay a recorded trace instead of the "
+                        "hardware, the other arguments must be the recorded "
+                        "ones")
+    parser.add_argument("--replay-timing", action="store_true",
+                        help="replay at the original timing instead of at "
+                        "full speed")
+    parser.add_argument("--log",
+                        help="cell log, default next to the result file")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last run of the cell log")
+    parser.add_argument("--history", metavar="DATABASE",
+                        help="add the results to a run history database, "
+                        "see python -m phycam.history")
+    parser.add_argument("--cable", metavar="ID",
+                        help="cable or serial ID for the run history")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write counters and latency histograms of the "
+                        "run in the Prometheus text format to FILE and as "
+                        "JSON next to it")
+    parser.add_argument("-n", "--no-prompt", action="store_true",
+                        default=None,
+                        help="do not ask, use the defaults instead")
+    for name in FLAG_PARAMETERS:
+        parser.add_argument("--" + name.replace("_", "-"),
+                            action=argparse.BooleanOptionalAction)
+    parser.add_argument("--dwell-time", type=float, metavar="SECONDS")
+    parser.add_argument("--lock-runs", type=int)
+    parser.add_argument("--lock-time", type=float, metavar="SECONDS")
+    parser.add_argument("--early-stop", type=float, metavar="PERCENT",
+                        help="early stop confidence, 0 disables it")
+    parser.add_argument("--parity-window", type=float, metavar="SECONDS",
+                        help="count the parity errors of every area over "
+                        "SECONDS instead of taking lock samples, 0 disables "
+                        "it")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS",
+                        help="choose the window, lock runs and dwell time "
+                        "of the highest resolution the scan fits in, with "
+                        "the cost model of the runs in the cell log")
+    for name in INT_PARAMETERS[1:]:
+        parser.add_argument("--" + name.replace("_", "-"), type=int,
+                            metavar="0..14")
+    parser.add_argument("--rescan", nargs="?", const="", metavar="PREVIOUS",
+                        help="measure only the fractional areas of the "
+                        "previous result (the output by default) and a ring "
+                        "of --rescan-ring areas around them, 1 by default")
+    parser.add_argument("--order", choices=SCAN_ORDERS,
+                        help="order in which the areas are scanned, " +
+                        "raster by default")
+    return parser.parse_args(argv)
+
+
+def read_profile(path):
+    """read the parameters of the [margin-analysis] section of a profile"""
+    profile = configparser.ConfigParser()
+    with open(path, encoding="utf-8") as profile_file:
+        profile.read_file(profile_file)
+    section = profile[PROFILE_SECTION]
+    given = {}
+    for key in section:
+        name = key.replace("-", "_")
+        if name in FLAG_PARAMETERS or name == "no_prompt":
+            given[name] = int(section.getboolean(key))
+        elif name in FLOAT_PARAMETERS:
+            given[name] = section.getfloat(key)
+        elif name in INT_PARAMETERS:
+            given[name] = section.getint(key)
+        elif name in TEXT_PARAMETERS:
+            given[name] = section.get(key)
+        else:
+            raise ValueError(f"unknown parameter {key}")
+    return given
+
+
+def given_parameters(args):
+    """parameters of the profile, overridden by the command line"""
+    given = read_profile(args.profile) if args.profile else {}
+    for name, value in vars(args).items():
+        if name in ("profile", "simulate", "simulate_seed", "resume",
+                    "replay", "replay_timing"):
+            continue
+        if name == "bus" and value is not None:
+            given[name] = " ".join(value)
+        elif value is not None:
+            given[name] = int(value) if name in FLAG_PARAMETERS else value
+    check_parameters(given)
+    return given
+
+
+def check_parameters(given):
+    """check the given parameters against the limits of the prompts"""
+    dwell_min = POLL_INTERVAL if given.get("poll_lock") else 0.5
+    limits = {"dwell_time": (dwell_min, 60), "lock_time": (0.1, 1.5),
+              "lock_runs": (10, None), "early_stop": (0, 99.9),
+              "time_budget": (1, None), "parity_window": (0, 60)}
+    for name in INT_PARAMETERS[1:]:
+        limits[name] = (0, 14)
+    for name, (low, high) in limits.items():
+        value = given.get(name)
+        if value is None:
+            continue
+        if value < low or (high is not None and value > high):
+            raise ValueError(f"{name} {value} out of range")
+    if 0 < given.get("early_stop", 0) < 50:
+        raise ValueError("early_stop must be 0 or between 50 and 99.9")
+    for axis in ("strobe", "eq"):
+        if given.get(axis + "_begin", 0) > given.get(axis + "_end", 14):
+            raise ValueError(f"{axis}_begin is behind {axis}_end")
+    if given.get("port", "0") not in ("", "0", "1", "both", "b"):
+        raise ValueError(f"invalid port {given['port']}")
+    if given.get("order", "raster") not in SCAN_ORDERS:
+        raise ValueError(f"unknown scan order {given['order']}")
+
+
+def load_parameters(values):
+    """parameters of a logged run"""
+    params = MarginParameters()
+    for name, value in values.items():
+        setattr(params, name, value)
+    return params
+
+
+def ask_parameters(ports, given=None, prompt=True):
+    """ask for the parameters of the margin analysis
+
+    Parameters in given (from the command line or the profile) are not
+    asked for, without prompt the defaults are used for the others.
+    """
+    given = dict(given or {})
+    params = MarginParameters()
+    if "early_stop" in given:
+        given["early_stop"] /= 100
+    if ports is None or len(ports) != 1:
+        # the boundary trace is limited to a single port
+        given["trace"] = 0
+    for name, value in given.items():
+        if hasattr(params, name):
+            setattr(params, name, value)
+    if not prompt:
+        return params
+
+    #do a final digital reset including registers if selected
+    if "digital_reset" not in given:
+        digital_reset = MarginRequest("Do you want to do a final " +
+                                      "digital reset including registers " +
+                                      "before starting the test?")
+        digital_reset.yes_no()
+        if digital_reset.output() != 1:
+            print("\rNo final digital reset!")
+        print()
+        params.digital_reset = digital_reset.output()
+
+    if "color" not in given:
+        status_color = MarginRequest("Do you want a colored map?")
+        status_color.yes_no()
+        print()
+        params.color = status_color.output()
+
+    # poll the port status until the lock is stable instead of waiting
+    # the whole dwell time, the dwell time becomes the lock timeout
+    if "poll_lock" not in given:
+        poll_lock = MarginRequest("Do you want to poll for the lock " +
+                                  "instead of a fixed dwell time?")
+        poll_lock.yes_no()
+        print()
+        params.poll_lock = poll_lock.output()
+
+    # delay before lock is checked,
+    # use minimum of 0.5 when doing digital reset
+    #standard 0.9 seconds
+    if "dwell_time" not in given:
+        dwell_time = MarginInput("the", "dwell time", params.dwell_time)
+        if params.poll_lock == 1:
+            dwell_time.float_input(POLL_INTERVAL * 1000, 60000)
+        else:
+            dwell_time.float_input(500, 60000)
+        params.dwell_time = dwell_time.output()
+
+    if "lock_runs" not in given:
+        lock_run = MarginInput("number of", "lock runs", params.lock_runs)
+        lock_run.int_input()
+        params.lock_runs = lock_run.output()
+
+    #standard 0.1 seconds
+    if "lock_time" not in given:
+        lock_time = MarginInput("a", "lock time", params.lock_time)
+        lock_time.float_input(100, 1500)
+        params.lock_time = lock_time.output()
+
+    #stop sampling a cell as soon as it is clearly locked or unlocked
+    if "early_stop" not in given:
+        early_stop = MarginInput("an", "early stop confidence",
+                                 params.early_stop)
+        early_stop.float_input(50, 99.9, unit="%", scale=100, result_unit="")
+        params.early_stop = early_stop.output()
+
+    print("current dwell time: ", params.dwell_time, "s")
+    if params.poll_lock == 1:
+        print("                     (lock timeout, polled every",
+              POLL_INTERVAL, "s)")
+    print("current lock runs:   ", params.lock_runs, " times")
+    print("current lock time:  ", params.lock_time, "s")
+    if params.parity_window:
+        print("parity window:      ", params.parity_window,
+              "s (instead of the lock runs)")
+    if params.decide_after():
+        print("early stop after:   ", params.decide_after(),
+              " identical samples")
+    print()
+
+    if "strobe_begin" not in given and "strobe_end" not in given:
+        strobe_position = MarginPosition("Strobe Position")
+        strobe_position.yes_no()
+        if strobe_position.output() == 1:
+            strobe_position.begin_end(0, 14)
+        params.strobe_begin = strobe_position.begin()
+        params.strobe_end = strobe_position.end()
+    print("current Strobe Position Begin: ", params.strobe_begin)
+    print("current Strobe Position End:   ", params.strobe_end, "\n")
+
+    if "eq_begin" not in given and "eq_end" not in given:
+        eq_position = MarginPosition("EQ Position")
+        eq_position.yes_no()
+        if eq_position.output() == 1:
+            eq_position.begin_end(0, 14)
+        params.eq_begin = eq_position.begin()
+        params.eq_end = eq_position.end()
+    print("current EQ Position Begin: ", params.eq_begin)
+    print("current EQ Position End:   ", params.eq_end, "\n")
+
+    if "clock_base_delay" not in given:
+        clock_base_delay = MarginRequest("Do you want a clock base delay?")
+        clock_base_delay.yes_no()
+        print()
+        params.clock_base_delay = clock_base_delay.output()
+
+    if "data_base_delay" not in given:
+        data_base_delay = MarginRequest("Do you want a data base delay?")
+        data_base_delay.yes_no()
+        print()
+        params.data_base_delay = data_base_delay.output()
+
+    # trace the pass/fail boundary of the eye instead of a full raster scan
+    if "trace" not in given:
+        trace_boundary = MarginRequest("Do you want to trace the eye " +
+                                       "boundary only instead of scanning " +
+                                       "every area?")
+        trace_boundary.yes_no()
+        print()
+        params.trace = trace_boundary.output()
+    return params
@@ -0,0 +1,304 @@
+""" phycam deserializer
+Register access and register tables of the DS90UB954 margin analysis.
+
+The status of a port is read in block reads, the port selection and the
+indirect access page are only written when they change. The setup and the
+teardown are register tables, written and read back by write_table_steps,
+a RegisterSnapshot restores the registers of before the test.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import errno
+from collections import namedtuple
+from phycam.budget import RESET_SECONDS
+from phycam.registers import (FPD3_PORT_SEL_RX_READ_PORT_SHIFT,
+                              FPD3_PORT_SEL_RX_WRITE_BOTH,
+                              I2C_ADDRESS_DS90UB954, IND_ACC_CTL_READ,
+                              IND_REG_OFF_STROBE_SET, REG_ADAPTIVE_EQ_BYPASS,
+                              REG_AEQ_CTL1, REG_FPD3_CAP, REG_FPD3_ENC_CTL,
+                              REG_FPD3_PORT_SEL, REG_IND_ACC_ADDR,
+                              REG_IND_ACC_CTL, REG_IND_ACC_DATA,
+                              REG_PAR_ERR_THOLD_HI, REG_PAR_ERR_THOLD_LO,
+                              REG_RESET, REG_RX_PAR_ERR_LO, REG_RX_PORT_CTL,
+                              REG_RX_PORT_STS1, RX_PORT_CTL_LOCK_SEL_SHIFT,
+                              RX_PORT_CTL_PORT0_EN, RX_PORT_CTL_PORT1_EN,
+                              RX_PORT_CTL_RESERVED)
+
+
+PortStatus = namedtuple("PortStatus", "sts1 sts2 parity_errors")
+
+
+def select_port(i2c, port, addr=I2C_ADDRESS_DS90UB954):
+    """route the port specific register reads to port
+
+    Writes keep going to both ports, used while scanning both ports.
+    A port of None keeps the current selection.
+    """
+    if port is not None:
+        i2c.write(addr, REG_FPD3_PORT_SEL,
+                  FPD3_PORT_SEL_RX_WRITE_BOTH
+                  | port << FPD3_PORT_SEL_RX_READ_PORT_SHIFT)
+
+
+def read_port(i2c, port, reg, addr=I2C_ADDRESS_DS90UB954):
+    """read a port specific register of port"""
+    select_port(i2c, port, addr)
+    return i2c.read(addr, reg)
+
+
+def read_order(i2c, ports, addr=I2C_ADDRESS_DS90UB954):
+    """ports in the order to read their status
+
+    The port selected for reads comes first, so a round of status reads
+    over both ports switches the port selection once instead of twice.
+    """
+    select = i2c.cached(addr, REG_FPD3_PORT_SEL)
+    if select is None:
+        return list(ports)
+    current = (select >> FPD3_PORT_SEL_RX_READ_PORT_SHIFT) & 0x3
+    return sorted(ports, key=lambda port: port != current)
+
+
+def read_indirect(i2c, page, offset, addr=I2C_ADDRESS_DS90UB954):
+    """read an indirect register of page from the hardware
+
+    With IA_READ set, writing the indirect address strobes the read, so
+    the address is written even if it is set already.
+    """
+    i2c.write(addr, REG_IND_ACC_CTL, page | IND_ACC_CTL_READ)
+    i2c.forget(addr, REG_IND_ACC_ADDR)
+    i2c.write(addr, REG_IND_ACC_ADDR, offset)
+    return i2c.read(addr, REG_IND_ACC_DATA, cached=False)
+
+
+def read_status(i2c, port, addr=I2C_ADDRESS_DS90UB954, parity=False):
+    """snapshot of the port status of port in one block read
+
+    RX_PORT_STS1 and RX_PORT_STS2 are adjacent, so they are read as a
+    consistent pair. With parity the block reaches up to the parity error
+    counter, which is cleared by the read; parity_errors is None without.
+    """
+    select_port(i2c, port, addr)
+    if parity:
+        data = i2c.read_block(addr, REG_RX_PORT_STS1,
+                              REG_RX_PAR_ERR_LO + 1 - REG_RX_PORT_STS1)
+        return PortStatus(data[0], data[1], (data[-2] << 8) | data[-1])
+    data = i2c.read_block(addr, REG_RX_PORT_STS1, 2)
+    return PortStatus(data[0], data[1], None)
+
+
+# register write of an init or teardown table: the bits of mask are set to
+# value, the others keep their value (read-modify-write). delay is the wait
+# the datasheet requires after the write, verify reads the value back.
+RegisterWrite = namedtuple("RegisterWrite", "reg value mask delay verify")
+
+# registers of the setup which are not port specific, in address order to
+# read them in few blocks for the snapshot before the test
+SNAPSHOT_REGISTERS = (REG_PAR_ERR_THOLD_HI, REG_PAR_ERR_THOLD_LO,
+                      REG_RX_PORT_CTL, REG_AEQ_CTL1, REG_FPD3_CAP,
+                      REG_FPD3_PORT_SEL, REG_IND_ACC_CTL, REG_IND_ACC_ADDR,
+                      REG_FPD3_ENC_CTL)
+
+# register state before the test: the value of each of the
+# SNAPSHOT_REGISTERS and the EQ bypass and STROBE_SET value per port
+RegisterSnapshot = namedtuple("RegisterSnapshot", "registers ports")
+
+
+def register_write(reg, value, mask=0xff, delay=0, verify=True):
+    """entry of a register table, verified without a wait by default"""
+    return RegisterWrite(reg, value, mask, delay, verify)
+
+
+def setup_table(ports, digital_reset=0):
+    """register table of the setup for the margin analysis of ports"""
+    table = []
+    #do a final digital reset including registers if selected
+    if digital_reset == 1:
+        # self-clearing, the registers are reloaded meanwhile
+        table.append(register_write(REG_RESET, 0x02, delay=RESET_SECONDS,
+                                    verify=False))
+    #set RX_PORT_CTL register
+    #Port 0 and Port1 Receiver enabled, Port x Receiver Lock
+    table.append(register_write(REG_RX_PORT_CTL, RX_PORT_CTL_RESERVED
+                                | RX_PORT_CTL_PORT0_EN
+                                | RX_PORT_CTL_PORT1_EN
+                                | ports[0] << RX_PORT_CTL_LOCK_SEL_SHIFT))
+    #set Read/Write Enable for RX port x registers in FPD3_PORT_SEL register
+    rx_write_port = 0
+    for port in ports:
+        rx_write_port |= 0x01 << port
+    rx_read_port = ports[0] << FPD3_PORT_SEL_RX_READ_PORT_SHIFT
+    table.append(register_write(REG_FPD3_PORT_SEL,
+                                rx_write_port | rx_read_port))
+    table += [
+        # prepare indirect register access
+        # choose FPD-Link III RX Port x Reserved Registers: Test and Debug registers
+        register_write(REG_IND_ACC_CTL, 0x01 << (2 + ports[0])),
+        # choose STROBE_SET (@offset 8)
+        # values will be written to REG_IND_ACC_DATA later in the test loops!
+        register_write(REG_IND_ACC_ADDR, IND_REG_OFF_STROBE_SET),
+        # configure AEQ_CTL register: Disable SFILTER adaption with AEQ
+        #AEQ Error Control: [6] FPD-Link III clock errors,
+        #                   [5] Packet encoding errors, [4] Parity errors
+        register_write(REG_AEQ_CTL1, 0x70),
+        # set AEQ Bypass register: bypass AEQ, STAGE1=0, STAGE2=0, Lock Mode = 1
+        # read back from the read port, ports[0]
+        register_write(REG_ADAPTIVE_EQ_BYPASS, 0x01), #1: Disable adaptive EQ
+        # set Parity Error Threshold Hi and Lo Register
+        register_write(REG_PAR_ERR_THOLD_HI, 0x00),
+        register_write(REG_PAR_ERR_THOLD_LO, 0x01),
+        # Enable Encoder CRC error capability
+        #1: Enable CRC error flag from FPD-Link III encoder
+        register_write(REG_FPD3_CAP, 0x10, mask=0x10),
+        # Enable Encoder CRC
+        register_write(REG_FPD3_ENC_CTL, 0x00, mask=0x80),
+    ]
+    return table
+
+
+def teardown_table(ports):
+    """register table of the teardown after the margin analysis of ports"""
+    table = []
+    # write reg_8 default value
+    for port in ports:
+        if len(ports) > 1:
+            table.append(register_write(REG_IND_ACC_CTL, 0x01 << (2 + port)))
+        # the reset below clears it anyway, no read back
+        table.append(register_write(REG_IND_ACC_DATA, 0x0, verify=False))
+    #do a final digital reset including registers
+    table.append(register_write(REG_RESET, 0x02, delay=RESET_SECONDS,
+                                verify=False))
+    return table
+
+
+def restore_table(snapshot):
+    """register table which restores a RegisterSnapshot
+
+    The port specific registers come first, they need the port selection
+    and the indirect access page which are restored last. STROBE_SET is
+    read back by write_table_steps with IA_READ.
+    """
+    table = []
+    for port, (eq_bypass, strobe_set) in snapshot.ports.items():
+        table += [
+            register_write(REG_FPD3_PORT_SEL, 0x01 << port |
+                           port << FPD3_PORT_SEL_RX_READ_PORT_SHIFT),
+            register_write(REG_ADAPTIVE_EQ_BYPASS, eq_bypass),
+            register_write(REG_IND_ACC_CTL, 0x01 << (2 + port)),
+            register_write(REG_IND_ACC_ADDR, IND_REG_OFF_STROBE_SET),
+            register_write(REG_IND_ACC_DATA, strobe_set),
+        ]
+    table += [register_write(reg, value)
+              for reg, value in snapshot.registers.items()]
+    return table
+
+
+def write_table_steps(i2c, table, addr=I2C_ADDRESS_DS90UB954):
+    """write a register table, reading back every verified value
+
+    Only the writes with a delay wait. A value which does not read back
+    raises an OSError, the register did not take it. IND_ACC_DATA is read
+    back through read_indirect, the page is written without IA_READ again.
+    """
+    for entry in table:
+        value = entry.value
+        if entry.mask != 0xff:
+            value |= i2c.read(addr, entry.reg) & ~entry.mask
+        i2c.write(addr, entry.reg, value)
+        if entry.delay:
+            yield entry.delay
+        if not entry.verify:
+            continue
+        if entry.reg == REG_IND_ACC_DATA:
+            page = i2c.read(addr, REG_IND_ACC_CTL)
+            readback = read_indirect(i2c, page, i2c.read(addr, REG_IND_ACC_ADDR),
+                                     addr)
+            i2c.write(addr, REG_IND_ACC_CTL, page)
+        else:
+            readback = i2c.read(addr, entry.reg, cached=False)
+        if (readback ^ value) & entry.mask:
+            raise OSError(errno.EIO, f"register 0x{entry.reg:02x} "
+                          f"reads back 0x{readback:02x} instead of "
+                          f"0x{value:02x}")
+
+
+def read_registers(i2c, regs, addr=I2C_ADDRESS_DS90UB954):
+    """values of the sorted registers regs, adjacent ones in one block"""
+    values = {}
+    start = 0
+    for index, reg in enumerate(regs):
+        if index + 1 < len(regs) and regs[index + 1] == reg + 1:
+            continue
+        first = regs[start]
+        if index == start:
+            values[first] = i2c.read(addr, first)
+        else:
+            values.update(zip(regs[start:index + 1],
+                              i2c.read_block(addr, first, index + 1 - start)))
+        start = index + 1
+    return values
+
+
+def snapshot_registers(i2c, ports, addr=I2C_ADDRESS_DS90UB954):
+    """RegisterSnapshot of the registers the test changes on ports
+
+    Taken before the setup, it changes the port selection and the
+    indirect access registers only after they are read. The registers
+    are read from the hardware, the shadow of the device is dropped.
+    """
+    i2c.forget(addr)
+    registers = read_registers(i2c, SNAPSHOT_REGISTERS, addr)
+    port_values = {}
+    for port in ports:
+        eq_bypass = read_port(i2c, port, REG_ADAPTIVE_EQ_BYPASS, addr)
+        port_values[port] = (eq_bypass, read_indirect(
+            i2c, 0x01 << (2 + port), IND_REG_OFF_STROBE_SET, addr))
+    return RegisterSnapshot(registers, port_values)
+
+
+def setup_steps(i2c, ports, digital_reset=0, addr=I2C_ADDRESS_DS90UB954):
+    """prepare the deserializer for the margin analysis of ports"""
+    yield from write_table_steps(i2c, setup_table(ports, digital_reset), addr)
+
+
+def teardown_steps(i2c, ports, addr=I2C_ADDRESS_DS90UB954, snapshot=None):
+    """restore the deserializer after the margin analysis of ports
+
+    With a RegisterSnapshot its registers are restored instead of the
+    final digital reset including registers.
+    """
+    if snapshot is None:
+        yield from write_table_steps(i2c, teardown_table(ports), addr)
+    else:
+        yield from write_table_steps(i2c, restore_table(snapshot), addr)
+
+    #readback RX_PORT_STS1 to clear Lock status changed on RX Port 0
+    i2c.read(addr, REG_RX_PORT_STS1)
+
+
+def eq_register(eq):
+    """REG_ADAPTIVE_EQ_BYPASS value of an EQ map row"""
+    eq_sel1 = min(eq, 7)
+    eq_sel2 = max(eq - 7, 0)
+    return (eq_sel1<<5) + (eq_sel2<<1) + 0x01
+
+
+def strobe_register(strobe, clock_base_delay=0, data_base_delay=0):
+    """REG_IND_ACC_DATA (STROBE_SET) value of a strobe map column"""
+    cdly_ctrl = max(7 - strobe, 0) + 8 * clock_base_delay
+    ddly_ctrl = max(strobe - 7, 0) + 8 * data_base_delay
+    return (ddly_ctrl<<4) + cdly_ctrl
+
+
+def register_eq(value):
+    """EQ map row of a REG_ADAPTIVE_EQ_BYPASS value of eq_register"""
+    return ((value >> 5) & 0x7) + ((value >> 1) & 0xf)
+
+
+def register_strobe(value):
+    """strobe map column and clock and data base delay of a STROBE_SET value"""
+    cdly_ctrl = value & 0xf
+    ddly_ctrl = value >> 4
+    return 7 + (ddly_ctrl & 0x7) - (cdly_ctrl & 0x7), cdly_ctrl >> 3, ddly_ctrl >> 3
@@ -0,0 +1,134 @@
+""" phycam engine
+asyncio engine driving the scan steps of many deserializers at once.
+
+The scans are step generators which do their register accesses and yield
+the time to wait before they continue. The engine runs every step of a
+bus in the single thread executor of that bus, so the blocking I2C calls
+of one bus are serialized and the buses work in parallel. The waits are
+awaitable timers: on the real clock they are asyncio sleeps, a virtual
+clock (simulation) is advanced once all scans on it are waiting.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import time
+
+
+def advance(steps):
+    """run steps up to the next wait, returns (delay, None) or (None, result)"""
+    # StopIteration can not be passed through a future
+    try:
+        return next(steps), None
+    except StopIteration as stop:
+        return None, stop.value
+
+
+class RealTimer:
+    """timers on the time module"""
+    def join(self):
+        """a scan starts to use the timer"""
+
+    def leave(self):
+        """a scan is done with the timer"""
+
+    async def sleep(self, delay):
+        """wait delay seconds"""
+        await asyncio.sleep(delay)
+
+
+class VirtualTimer:
+    """timers on a virtual clock shared by several scans
+
+    The clock only advances when all scans using it wait, then the one
+    with the earliest wake up time continues.
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self.scans = 0
+        self.waiting = [] # heap of (wake up time, order, future)
+        self.order = itertools.count()
+
+    def join(self):
+        """a scan starts to use the timer"""
+        self.scans += 1
+
+    def leave(self):
+        """a scan is done with the timer"""
+        self.scans -= 1
+        self.wake_up()
+
+    async def sleep(self, delay):
+        """wait delay seconds of the virtual clock"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (self.clock.monotonic() + delay,
+                                      next(self.order), future))
+        self.wake_up()
+        await future
+
+    def wake_up(self):
+        """continue the earliest scan once all scans wait"""
+        if self.waiting and len(self.waiting) >= self.scans:
+            wake_up, _, future = heapq.heappop(self.waiting)
+            self.clock.sleep(wake_up - self.clock.monotonic())
+            future.set_result(None)
+
+
+class ScanEngine:
+    """executors per bus and timers per clock of the scans on an event loop
+
+    Use the instance as a context manager to shut the executors down.
+    """
+    def __init__(self):
+        self.executors = {}
+        self.timers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """shut the executors down"""
+        for executor in self.executors.values():
+            executor.shutdown()
+        self.executors = {}
+
+    def executor(self, bus):
+        """single thread executor of the I2C accesses on bus"""
+        if bus not in self.executors:
+            self.executors[bus] = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix=f"i2c-{bus}")
+        return self.executors[bus]
+
+    def timer(self, clock):
+        """timer of clock, the real one for the time module"""
+        if id(clock) not in self.timers:
+            self.timers[id(clock)] = (RealTimer() if clock is time
+                                      else VirtualTimer(clock))
+        return self.timers[id(clock)]
+
+    def drive(self, bus, clock, steps):
+        """coroutine running steps on bus, returns their result"""
+        executor = self.executor(bus)
+        timer = self.timer(clock)
+        # join now, the clock must not run ahead of a scan not started yet
+        timer.join()
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            try:
+                while True:
+                    delay, result = await loop.run_in_executor(
+                        executor, advance, steps)
+                    if delay is None:
+                        return result
+                    await timer.sleep(delay)
+            finally:
+                timer.leave()
+        return run()
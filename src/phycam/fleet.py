@@ -0,0 +1,283 @@
+""" phycam fleet
+Eye statistics of a fleet of cables, e.g. to compare cable lots.
+
+The lock maps of many runs, from lock result files or from a run history
+database, are streamed in batches. The maps of a batch are stacked into
+one byte array in the packed format of the history (one byte per lock
+ratio, 225 bytes per run) and evaluated all at once: the lock ratio sum
+and the number of completely permissible (1.0) runs of an area are taken
+from a strided slice over all maps, the eye widths and heights and the
+verdict criteria from the maps packed into one integer as for the
+verdict. Only these sums and histograms are kept, so the memory does not
+grow with the number of runs.
+
+The eye width of a run is its longest run of 1.0 areas along an EQ line,
+the eye height the longest run of 1.0 areas along a strobe position.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import argparse
+import array
+import math
+import os
+import sys
+
+from phycam.history import (HISTORY_FILE, MAP_SIZE, RATIO_STEPS, RunHistory,
+                            pack_ratios, parse_since, read_result_file)
+from phycam.render import write_map
+from phycam.verdict import RECT_HEIGHT, RECT_WIDTH, batch_verdicts, pack_areas
+
+AREAS = MAP_SIZE * MAP_SIZE
+BATCH_SIZE = 4096 # runs evaluated at once
+PERCENTILES = (0, 5, 25, 50, 75, 95, 100)
+# 1 for a completely permissible area of a packed map, else 0
+PASS_AREAS = bytes(int(value == RATIO_STEPS) for value in range(256))
+RESULT_HEADER = "date:" # first line of a lock result file
+
+
+def extents(maps, horizontal=True):
+    """histogram of the longest run of 1.0 areas of the packed maps
+
+    The runs along the EQ lines if horizontal, else along the strobe
+    positions. For every run length the windows of all maps are collapsed
+    into the first area of each map to count the maps which have one.
+    """
+    bits, count, height, stride = maps
+    map_bytes = (height + 1) * stride
+    starts = int.from_bytes((b"\x01" + bytes(map_bytes - 1)) * count,
+                            "little")
+    step = 8 if horizontal else 8 * stride
+    at_least = [count]
+    runs = bits
+    while runs:
+        found = runs
+        shift = 1
+        while shift < map_bytes:
+            found |= found >> (8 * shift)
+            shift *= 2
+        at_least.append((found & starts).to_bytes(
+            count * map_bytes, "little").count(1))
+        runs &= bits >> (step * len(at_least) - step)
+    at_least.append(0)
+    return [at_least[size] - at_least[size + 1]
+            for size in range(len(at_least) - 1)]
+
+
+def percentile(histogram, percent):
+    """nearest rank percentile of the values counted in a histogram"""
+    rank = max(1, math.ceil(sum(histogram) * percent / 100))
+    for value, count in enumerate(histogram):
+        rank -= count
+        if rank <= 0:
+            return value
+    return None
+
+
+class FleetStatistics:  # pylint: disable=too-many-instance-attributes
+    """aggregated eye statistics of the lock maps added
+
+    Maps are added in the pack_ratios() format and evaluated in batches of
+    batch_size runs. ratio_sums holds the lock ratio sum of every area in
+    steps of 1/RATIO_STEPS, passes the number of runs with a 1.0 area. The
+    histograms count the runs per eye width, eye height, number of EQ lines
+    with a run of 1.0 areas (r_eq) and number of rectangles (c_eq).
+    """
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.batch = bytearray()
+        self.runs = 0
+        self.suitable = 0
+        self.ratio_sums = array.array("Q", bytes(8 * AREAS))
+        self.passes = array.array("Q", bytes(8 * AREAS))
+        self.widths = [0] * (MAP_SIZE + 1)
+        self.heights = [0] * (MAP_SIZE + 1)
+        self.eq_lines = [0] * (MAP_SIZE + 1)
+        self.rectangles = [0] * ((MAP_SIZE + 1 - RECT_WIDTH) *
+                                 (MAP_SIZE + 1 - RECT_HEIGHT) + 1)
+
+    def add(self, packed):
+        """add a lock map in the pack_ratios() format"""
+        self.batch += packed
+        if len(self.batch) >= self.batch_size * AREAS:
+            self.flush()
+
+    def add_map(self, lock_result):
+        """add a 15 x 15 lock map"""
+        self.add(pack_ratios(lock_result))
+
+    def flush(self):
+        """evaluate the maps of the current batch"""
+        count = len(self.batch) // AREAS
+        if not count:
+            return
+        for area in range(AREAS):
+            ratios = self.batch[area::AREAS]
+            self.ratio_sums[area] += sum(ratios)
+            self.passes[area] += ratios.count(RATIO_STEPS)
+        maps = pack_areas(self.batch.translate(PASS_AREAS), count,
+                          MAP_SIZE, MAP_SIZE)
+        for verdict in batch_verdicts(maps):
+            self.eq_lines[verdict.eq_lines] += 1
+            self.rectangles[verdict.rectangles] += 1
+            self.suitable += verdict.suitable
+        for histogram, horizontal in ((self.widths, True),
+                                      (self.heights, False)):
+            for size, runs in enumerate(extents(maps, horizontal)):
+                histogram[size] += runs
+        self.runs += count
+        self.batch = bytearray()
+
+    def pass_probability(self):
+        """15 x 15 map of the share of runs with a 1.0 area"""
+        self.flush()
+        return [[self.passes[eq * MAP_SIZE + strobe] / (self.runs or 1)
+                 for strobe in range(MAP_SIZE)] for eq in range(MAP_SIZE)]
+
+    def mean_ratio(self):
+        """15 x 15 map of the mean lock ratio of every area"""
+        self.flush()
+        return [[self.ratio_sums[eq * MAP_SIZE + strobe] /
+                 (RATIO_STEPS * (self.runs or 1))
+                 for strobe in range(MAP_SIZE)] for eq in range(MAP_SIZE)]
+
+    def percentiles(self):
+        """percentiles of the eye width, eye height, r_eq and c_eq"""
+        self.flush()
+        return {name: [percentile(histogram, percent)
+                       for percent in PERCENTILES]
+                for name, histogram in (("eye width", self.widths),
+                                        ("eye height", self.heights),
+                                        ("EQ lines (r_eq)", self.eq_lines),
+                                        ("rectangles (c_eq)",
+                                         self.rectangles))}
+
+
+def is_result_file(path):
+    """whether path starts with the header of a lock result file"""
+    try:
+        with open(path, encoding="utf-8") as table:
+            return table.readline().startswith(RESULT_HEADER)
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def result_files(paths):
+    """the lock result files of paths, directories are searched
+
+    Of a directory only the .txt files with the header of a lock result
+    are taken, other text files may lie next to them.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, names, files in os.walk(path):
+            names.sort()
+            for name in sorted(files):
+                file = os.path.join(directory, name)
+                if name.endswith(".txt") and is_result_file(file):
+                    yield file
+
+
+def print_statistics(statistics):
+    """print the pass probability map, the percentiles and distributions"""
+    runs = statistics.runs
+    print(f"RUNS: {runs}, suitable {statistics.suitable} "
+          f"({100 * statistics.suitable / (runs or 1):.1f} %)")
+    print("\nPASS PROBABILITY IN %")
+    print(" EQ\\SP" + "".join(f"{strobe:4d}" for strobe in range(MAP_SIZE)))
+    for eq, row in enumerate(statistics.pass_probability()):
+        print(f"   {eq:2d} " + "".join(f"{100 * share:4.0f}"
+                                      for share in row))
+    print("\n" + " " * 17 + "".join(f"{f'p{percent}':>5}"
+                                    for percent in PERCENTILES))
+    for name, values in statistics.percentiles().items():
+        print(f"{name:17}" + "".join(f"{'-' if value is None else value:>5}"
+                                     for value in values))
+    for name, histogram in (("EQ lines (r_eq)", statistics.eq_lines),
+                            ("rectangles (c_eq)", statistics.rectangles)):
+        print(f"\n{name}   runs")
+        for value, count in enumerate(histogram):
+            if count:
+                print(f"{value:17d}  {count:5d}  "
+                      f"{'#' * round(40 * count / runs)}")
+
+
+def write_statistics(path, statistics):
+    """write the maps and percentiles in the layout of the lock result"""
+    with open(path, "w", encoding="utf-8") as table:
+        table.write(f"Runs:,{statistics.runs},\n")
+        table.write(f"Coax-cable suitable:,{statistics.suitable},\n")
+        write_map(table, "PASS-PROBABILITY", statistics.pass_probability(),
+                  0, 0, "{:.3f}")
+        write_map(table, "MEAN-LOCK-RATIO", statistics.mean_ratio(),
+                  0, 0, "{:.3f}")
+        table.write("\nPercentile," + ",".join(
+            f"p{percent}" for percent in PERCENTILES) + ",\n")
+        for name, values in statistics.percentiles().items():
+            table.write(name + "," + ",".join(
+                "" if value is None else str(value) for value in values) +
+                        ",\n")
+        for name, histogram in (("r_eq", statistics.eq_lines),
+                                ("c_eq", statistics.rectangles)):
+            table.write(f"\n{name},runs,\n")
+            for value, count in enumerate(histogram):
+                if count:
+                    table.write(f"{value},{count},\n")
+
+
+def main(argv=None):
+    """fleet statistics command line"""
+    parser = argparse.ArgumentParser(
+        prog="python -m phycam.fleet",
+        description="eye statistics of many margin analysis runs: pass "
+        "probability per area, percentiles of the eye width and height and "
+        "the distribution of the verdict criteria")
+    parser.add_argument("files", nargs="*",
+                        help="lock result files, or directories with them")
+    parser.add_argument("-d", "--database",
+                        help="also the runs of a history database, e.g. "
+                        f"{HISTORY_FILE}")
+    parser.add_argument("--since", help="runs of the database since a "
+                        "period like 7d, 12h or a date YYYY-MM-DD")
+    parser.add_argument("--cable", help="runs of the database of a cable")
+    parser.add_argument("--lot", help="runs of the database whose cable ID "
+                        "starts with LOT")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("-o", "--output", metavar="CSV",
+                        help="write the maps and percentiles to CSV")
+    args = parser.parse_args(argv)
+    if not args.files and args.database is None:
+        parser.error("no result files and no database given")
+
+    statistics = FleetStatistics()
+    skipped = 0
+    for path in result_files(args.files):
+        try:
+            statistics.add_map(read_result_file(path)[1])
+        except (OSError, ValueError) as error:
+            print("Skipped", error)
+            skipped += 1
+    if args.database is not None:
+        try:
+            since = None if args.since is None else parse_since(args.since)
+        except ValueError:
+            parser.error(f"invalid period {args.since}")
+        with RunHistory(args.database) as history:
+            for packed in history.packed_maps(since=since, cable=args.cable,
+                                              lot=args.lot, port=args.port):
+                statistics.add(packed)
+    statistics.flush()
+    if not statistics.runs:
+        print("No runs")
+        return 1
+    print_statistics(statistics)
+    if args.output:
+        write_statistics(args.output, statistics)
+    return 1 if skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+""" phycam history
+Run history of the margin analysis in an SQLite database.
+
+Every tested port is one run: its time, target, cable ID, parameters and
+verdict are indexed columns, the 15 x 15 lock and sample maps are stored
+as compact binary arrays (one byte per lock ratio in steps of 1/250, two
+bytes per sample count). Existing ma_lock_result.txt files can be
+imported, so the archive of a fleet of cables is queried instead of
+parsed.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import argparse
+import array
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+from phycam.verdict import eye_verdict
+
+Run = namedtuple("Run", "id time bus addr port cable parameters "
+                 "eq_lines rectangles suitable source")
+
+HISTORY_FILE = "./ma_history.sqlite"
+MAP_SIZE = 15 # EQ and strobe positions of a map
+RATIO_STEPS = 250 # a lock ratio is stored in steps of 1/RATIO_STEPS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    bus INTEGER,
+    addr INTEGER,
+    port INTEGER,
+    cable TEXT NOT NULL DEFAULT '',
+    parameters TEXT NOT NULL,
+    eq_lines INTEGER NOT NULL,
+    rectangles INTEGER NOT NULL,
+    suitable INTEGER NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    lock_map BLOB NOT NULL,
+    sample_map BLOB
+);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (time);
+CREATE INDEX IF NOT EXISTS runs_target ON runs (bus, port, time);
+CREATE INDEX IF NOT EXISTS runs_cable ON runs (cable, time);
+CREATE INDEX IF NOT EXISTS runs_verdict ON runs (suitable, time);
+-- the parameters are queried by json_extract of any name, no index helps
+DROP INDEX IF EXISTS runs_parameters;
+"""
+
+# parameter block of a lock result file: label, name, conversion
+FILE_PARAMETERS = {
+    "Digital Reset": ("digital_reset", "flag"),
+    "dwell time": ("dwell_time", float),
+    "Lock Polling": ("poll_lock", "flag"),
+    "lock runs": ("lock_runs", int),
+    "lock time": ("lock_time", float),
+    "Strobe Position Begin": ("strobe_begin", int),
+    "Strobe Position End": ("strobe_end", int),
+    "EQ Position Begin": ("eq_begin", int),
+    "EQ Position End": ("eq_end", int),
+    "Clock Base Delay": ("clock_base_delay", "flag"),
+    "Data Base Delay": ("data_base_delay", "flag"),
+    "Early Stop Confidence": ("early_stop", float),
+    "Scan Order": ("order", str),
+    "Parity Window": ("parity_window", float),
+}
+
+
+def full_map(rows, eq_begin=0, sp_begin=0, fill=0):
+    """15 x 15 map of the rows of a scan window"""
+    result = [[fill] * MAP_SIZE for eq in range(MAP_SIZE)]
+    for i, row in enumerate(rows):
+        result[eq_begin + i][sp_begin:sp_begin + len(row)] = row
+    return result
+
+
+def pack_ratios(lock_result):
+    """one byte per lock ratio of a 15 x 15 map"""
+    return bytes(round(min(max(ratio, 0.0), 1.0) * RATIO_STEPS)
+                 for row in lock_result for ratio in row)
+
+
+def unpack_ratios(data):
+    """15 x 15 map of the lock ratios of pack_ratios()"""
+    ratios = [value / RATIO_STEPS for value in data]
+    return [ratios[eq * MAP_SIZE:(eq + 1) * MAP_SIZE] for eq in range(MAP_SIZE)]
+
+
+def pack_samples(sample_result):
+    """two bytes (little endian) per sample count of a 15 x 15 map"""
+    samples = array.array("H", (min(count or 0, 0xffff)
+                                for row in sample_result for count in row))
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def unpack_samples(data):
+    """15 x 15 map of the sample counts of pack_samples()"""
+    samples = array.array("H", data)
+    if sys.byteorder != "little":
+        samples.byteswap()
+    return [samples[eq * MAP_SIZE:(eq + 1) * MAP_SIZE].tolist()
+            for eq in range(MAP_SIZE)]
+
+
+def parse_since(text, now=None):
+    """start time of a period like 7d, 12h, 30m or a date YYYY-MM-DD"""
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([dhm])", text)
+    if match:
+        unit = {"d": 86400, "h": 3600, "m": 60}[match.group(2)]
+        return now - float(match.group(1)) * unit
+    return time.mktime(time.strptime(text, "%Y-%m-%d"))
+
+
+def read_result_file(path):
+    """read a lock result file, returns (run, lock map, sample map)
+
+    bus and address are taken from the file name of a multi target run
+    (..._bus1_0x3d_port0.txt), the port from the parameter block.
+    """
+    with open(path, encoding="utf-8") as table:
+        lines = table.read().splitlines()
+    date = None
+    section = "LOCK-RESULT"
+    maps = {}
+    values = {}
+    for line in lines:
+        fields = line.split(",")
+        if line.startswith("date:"):
+            date = line[5:].strip()
+        elif line.startswith("time:") and date is not None:
+            date += " " + line[5:].strip()
+        elif line.startswith(",,,,,,,,"):
+            if fields[8] != "SP":
+                section = fields[8]
+        elif fields[0].strip().isdigit() and len(fields) > 1:
+            maps.setdefault(section, {})[int(fields[0])] = [
+                value for value in fields[1:MAP_SIZE + 1] if value]
+        elif ":" in fields[0] and len(fields) > 1:
+            values[fields[0].split(":")[0]] = fields[1]
+    if "Error" in values:
+        raise ValueError(f"{path}: failed test, {values['Error']}")
+    if not maps.get("LOCK-RESULT"):
+        raise ValueError(f"{path}: no lock result map")
+
+    # older files end the rows and the map after the scan window
+    lock_result = full_map([], fill=0.0)
+    for eq, row in maps["LOCK-RESULT"].items():
+        lock_result[eq][:len(row)] = [float(value) for value in row]
+    sample_result = None
+    if "LOCK-SAMPLES" in maps:
+        sample_result = full_map([])
+        for eq, row in maps["LOCK-SAMPLES"].items():
+            sample_result[eq][:len(row)] = [int(value) for value in row]
+    parameters = {}
+    for label, (name, convert) in FILE_PARAMETERS.items():
+        if label in values:
+            if convert == "flag":
+                parameters[name] = int(values[label] == "yes")
+            else:
+                parameters[name] = convert(values[label])
+    if "Scan Strategy" in values:
+        parameters["trace"] = int(values["Scan Strategy"] == "boundary trace")
+
+    verdict = eye_verdict(lock_result)
+    suitable = verdict.suitable
+    if "Coax-cable suitable" in values:
+        # the map of the file is rounded, the verdict of the run counts
+        suitable = values["Coax-cable suitable"] == "TRUE"
+    target = re.search(r"bus(\d+)_0x([0-9a-fA-F]+)_port(\d)",
+                       os.path.basename(path))
+    run = Run(None,
+              time.mktime(time.strptime(date, "%d.%m.%Y %H:%M:%S"))
+              if date else os.path.getmtime(path),
+              int(target.group(1)) if target else None,
+              int(target.group(2), 16) if target else None,
+              int(values["Port"]) if values.get("Port", "").isdigit()
+              else int(target.group(3)) if target else None,
+              "", parameters,
+              verdict.eq_lines, verdict.rectangles, suitable,
+              os.path.abspath(path))
+    return run, lock_result, sample_result
+
+
+def run_conditions(since=None, until=None, bus=None, port=None,  # pylint: disable=too-many-arguments
+                   cable=None, suitable=None, parameters=None, run_id=None,
+                   lot=None):
+    """WHERE clause and values of the conditions of RunHistory.query()
+
+    The clause is empty without conditions.
+    """
+    clauses = []
+    values = []
+    for column, operator, value in (("id", "=", run_id),
+                                    ("time", ">=", since),
+                                    ("time", "<", until),
+                                    ("bus", "=", bus),
+                                    ("port", "=", port),
+                                    ("cable", "=", cable)):
+        if value is not None:
+            clauses.append(f"{column} {operator} ?")
+            values.append(value)
+    if lot is not None:
+        clauses.append("substr(cable, 1, ?) = ?")
+        values += [len(lot), lot]
+    if suitable is not None:
+        clauses.append("suitable = ?")
+        values.append(int(suitable))
+    for name, value in (parameters or {}).items():
+        clauses.append("json_extract(parameters, ?) = ?")
+        values += [f"$.{name}", value]
+    if not clauses:
+        return "", values
+    return " WHERE " + " AND ".join(clauses), values
+
+
+class RunHistory:
+    """run history database
+
+    Use the instance as a context manager to commit and close it. cable is
+    the cable or serial ID of the runs added by this session.
+    """
+    def __init__(self, path=HISTORY_FILE, cable=""):
+        self.path = path
+        self.cable = cable
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """commit and close the database"""
+        self.connection.commit()
+        self.connection.close()
+
+    def add(self, run, lock_result, sample_result=None):
+        """add a run with its 15 x 15 maps, returns the run id"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (time, bus, addr, port, cable, parameters, "
+                "eq_lines, rectangles, suitable, source, lock_map, sample_map) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run.time, run.bus, run.addr, run.port, run.cable,
+                 json.dumps(run.parameters, sort_keys=True), run.eq_lines,
+                 run.rectangles, int(run.suitable), run.source,
+                 pack_ratios(lock_result),
+                 None if sample_result is None
+                 else pack_samples(sample_result)))
+        return cursor.lastrowid
+
+    def add_result(self, target, params, result):
+        """add the result of a scanned port, target is (bus, addr, port)"""
+        lock_result, sample_result = result[:2]
+        verdict = eye_verdict(lock_result)
+        bus, addr, port = target
+        return self.add(
+            Run(None, time.time(), bus, addr, port, self.cable,
+                dict(vars(params)), verdict.eq_lines, verdict.rectangles,
+                verdict.suitable, "scan"),
+            full_map(lock_result, params.eq_begin, params.strobe_begin, 0.0),
+            full_map(sample_result, params.eq_begin, params.strobe_begin))
+
+    def import_file(self, path, cable=None):
+        """import a lock result file, returns the run id
+
+        A file imported before is not added again.
+        """
+        run, lock_result, sample_result = read_result_file(path)
+        if cable is not None:
+            run = run._replace(cable=cable)
+        row = self.connection.execute(
+            "SELECT id FROM runs WHERE source = ? AND time = ?",
+            (run.source, run.time)).fetchone()
+        if row:
+            return row[0]
+        return self.add(run, lock_result, sample_result)
+
+    def query(self, since=None, until=None, bus=None, port=None, cable=None,  # pylint: disable=too-many-arguments
+              suitable=None, parameters=None, limit=None, run_id=None,
+              lot=None):
+        """runs matching all given conditions, newest first
+
+        parameters is a dict of parameter values the runs must have, lot
+        the start of their cable IDs.
+        """
+        where, values = run_conditions(since, until, bus, port, cable,
+                                       suitable, parameters, run_id, lot)
+        sql = ("SELECT id, time, bus, addr, port, cable, parameters, eq_lines, "
+               "rectangles, suitable, source FROM runs" + where)
+        sql += " ORDER BY time DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            values.append(limit)
+        return [Run(*row[:6], json.loads(row[6]), row[7], row[8],
+                    bool(row[9]), row[10])
+                for row in self.connection.execute(sql, values)]
+
+    def packed_maps(self, **conditions):
+        """packed lock maps of the runs matching the conditions of query()
+
+        The maps are read one after another in the pack_ratios() format.
+        """
+        where, values = run_conditions(**conditions)
+        for row in self.connection.execute("SELECT lock_map FROM runs" +
+                                           where, values):
+            yield row[0]
+
+    def maps(self, run_id):
+        """lock and sample map of a run, the sample map may be None"""
+        row = self.connection.execute(
+            "SELECT lock_map, sample_map FROM runs WHERE id = ?",
+            (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"no run {run_id}")
+        return (unpack_ratios(row[0]),
+                None if row[1] is None else unpack_samples(row[1]))
+
+
+def print_runs(runs):
+    """print a table of runs"""
+    print(f"{'id':>6}  {'time':19}  {'bus':>3}  {'addr':>4}  {'port':>4}  "
+          f"{'cable':12}  {'EQ':>2}  {'rect':>4}  verdict")
+    for run in runs:
+        print(f"{run.id:6}  "
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run.time))}  "
+              f"{'-' if run.bus is None else run.bus:>3}  "
+              f"{'-' if run.addr is None else hex(run.addr):>4}  "
+              f"{'-' if run.port is None else run.port:>4}  "
+              f"{run.cable:12}  {run.eq_lines:2}  {run.rectangles:4}  "
+              f"{'suitable' if run.suitable else 'NOT suitable'}")
+
+
+def main(argv=None):
+    """run history command line"""
+    parser = argparse.ArgumentParser(
+        prog="python -m phycam.history",
+        description="run history of the margin analysis")
+    parser.add_argument("-d", "--database", default=HISTORY_FILE,
+                        help="history database, default %(default)s")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importing = commands.add_parser("import", help="import lock result files")
+    importing.add_argument("files", nargs="+")
+    importing.add_argument("--cable", help="cable or serial ID of the files")
+    listing = commands.add_parser("list", help="list the matching runs")
+    listing.add_argument("--since", help="period like 7d, 12h or a date "
+                         "YYYY-MM-DD")
+    listing.add_argument("--bus", type=int)
+    listing.add_argument("--port", type=int)
+    listing.add_argument("--cable")
+    listing.add_argument("--lot", help="cable IDs starting with LOT")
+    verdicts = listing.add_mutually_exclusive_group()
+    verdicts.add_argument("--failing", action="store_false", dest="suitable",
+                          default=None, help="only not suitable cables")
+    verdicts.add_argument("--passing", action="store_true", dest="suitable",
+                          help="only suitable cables")
+    listing.add_argument("--limit", type=int)
+    showing = commands.add_parser("show", help="print the lock map of a run")
+    showing.add_argument("id", type=int)
+    args = parser.parse_args(argv)
+
+    with RunHistory(args.database) as history:
+        if args.command == "import":
+            failed = 0
+            for path in args.files:
+                try:
+                    print(path, "-> run", history.import_file(path, args.cable))
+                except (OSError, ValueError) as error:
+                    print("Skipped", error)
+                    failed += 1
+            return 1 if failed else 0
+        if args.command == "list":
+            try:
+                since = None if args.since is None else parse_since(args.since)
+            except ValueError:
+                parser.error(f"invalid period {args.since}")
+            print_runs(history.query(since, bus=args.bus, port=args.port,
+                                     cable=args.cable, suitable=args.suitable,
+                                     limit=args.limit, lot=args.lot))
+            return 0
+        try:
+            lock_result = history.maps(args.id)[0]
+        except KeyError as error:
+            print(error.args[0])
+            return 1
+        print_runs(history.query(run_id=args.id))
+        print(" EQ\\SP" + "".join(f"{strobe:4d}" for strobe in range(MAP_SIZE)))
+        for eq, row in enumerate(lock_result):
+            print(f"   {eq:2d} " + "".join(f"{ratio:4.1f}" for ratio in row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+""" phycam i2c
+I2C bus session of the margin analysis.
+
+The session keeps one SMBus open, retries a failing transaction once on a
+reopened bus, counts the transactions and keeps a shadow of the register
+values of the deserializers. The simulation and the trace replay provide
+the same session on their own transports.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import time
+from smbus2 import SMBus
+from phycam.registers import (FPD3_PORT_SEL_RX_READ_PORT_SHIFT,
+                              IND_ACC_CTL_AUTO_INC, IND_ACC_CTL_READ,
+                              PORT_REGISTERS, REG_FPD3_PORT_SEL,
+                              REG_IND_ACC_ADDR, REG_IND_ACC_CTL,
+                              REG_IND_ACC_DATA, REG_RESET, RESET_REGISTERS,
+                              VOLATILE_REGISTERS)
+
+
+def open_smbus(bus):
+    """open a SMBus session on bus"""
+    return SMBus(bus, force=True)
+
+
+class I2C:
+    """I2C commands with SMBUS
+
+    The bus is opened once and kept open for the lifetime of the session,
+    use the instance as a context manager to close it again. A failing
+    transaction closes the bus, it is reopened on the next access.
+
+    transport opens the bus session, a callable returning an object with
+    the SMBus methods used here. clock provides sleep() and monotonic() for
+    the waits of the scan, the time module by default. The transactions
+    and the scan steps report to metrics if it is set.
+
+    With shadow the register values written and read are kept per device,
+    port and indirect register. Reads of a known value are answered from
+    the shadow, writes of the value a register already holds are skipped.
+    The VOLATILE_REGISTERS always go to the hardware.
+    """
+    def __init__(self, dev_address, transport=open_smbus, clock=time,
+                 shadow=True):
+        self.i2c = dev_address # i2c bus: J8.3 (GPIO2) as SDA,
+                                            # J8.5 (GPIO3) as SCL
+        self.transport = transport
+        self.clock = clock
+        self.bus = None
+        # transport cost counters
+        self.opens = 0
+        self.closes = 0
+        self.reads = 0
+        self.writes = 0
+        self.retries = 0
+        self.cached_reads = 0
+        self.skipped_writes = 0
+        self.metrics = None
+        # register value per (device address, page, register), the page is
+        # the port of a port register and the indirect register address
+        # of IND_ACC_DATA, or None
+        self.shadow = {} if shadow else None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """open the bus session, if it is not open yet"""
+        if self.bus is None:
+            self.bus = self.transport(self.i2c)
+            self.opens += 1
+        return self.bus
+
+    def close(self):
+        """close the bus session"""
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
+            self.closes += 1
+
+    def _transfer(self, func, operation, reg):
+        """run a bus transaction, reopen the bus and retry once on errors"""
+        if self.metrics is not None:
+            self.metrics.inc("i2c_transactions_total", operation=operation,
+                             reg=f"0x{reg:02x}")
+            start = time.perf_counter()
+        try:
+            result = func(self.open())
+        except OSError:
+            self.close()
+            self.retries += 1
+            if self.metrics is not None:
+                self.metrics.inc("i2c_retries_total")
+            try:
+                result = func(self.open())
+            except OSError:
+                self.close()
+                raise
+        if self.metrics is not None:
+            self.metrics.observe("i2c_latency_seconds",
+                                 time.perf_counter() - start,
+                                 operation=operation)
+        return result
+
+    def transactions(self):
+        """number of register accesses done so far"""
+        return self.reads + self.writes
+
+    def detect(self):
+        """tries to scan the I2C bus for devices"""
+        # output: table with the list of detected devices on the specified bus
+        # inspired by shell command "i2cdetect -y 2"
+        i2cbus = self.open()
+        print('     0  1  2  3  4  5  6  7  8  9  a  b  c  d  e  f')
+        for addr in range(0, 127, 16):
+            lin = f'{addr:02x}:'
+            for i in range(0, 16):
+                if addr + i < 3:
+                    lin += '   '
+                else:
+                    try:
+                        i2cbus.write_i2c_block_data(addr + i, 0, [])
+                    except OSError:
+                        lin += ' --'
+                    else:
+                        lin += f' {addr + i:02x}'
+            print(lin)
+
+    def shadow_keys(self, addr, reg, write=False):
+        """shadow entries of a register access, None if unknown
+
+        A write to a port register goes to all ports selected for writes,
+        a read comes from the port selected for reads.
+        """
+        if self.shadow is None or reg in VOLATILE_REGISTERS:
+            return None
+        if reg in PORT_REGISTERS:
+            select = self.shadow.get((addr, None, REG_FPD3_PORT_SEL))
+            if select is None:
+                return None
+            if write:
+                return [(addr, port, reg) for port in (0, 1)
+                        if select & (1 << port)]
+            return [(addr, (select >> FPD3_PORT_SEL_RX_READ_PORT_SHIFT) & 0x3,
+                     reg)]
+        if reg == REG_IND_ACC_DATA:
+            page = self.shadow.get((addr, None, REG_IND_ACC_CTL))
+            offset = self.shadow.get((addr, None, REG_IND_ACC_ADDR))
+            if page is None or offset is None or page & IND_ACC_CTL_AUTO_INC:
+                return None
+            return [(addr, (page & ~IND_ACC_CTL_READ, offset), reg)]
+        return [(addr, None, reg)]
+
+    def cached(self, addr, reg):
+        """value of a register in the shadow, None if unknown"""
+        keys = self.shadow_keys(addr, reg)
+        return self.shadow.get(keys[0]) if keys else None
+
+    def forget(self, addr=None, reg=None):
+        """drop the shadow of a register, a device or of all devices"""
+        if self.shadow is None:
+            return
+        for key in list(self.shadow):
+            if addr in (None, key[0]) and reg in (None, key[2]):
+                del self.shadow[key]
+
+    def read(self, addr, reg, cached=True):
+        """read register of the slave
+
+        Without cached the value is read from the hardware in any case,
+        e.g. to verify a write.
+        """
+        # returns the received byte
+        # inspired by shell command "i2cget"
+        keys = self.shadow_keys(addr, reg)
+        if cached and keys and keys[0] in self.shadow:
+            self.cached_reads += 1
+            return self.shadow[keys[0]]
+        self.reads += 1
+        data = self._transfer(lambda bus: bus.read_byte_data(addr, reg),
+                              "read", reg)
+        if keys:
+            self.shadow[keys[0]] = data
+        return data
+
+    def read_block(self, addr, reg, length):
+        """read length registers from reg on in one transaction"""
+        # the register address auto-increments within the transaction
+        self.reads += 1
+        data = self._transfer(
+            lambda bus: bus.read_i2c_block_data(addr, reg, length),
+            "read_block", reg)
+        for offset, value in enumerate(data):
+            keys = self.shadow_keys(addr, reg + offset)
+            if keys:
+                self.shadow[keys[0]] = value
+        return data
+
+    def write(self, addr, reg, data):
+        """write register of the slave, skipped if it holds data already"""
+        # inspired by shell command "i2cset"
+        # no return value
+        keys = self.shadow_keys(addr, reg, write=True)
+        if keys and all(self.shadow.get(key) == data for key in keys):
+            self.skipped_writes += 1
+            if self.metrics is not None:
+                self.metrics.inc("i2c_skipped_writes_total", reg=f"0x{reg:02x}")
+            return
+        self.writes += 1
+        try:
+            self._transfer(lambda bus: bus.write_byte_data(addr, reg, data),
+                           "write", reg)
+        except OSError:
+            # the register may or may not hold the new value
+            self.forget(addr, reg)
+            raise
+        if reg == REG_RESET and data & RESET_REGISTERS:
+            self.forget(addr)
+        elif keys:
+            for key in keys:
+                self.shadow[key] = data
+        else:
+            # the ports or the indirect register written are unknown
+            self.forget(addr, reg)
@@ -11,879 +11,429 @@ SPDX-License-Identifier: MIT
 Copyright: (C) 2021 PHYTEC Messtechnik GmbH
 """
 
+import configparser
+import os
+import sys
 import time
-from smbus2 import SMBus
-
-
-class I2C:
-    """I2C commands with SMBUS"""
-    def __init__(self, dev_address):
-        self.i2c = dev_address # i2c bus: J8.3 (GPIO2) as SDA,
-                                            # J8.5 (GPIO3) as SCL
-
-    def detect(self):
-        """tries to scan the I2C bus for devices"""
-        # output: table with the list of detected devices on the specified bus
-        # inspired by shell command "i2cdetect -y 2"
-        i2cbus = SMBus(self.i2c, force=True)
-        print('     0  1  2  3  4  5  6  7  8  9  a  b  c  d  e  f')
-        for addr in range(0, 127, 16):
-            lin = f'{addr:02x}:'
-            for i in range(0, 16):
-                if addr + i < 3:
-                    lin += '   '
-                else:
-                    try:
-                        i2cbus.write_i2c_block_data(addr + i, 0, [])
-                    except OSError:
-                        lin += ' --'
-                    else:
-                        lin += f' {addr + i:02x}'
-            print(lin)
-        i2cbus.close()
-
-    def read(self, addr, reg):
-        """read register of the slave"""
-        # returns a list of received data
-        # inspired by shell command "i2cget"
-        i2cbus = SMBus(self.i2c, force=True)
-        i2cbus.read_byte_data(addr, reg)
-        i2cbus.close()
-
-    def write(self, addr, reg, data):
-        """write register of the slave"""
-        # inspired by shell command "i2cset"
-        # no return value
-        i2cbus = SMBus(self.i2c, force=True)
-        i2cbus.write_byte_data(addr, reg, data)
-        i2cbus.close()
-
-
-class Bcolors:  # pylint: disable=too-few-public-methods
-    """color for the characters"""
-    OK = '\033[32m' #GREEN
-    WARNING = '\033[33m' #YELLOW
-    FAIL = '\033[31m' #RED
-    RESET = '\033[0m' #RESET COLOR
-
-
-class MarginRequest:
-    """question for optional parameter request"""
-    def __init__(self, question):
-        self.question = question + " (y/N)"
-        self.variable = 0
-
-    def yes_no(self):
-        """input: yes or no"""
-        while True:
-            print()
-            print(self.question)
-            ma_input = input()
-            if (str(ma_input) == "y" or str(ma_input) == "Y" or
-                    str(ma_input) == "j" or str(ma_input) == "Yes" or
-                    str(ma_input) == "yes"):
-                self.variable = 1
-                break
-            if (str(ma_input) == "n" or str(ma_input) == "N" or
-                    str(ma_input) == "no" or str(ma_input) == "No" or
-                    str(ma_input) == "NO" or str(ma_input) == ""):
-                self.variable = 0
-                break
-            print("Incorrect input, please try again!")
-        return self.variable
-
-    @staticmethod
-    def color_output(s_c_output, eq_value):
-        """map output"""
-        if s_c_output == 1:
-            if eq_value == 1:
-                print(Bcolors.OK + "▇▇" + Bcolors.RESET, end=" ")
-                #sys.stdout.write(Bcolors.OK + "▇▇ " + Bcolors.RESET)
-            elif eq_value == 0:
-                print(Bcolors.FAIL + "▇▇" + Bcolors.RESET, end=" ")
-                #sys.stdout.write(Bcolors.FAIL + "▇▇ " + Bcolors.RESET)
-            else:
-                print(Bcolors.WARNING + "▇▇" + Bcolors.RESET, end=" ")
-                #sys.stdout.write(Bcolors.WARNING + "▇▇ " + Bcolors.RESET)
-        if s_c_output == 0:
-            if eq_value == 1:
-                #print("##", end=" ")
-                print("██", end=" ")
-            elif eq_value == 0:
-                #print("  ", end=" ")
-                print("--", end=" ")
+from phycam.budget import CostModel, choose_parameters
+from phycam.checkpoint import CellLog
+from phycam.cli import (RESULT_FILE, ask_parameters, given_parameters,
+                        load_parameters, parse_arguments)
+from phycam.deserializer import (eq_register, setup_steps, snapshot_registers,
+                                 strobe_register, teardown_steps)
+from phycam.history import RunHistory, full_map, read_result_file
+from phycam.i2c import I2C
+from phycam.metrics import Metrics, timed
+from phycam.registers import I2C_ADDRESS_DS90UB954
+from phycam.render import (MapRenderer, open_table, print_map, print_verdict,
+                           result_path, split_cells, write_lock_rows,
+                           write_parameters)
+from phycam.scan import (POLL_INTERVAL, ScanStep, infer_eye, journal_hooks,
+                         measure_point, plan_steps, run_steps, scan_plan,
+                         trace_eye)
+from phycam.targets import open_bus, run_targets, select_ports, select_targets
+
+
+def previous_cells(previous, targets, single, ring=1):
+    """solid cells of the previous result files of the targets
+
+    The fractional areas of a previous scan window and a ring of ring areas
+    around them are measured again, the 0.0 and 1.0 areas are kept. single
+    is set for the ports of a single deserializer run, whose result files
+    are named without bus and address.
+    Returns the kept cells and the file by (bus, address, port).
+    """
+    result = {}
+    for bus, addr, ports in targets:
+        for port in ports:
+            if single:
+                path = (previous if len(ports) == 1
+                        else result_path(previous, f"port{port}"))
             else:
-                #print("--", end=" ")
-                print("▒▒", end=" ") #7x lock status #7x lock status
-
-    def output(self):
-        """value return"""
-        return self.variable
-
-
-class MarginInput:
-    """question for optional parameter input"""
-    def __init__(self, article, what, variable):
-        self.article = article
-        self.what = what
-        self.variable = variable
-
-    def float_input(self, start, end):
-        """range between and insert of float value"""
-        while True:
-            print("\nDo you want to set", self.article, self.what, "? (y/N)")
-            ma_input = input()
-            if (str(ma_input) == "y" or str(ma_input) == "Y" or
-                    str(ma_input) == "j" or str(ma_input) == "Yes" or
-                    str(ma_input) == "yes"):
-                print()
-                while True:
-                    print("Enter a value between", start, "and", end, "(ms):")
-                    variable = input()
-                    try:
-                        variable = float(variable)
-                        if start <= variable <= end:
-                            self.variable = variable / 1000
-                            break
-                        print("\nPlease try again!")
-                    except ValueError:
-                        print("\nPlease try again!")
-                break
-            if (str(ma_input) == "n" or str(ma_input) == "N" or
-                    str(ma_input) == "no" or str(ma_input) == "No" or
-                    str(ma_input) == "NO" or str(ma_input) == ""):
-                print("The", self.what, "value",
-                      self.variable, "is set by default")
-                break
-            print("Incorrect input, please try again!")
-        print("current", self.what, ": ", self.variable, "second(s)\n")
-        return self.variable
-
-    def int_input(self):
-        """only a minimum value for the integer parameter"""
-        while True:
-            print("\nDo you want to set", self.article, self.what, "? (y/N)")
-            ma_input = input()
-            if (str(ma_input) == "y" or str(ma_input) == "Y" or
-                    str(ma_input) == "j" or str(ma_input) == "Yes" or
-                    str(ma_input) == "yes"):
-                print()
-                while True:
-                    print("Enter an integer value greater than",
-                          self.variable, ":")
-                    variable = input()
-                    try:
-                        variable = int(variable)
-                        if variable >= self.variable:
-                            self.variable = variable
-                            break
-                        print("\nPlease try again!")
-                    except ValueError:
-                        print("\nPlease try again!")
-                break
-            if (str(ma_input) == "n" or str(ma_input) == "N" or
-                    str(ma_input) == "no" or str(ma_input) == "No" or
-                    str(ma_input) == "NO" or str(ma_input) == ""):
-                print("The", self.what, "value",
-                      self.variable, "is set by default")
-                break
-            print("Incorrect input, please try again!")
-        print("current", self.what, ": ", self.variable, "\n")
-        return self.variable
-
-    def output(self):
-        """parameter return"""
-        return self.variable
-
-
-class MarginPosition:
-    """optional map range"""
-    def __init__(self, what):
-        self.what = what
-        self.begin_variable = 0
-        self.end_variable = 14
-        self.variable = 0
-
-    def yes_no(self):
-        """input: yes or no"""
-        while True:
-            print("\nDo you want to set", self.what, "? (y/N)")
-            ma_input = input()
-            if (str(ma_input) == "y" or str(ma_input) == "Y" or
-                    str(ma_input) == "j" or str(ma_input) == "Yes" or
-                    str(ma_input) == "yes"):
-                print()
-                self.variable = 1
-                break
-            if (str(ma_input) == "n" or str(ma_input) == "N" or
-                    str(ma_input) == "no" or str(ma_input) == "No" or
-                    str(ma_input) == "NO" or str(ma_input) == ""):
-                print("The", self.what, "start value", self.begin_variable,
-                      "and", self.what, "end value",
-                      self.end_variable, "is set by default.")
-                self.variable = 0
-                break
-            print("Incorrect input, please try again!")
-        return self.variable
-
-    def output(self):
-        """parameter return"""
-        return self.variable
-
-    def begin_end(self, start, end):
-        """set map range integer values"""
-        while True:
-            print("Enter integer values from", start,
-                  "to", end, ":")
-            print(self.what, "Begin:")
-            begin_variable = input()
-            try:
-                begin_variable = int(begin_variable)
-                if start <= begin_variable <= end:
-                    self.begin_variable = begin_variable
-                    print(self.what, "End:")
-                    end_variable = input()
-                    try:
-                        end_variable = int(end_variable)
-                        if (start <= end_variable <= end and
-                                begin_variable <= end_variable):
-                            self.end_variable = end_variable
-                            break
-                        print()
-                        print("Please try again! The values can not be equal!")
-                    except ValueError:
-                        print("\nPlease try again!")
-                else:
-                    print("\nPlease try again!")
-            except ValueError:
-                print("\nPlease try again!")
-        return self.begin_variable, self.end_variable
-
-    def begin(self):
-        """return begin parameter of the map range"""
-        return self.begin_variable
-
-    def end(self):
-        """return end parameter of the map range"""
-        return self.end_variable
-
-
-# Define registers and values from datasheet
-I2C_ADDRESS_DS90UB954 = 0x3d #this is the default ID if id-pin is pulled high
-I2C_ADDRESS_DS90UB953 = 0x30
-
-REG_I2C_DEV_ID = 0x00
-REG_RESET = 0x01
-REG_PAR_ERR_THOLD_HI = 0x05
-REG_PAR_ERR_THOLD_LO = 0x06
-REG_RX_PORT_CTL = 0x0c
-REG_AEQ_CTL1 = 0x42
-REG_FPD3_CAP = 0x4a
-REG_FPD3_PORT_SEL = 0x4c
-REG_RX_PORT_STS1 = 0x4d
-REG_RX_PORT_STS2 = 0x4e
-REG_RX_PAR_ERR_LO = 0x56
-REG_IND_ACC_CTL = 0xb0
-REG_IND_ACC_ADDR = 0xb1
-REG_IND_ACC_DATA = 0xb2
-REG_FPD3_ENC_CTL = 0xba
-REG_ADAPTIVE_EQ_BYPASS = 0xd4
-
-IND_REG_OFF_STROBE_SET = 0x08
-
-RX_PORT_CTL_RESERVED = 0x2 << 6 # bit 7:6 default to 0x2
-RX_PORT_CTL_PORT0_EN = 1 << 0
-RX_PORT_CTL_PORT1_EN = 1 << 1
-RX_PORT_CTL_LOCK_SEL_SHIFT = 2
-
-FPD3_PORT_SEL_RX_READ_PORT_SHIFT = 4
-
-
-def main():
+                path = result_path(previous,
+                                   f"bus{bus}_0x{addr:02x}_port{port}")
+            run, lock_result, sample_result = read_result_file(path)
+            sample_result = sample_result or full_map([])
+            window = [(eq, strobe)
+                      for eq in range(run.parameters.get("eq_begin", 0),
+                                      run.parameters.get("eq_end", 14) + 1)
+                      for strobe in range(run.parameters.get("strobe_begin", 0),
+                                          run.parameters.get("strobe_end", 14) + 1)]
+            rescan = set()
+            for eq, strobe in window:
+                if 0.0 < lock_result[eq][strobe] < 1.0:
+                    rescan.update((eq + i, strobe + j)
+                                  for i in range(-ring, ring + 1)
+                                  for j in range(-ring, ring + 1))
+            result[(bus, addr, port)] = (
+                {(eq, strobe): (lock_result[eq][strobe],
+                                sample_result[eq][strobe], None)
+                 for eq, strobe in window if (eq, strobe) not in rescan},
+                path)
+    return result
+
+
+def metered(i2c_factory, metrics):
+    """i2c_factory whose sessions report to metrics"""
+    def factory(bus):
+        i2c = i2c_factory(bus)
+        i2c.metrics = metrics
+        return i2c
+    return factory
+
+
+def log_path(output):
+    """cell log next to the result file"""
+    return os.path.splitext(output)[0] + ".log"
+
+
+def main(argv=None, i2c_factory=None):
     """
     Main program function
+
+    i2c_factory creates the I2C session of a bus, used instead of the
+    hardware or the simulation selected by the arguments.
     """
 
-    date = time.strftime("%d.%m.%Y\ntime: %H:%M:%S\n", time.localtime())
-
-    #MARGIN ANALYSIS Testversuch
-    print("\n###########################################################")
-    print("##################### MARGIN ANALYSIS #####################")
-    print("###########################################################")
-    print(f"date: {date}")
-
-    #lock result file
-    table = open("./ma_lock_result.txt", "w+", encoding="utf-8")
-    table.write(f"date: {date}")
-    table.write(",,,,,,,,LOCK-RESULT,,,,,,,,")
-    table.write("\n")
-    table.write(",,,,,,,,SP,,,,,,,,")
-    table.write("\n")
-    table.write("EQ,0,1,2,3,4,5,6,7,8,9,10,11,12,13,14")
-
-    #which Board
-    while True:
-        print("Which BUS address is assigned to the phyCAM-M interface?")
-        which_bus = input()
-        try:
-            which_bus = int(which_bus)
-            i2ctemp = SMBus(which_bus, force=True)  # Create a new I2C bus
-            dev_id = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_I2C_DEV_ID)
-            # bit 0 id dev_id indicates if id is overwritten by register,
-            # alternative id strappings or set by register not supported
-            if which_bus >= 0 and (dev_id >> 1) == I2C_ADDRESS_DS90UB954:
-                print("\tBUS-check: OK")
-                i2ctemp.close()
-                print("Which Port is the phyCAM-L interface connected to (enter for default)?")
-                which_port = input()
-                match which_port:
-                    case "":
-                        which_port = 0
-                        print("\tTesting on default port 0")
-                        break
-                    case "0" | "1":
-                        print(f"\tTesting on port {which_port}")
-                        which_port = int(which_port)
-                        break
-                    case _:
-                        print("\tIncorrect Port input, please try again!")
+    args = parse_arguments(argv)
+    resumed = None
+    try:
+        given = given_parameters(args)
+        journal = CellLog(given.pop("log", None) or
+                          log_path(given.get("output", RESULT_FILE)))
+        if args.resume:
+            # same targets, result file and parameters as the logged run
+            resumed = journal.load()
+            # the cells of a rescanned result are in the log already
+            given = {"bus": resumed["bus"], "port": resumed["port"],
+                     "output": resumed["output"], "no_prompt": 1,
+                     "history": resumed.get("history"),
+                     "cable": resumed.get("cable", "")}
+    except (OSError, KeyError, ValueError, configparser.Error) as error:
+        print("Invalid parameter:", error)
+        return 2
+    output = given.pop("output", RESULT_FILE)
+    history_path = given.pop("history", None)
+    cable = given.pop("cable", "")
+    rescan = given.pop("rescan", None)
+    rescan_ring = given.pop("rescan_ring", 1)
+    metrics_path = given.pop("metrics", None)
+    trace_path = given.pop("record", None)
+    time_budget = given.pop("time_budget", None)
+    if i2c_factory is None:
+        i2c_factory = I2C
+        if args.simulate:
+            # pylint: disable=import-outside-toplevel
+            from phycam.simulator import Simulation
+            i2c_factory = Simulation(seed=args.simulate_seed).i2c
+        elif args.replay:
+            # pylint: disable=import-outside-toplevel
+            from phycam.trace import TraceReplay
+            try:
+                i2c_factory = TraceReplay(args.replay, args.replay_timing).i2c
+            except (OSError, ValueError) as error:
+                print("Invalid trace:", error)
+                return 2
+    metrics = None
+    if metrics_path:
+        metrics = Metrics()
+        i2c_factory = metered(i2c_factory, metrics)
+    prompt = not given.pop("no_prompt", 0)
+    if not prompt:
+        if "bus" not in given:
+            print("Invalid parameter: the bus is needed without prompts")
+            return 2
+        given.setdefault("port", "")
+
+    recorder = None
+    if trace_path:
+        # pylint: disable=import-outside-toplevel
+        from phycam.trace import TraceRecorder
+        recorder = TraceRecorder(trace_path, {
+            "argv": sys.argv[1:] if argv is None else list(argv),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())})
+        i2c_factory = recorder.recording(i2c_factory)
+
+    try:
+        date = time.strftime("%d.%m.%Y\ntime: %H:%M:%S\n", time.localtime())
+
+        #MARGIN ANALYSIS Testversuch
+        print("\n###########################################################")
+        print("##################### MARGIN ANALYSIS #####################")
+        print("###########################################################")
+        print(f"date: {date}")
+
+        #which Board
+        targets = None
+        while True:
+            if "bus" in given:
+                which_bus = given["bus"]
             else:
-                print("\tIncorrect BUS address input, please try again!")
-                i2ctemp.close()
-        except ValueError:
-            print("\tIncorrect input, please insert an integer value!")
-        except FileNotFoundError:
-            print("\tBus does not exist, please try again!")
-    i2ctemp.close()
-    print()
-
-    i2c = I2C(which_bus)
-    #i2c.detect()
-
-    #do a final digital reset including registers if selected
-    digital_reset = MarginRequest("Do you want to do a final " +
-                                  "digital reset including registers " +
-                                  "before starting the test?")
-    digital_reset.yes_no()
-    if digital_reset.output() == 1:
-        i2c.write(I2C_ADDRESS_DS90UB954, REG_RESET, 0x02)
-    else:
-        print("\rNo final digital reset!")
-    print()
-
-    #set RX_PORT_CTL register
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_RX_PORT_CTL, RX_PORT_CTL_RESERVED
-                                                    | RX_PORT_CTL_PORT0_EN
-                                                    | RX_PORT_CTL_PORT1_EN
-                                                    | which_port << RX_PORT_CTL_LOCK_SEL_SHIFT)
-    #Port 0 and Port1 Receiver enabled, Port x Receiver Lock
-    time.sleep(0.1)
-    #set Read/Write Enable for RX port x registers in FPD3_PORT_SEL register
-    rx_write_port = 0x01 << which_port
-    rx_read_port = which_port << FPD3_PORT_SEL_RX_READ_PORT_SHIFT
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_FPD3_PORT_SEL, rx_write_port | rx_read_port)
-    time.sleep(0.1)
-
-    # prepare indirect register access
-    # choose FPD-Link III RX Port x Reserved Registers: Test and Debug registers
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_IND_ACC_CTL, 0x01 << (2 + which_port))
-    time.sleep(0.1)
-    # choose STROBE_SET (@offset 8)
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_IND_ACC_ADDR, IND_REG_OFF_STROBE_SET)
-    time.sleep(0.1)
-    # values will be written to REG_IND_ACC_DATA later in the test loops!
-
-    # configure AEQ_CTL register: Disable SFILTER adaption with AEQ
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_AEQ_CTL1, 0x70)
-    #AEQ Error Control: [6] FPD-Link III clock errors,
-    #                   [5] Packet encoding errors, [4] Parity errors
-    time.sleep(0.1)
-    # set AEQ Bypass register: bypass AEQ, STAGE1=0, STAGE2=0, Lock Mode = 1
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_ADAPTIVE_EQ_BYPASS, 0x01)	#1: Disable adaptive EQ
-    time.sleep(0.1)
-    # set Parity Error Threshold Hi Register
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_PAR_ERR_THOLD_HI, 0x00)
-    time.sleep(0.1)
-    # set Parity Error Threshold Lo Register
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_PAR_ERR_THOLD_LO, 0x01)
-    time.sleep(0.1)
-    # Enable Encoder CRC error capability
-    i2ctemp = SMBus(which_bus, force=True)
-    enc_crc = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_FPD3_CAP)
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_FPD3_CAP, (enc_crc | 0x10))
-    i2ctemp.close()
-    #1: Enable CRC error flag from FPD-Link III encoder
-
-    # Enable Encoder CRC
-    i2ctemp = SMBus(which_bus, force=True)
-    enc_crc = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_FPD3_ENC_CTL)
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_FPD3_ENC_CTL, (enc_crc & 0x7F))
-    i2ctemp.close()
-
-    lock_result = [] #initialize lock_result
+                print("Which BUS address is assigned to the phyCAM-M interface?")
+                print("Enter several BUS[:ADDRESS[:PORT]] targets separated by " +
+                      "spaces to test them concurrently.")
+                which_bus = input()
+            if ":" in which_bus or len(which_bus.split()) > 1:
+                targets = select_targets(which_bus, i2c_factory)
+                if targets is not None:
+                    break
+            else:
+                i2c = open_bus(which_bus, i2c_factory)
+                if i2c is not None:
+                    ports = select_ports(given.get("port"))
+                    while ports is None and "port" not in given:
+                        ports = select_ports()
+                    if ports is not None:
+                        break
+                    i2c.close()
+            # a wrong argument is not asked for again
+            if "bus" in given or "port" in given:
+                return 1
+        print()
 
-    status_color = MarginRequest("Do you want a colored map?")
-    status_color.yes_no()
-    print()
-
-    # delay before lock is checked,
-    # use minimum of 0.5 when doing digital reset
-    #standard 0.9 seconds
-    dwell_time = MarginInput("the", "dwell time", 0.9)
-    dwell_time.float_input(500, 60000)
-
-    lock_run = MarginInput("number of", "lock runs", 10)
-    lock_run.int_input()
-
-    #standard 0.1 seconds
-    lock_time = MarginInput("a", "lock time", 0.1)
-    lock_time.float_input(100, 1500)
-
-    print("current dwell time: ", dwell_time.output(), "s")
-    print("current lock runs:   ", lock_run.output(), " times")
-    print("current lock time:  ", lock_time.output(), "s")
-    print()
-
-    strobe_position = MarginPosition("Strobe Position")
-    strobe_position.yes_no()
-    if strobe_position.output() == 1:
-        strobe_position.begin_end(0, 14)
-    print("current Strobe Position Begin: ", strobe_position.begin())
-    print("current Strobe Position End:   ", strobe_position.end(), "\n")
-
-    eq_position = MarginPosition("EQ Position")
-    eq_position.yes_no()
-    if eq_position.output() == 1:
-        eq_position.begin_end(0, 14)
-    print("current EQ Position Begin: ", eq_position.begin())
-    print("current EQ Position End:   ", eq_position.end(), "\n")
-
-    clock_base_delay = MarginRequest("Do you want a clock base delay?")
-    clock_base_delay.yes_no()
-    print()
-
-    data_base_delay = MarginRequest("Do you want a data base delay?")
-    data_base_delay.yes_no()
-    print()
-
-    #print("strobe: ", strobe_position.end() + 1 - strobe_position.begin())
-    #print ("eq:     ", eq_position.end() + 1 - eq_position.begin())
-    take_seconds = ((strobe_position.end() + 1 - strobe_position.begin()) *
-                    (eq_position.end() + 1 - eq_position.begin()) *
-                    (lock_run.output() * 3 * lock_time.output() +
-                     dwell_time.output()))
+        if resumed is not None:
+            params = load_parameters(resumed["parameters"])
+            print("Resuming the scan,", sum(len(cells) for cells in
+                                            journal.cells.values()),
+                  "areas are already measured")
+        else:
+            params = ask_parameters(None if targets else ports, given, prompt)
+            if time_budget is not None:
+                params = budget_parameters(
+                    params, time_budget, journal.path,
+                    max(len(ports) for _, _, ports in targets or
+                        [(0, 0, ports)]))
+                if params is None:
+                    return 2
+
+        previous = {}
+        if rescan is not None:
+            try:
+                previous = previous_cells(
+                    rescan or output, targets or
+                    [(i2c.i2c, I2C_ADDRESS_DS90UB954, ports)],
+                    targets is None, rescan_ring)
+            except (OSError, ValueError) as error:
+                print("Invalid previous result:", error)
+                return 2
+            plan = scan_plan(params)
+            print("Rescanning", sum((step.eq, step.strobe) not in cells
+                                    for cells, _ in previous.values()
+                                    for step in plan),
+                  "areas of the previous result")
+        history = None
+        if history_path:
+            history = RunHistory(history_path, cable)
+        try:
+            with journal:
+                if resumed is None:
+                    journal.start({"bus": which_bus, "output": output,
+                                   "port": "" if targets else "both"
+                                           if len(ports) > 1 else str(ports[0]),
+                                   "history": history_path, "cable": cable,
+                                   "parameters": vars(params)})
+                for (bus, addr, port), (cells, path) in previous.items():
+                    journal.preset(bus, addr, port, cells, path)
+                if targets is not None:
+                    print_remaining_time(params)
+                    run_targets(targets, params, date, output, i2c_factory,
+                                journal, history, metrics)
+                else:
+                    run_single(i2c, ports, params, date, output, journal,
+                               history)
+        except KeyboardInterrupt:
+            print("\n\nInterrupted, continue the scan with --resume")
+            return 130
+        finally:
+            if history is not None:
+                history.close()
+            if metrics is not None:
+                metrics.write(metrics_path,
+                              os.path.splitext(metrics_path)[0] + ".json")
+        return 0
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
+def run_single(i2c, ports, params, date, output, journal, history):  # pylint: disable=too-many-arguments
+    """margin analysis of the ports of a single deserializer"""
+    #lock result file, one per port when testing both ports
+    if len(ports) == 1:
+        tables = [open_table(output, date)]
+    else:
+        tables = [open_table(result_path(output, f"port{port}"), date)
+                  for port in ports]
+
+    # keep one bus session open for the whole test
+    with i2c:
+        run_analysis(i2c, ports, tables, params, journal, history)
+
+    print(f"I2C transactions: {i2c.transactions()} "
+          f"(reads: {i2c.reads}, writes: {i2c.writes}, retries: {i2c.retries}), "
+          f"bus opened {i2c.opens} time(s)")
+    print(f"I2C shadow: {i2c.cached_reads} reads cached, "
+          f"{i2c.skipped_writes} writes skipped\n")
+    with timed(i2c.metrics, "phase_seconds", phase="file"):
+        for table in tables:
+            table.close()
+
+
+def budget_parameters(params, budget, log, ports=1):
+    """parameters chosen for a time budget, printed, or None if none fit"""
+    model = CostModel.calibrate([log])
+    chosen = choose_parameters(params, budget, model, ports,
+                               POLL_INTERVAL if params.poll_lock else 0.5)
+    if chosen is None:
+        print("Invalid parameter: the time budget of", budget,
+              "s is too short for the smallest scan window")
+        return None
+    print(f"TIME BUDGET: {budget:g} s, the scan takes at most "
+          f"{model.scan_seconds(chosen, ports):.0f} s")
+    if chosen.parity_window:
+        sampling = f"parity window {chosen.parity_window:g} s"
+    else:
+        sampling = (f"{chosen.lock_runs} lock runs of "
+                    f"{chosen.lock_time:g} s")
+    print(f"EQ {chosen.eq_begin}..{chosen.eq_end}, "
+          f"strobe {chosen.strobe_begin}..{chosen.strobe_end}, "
+          f"{sampling}, dwell time {chosen.dwell_time:g} s")
+    print(f"I2C overhead of {model.areas} logged areas: "
+          f"{model.cell_overhead * 1000:.1f} ms per area, "
+          f"{model.sample_overhead * 1000:.1f} ms per status sample\n")
+    return chosen
+
+
+def print_remaining_time(params):
+    """print the estimated duration of the test"""
+    #print("strobe: ", params.strobe_end + 1 - params.strobe_begin)
+    #print ("eq:     ", params.eq_end + 1 - params.eq_begin)
+    take_seconds = params.take_seconds()
     print("\nREMAINING TIME: The test will take about",
-          round(int(take_seconds) / 60), "minute(s)\n\n")
+          round(int(take_seconds) / 60), "minute(s)")
+    if params.decide_after():
+        print("at most, clearly (un)locked cells are sampled",
+              params.decide_after(), "times only")
+    if params.trace == 1:
+        print("at most, the boundary trace skips the inner and outer areas")
+    print("\n")
     #print("\nREMAINING TIME: The test will take about",
     #   round(float(take_seconds) / 60, 2), "minute(s)\n\n")
 
-    if ((strobe_position.begin() < 8) and (strobe_position.end() < 8)):
-        #cdly goes high to low, so begin with high
-        cdly_high = 7 - strobe_position.begin()
-        cdly_low = 8 - strobe_position.end() - 1
-        ddly_low = 1
-        ddly_high = 0
-    if ((strobe_position.begin() >= 8) and (strobe_position.end() >= 8)):
-        ddly_low = strobe_position.begin() - 7
-        ddly_high = strobe_position.end() - 8 + 1
-        cdly_high = 0
-        cdly_low = 1
-    if strobe_position.begin() < 8 <= strobe_position.end():
-        cdly_high = 7 - strobe_position.begin()
-        cdly_low = 1
-        ddly_low = 0
-        ddly_high = strobe_position.end() - 7
-    if clock_base_delay.output():
-        cdly_low += 8
-        cdly_high += 8
-    if data_base_delay.output():
-        ddly_low += 8
-        ddly_high += 8
-    if ((eq_position.begin() < 8) and (eq_position.end() < 8)):
-        eq1_low = eq_position.begin()
-        eq1_high = eq_position.end()
-        eq2_low = 0
-        eq2_high = -1
-    if ((eq_position.begin() >= 8) and (eq_position.end() >= 8)):
-        eq2_low = eq_position.begin() - 7
-        eq2_high = eq_position.end() - 7
-        eq1_low = 0
-        eq1_high = -1
-    if eq_position.begin() < 8 <= eq_position.end():
-        eq1_low = eq_position.begin()
-        eq1_high = 7
-        eq2_low = 1
-        eq2_high = eq_position.end() - 7
-
-    print("\n################## MARGIN ANALYSIS STATUS #################")
-    print(" EQ\\SP  0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 ")
-    if eq_position.begin() != 0:
-        for i in range(0, eq_position.begin()):
-            if i < 10:
-                print("\n   ", i, end="  ")
-                out_string = ("\n " + str(i) + ",0.0,0.0,0.0,0.0,0.0,0.0,0.0,"+
-                              "0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,")
-            else:
-                print("\n  ", i, end="  ")
-                out_string = ("\n" + str(i) + ",0.0,0.0,0.0,0.0,0.0,0.0,0.0,"+
-                              "0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,")
-            table.write(out_string)
-
-    eq_sel2 = 0
-    #eq_sel1 is needed from 0 to 7
-    #8 Durchlaeufe:  0xD4 = 1, 33, 65, 97, 129, 161, 193, 225
-    for eq_sel1 in range(eq1_low, eq1_high+1, 1):
-        a_array = []
-        i2c.write(I2C_ADDRESS_DS90UB954, REG_ADAPTIVE_EQ_BYPASS, ((eq_sel1<<5)+(eq_sel2<<1)+0x01))
-            #eq_sel1 Bitweise um 5 Stellen nach links verschieben
-            #z.B 2=(10) --> (100 0000) = 64
-
-        if data_base_delay.output():
-            ddly_ctrl = 8
-        else:
-            ddly_ctrl = 0
-        table.write("\n")
-        print("\n   ", eq_sel1, end="  ")
-        out_string = " " + str(eq_sel1) + ","
-        table.write(out_string)
-
-        if strobe_position.begin() != 0:
-            for i in range(0, strobe_position.begin()):
-                print("  ", end=" ")
-                out_string = str(0.0) + ","
-                table.write(out_string)
-
-        #ddly_ctrl = 8 #(disable 6 extra delay)
-        #7 Durchlaeufe:  0xB2 = 143, 142, 141, 140, 139, 138, 137    8x7=56
-        for cdly_ctrl in range(cdly_high, cdly_low-1, -1):
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_IND_ACC_DATA, ((ddly_ctrl<<4) + cdly_ctrl))
-            # reset digital block except registers
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_RESET, 0x01)
-            time.sleep(dwell_time.output())
-            i2ctemp = SMBus(which_bus, force=True)
-            port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-            # print(f"Reading status from port {port_status1:08b}") # debug if we read the correct port
-            port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-            lock_sum = 0
-            for i in range(0, lock_run.output(), 1):
-                port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-                time.sleep(lock_time.output())
-                port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-                time.sleep(lock_time.output())
-                if (((port_status1 & 0x3C) == 0) and
-                        ((port_status2 & 0x20) == 0)):
-                    lock_sum += int(port_status1 & 0x01)
-                else:
-                    i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PAR_ERR_LO)
-                    #clear parity error
-                time.sleep(lock_time.output())
-            i2ctemp.close()
-            lock_avg = round(float(lock_sum) / lock_run.output(), 2)
-            lock_str = f"{lock_avg:.1f}"
-            eq_wert = float(lock_sum/lock_run.output())
-            a_array.append(float(eq_wert))
-            #print((ddly_ctrl<<4) + cdly_ctrl, ddly_ctrl, cdly_ctrl, end=" ")
-            status_color.color_output(status_color.output(), eq_wert)
-            out_string = lock_str + ","
-            table.write(out_string)
-        #print("2.cbd_out:", clock_base_delay.output(), end=" ")
-        if clock_base_delay.output():
-            cdly_ctrl = 8
-        else:
-            cdly_ctrl = 0
-
-        #cdly_ctrl = 8 #(disable 6 extra delay)
-        #8 Durchlaeufe:  0xB2 = 136,152,168,184,200,216,232,2488x8=64
-        for ddly_ctrl in range(ddly_low, ddly_high+1, 1):
-            # write reg_8
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_IND_ACC_DATA, ((ddly_ctrl<<4) + cdly_ctrl))
-            # reset digital block except registers
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_RESET, 0x01)
-            time.sleep(dwell_time.output())
-            i2ctemp = SMBus(which_bus, force=True)
-            port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-            port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-            lock_sum = 0
-            for i in range(0, lock_run.output(), 1):
-                port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-                time.sleep(lock_time.output())
-                port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-                time.sleep(lock_time.output())
-                if (((port_status1 & 0x3C) == 0) and
-                        ((port_status2 & 0x20) == 0)):
-                    lock_sum += int(port_status1 & 0x01)
-                else:
-                    i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PAR_ERR_LO)
-                    #clear parity error
-                time.sleep(lock_time.output())
-            i2ctemp.close()
-            lock_avg = round(float(lock_sum) / lock_run.output(), 2)
-            lock_str = f"{lock_avg:.1f}"
-            eq_wert = float(lock_sum/lock_run.output())
-            a_array.append(float(eq_wert))
-            status_color.color_output(status_color.output(), eq_wert)
-            out_string = lock_str + ","
-            table.write(out_string)
-
-        if strobe_position.end() != 14:
-            for i in range(strobe_position.end(), 14):
-                out_string = "0.0,"
-                table.write(out_string)
-        lock_result.append(a_array)
-
-    ###########################################################################
-
-    eq_sel1 = 7
-    #eq_sel2 is needed only from 1 to 7
-    #7 Durchlaeufe:  0xD4 = 227, 229, 231, 233, 235, 237, 239
-    for eq_sel2 in range(eq2_low, eq2_high+1, 1):
-        a_array = []
-        i2c.write(I2C_ADDRESS_DS90UB954, REG_ADAPTIVE_EQ_BYPASS, ((eq_sel1<<5)+(eq_sel2<<1)+0x01))
-        if data_base_delay.output():
-            ddly_ctrl = 8
-        else:
-            ddly_ctrl = 0
-        table.write("\n")
-        if (eq_sel1 + eq_sel2) >= 10:
-            print("\n  ", eq_sel1 + eq_sel2, end="  ")  #7x eq_sel2
-            out_string = str(eq_sel1 + eq_sel2) + ","
-        else:
-            print("\n   ", eq_sel1 + eq_sel2, end="  ")
-            out_string = " " + str(eq_sel1 + eq_sel2) + ","
-        table.write(out_string)
-        if strobe_position.begin() != 0:
-            for i in range(0, strobe_position.begin()):
-                print("  ", end=" ")
-                out_string = str(0.0) + ","
-                table.write(out_string)
-        #ddly_ctrl = 8 #(disable 6 extra delay)
-        #7 Durchlaeufe:  0xB2 = 143, 142, 141, 140, 139, 138, 137    7x7=49
-        for cdly_ctrl in range(cdly_high, cdly_low-1, -1):
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_IND_ACC_DATA, ((ddly_ctrl<<4) + cdly_ctrl))
-            # reset digital block except registers
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_RESET, 0x01)
-            time.sleep(dwell_time.output())
-            i2ctemp = SMBus(which_bus, force=True)
-            port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-            port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-            lock_sum = 0
-            for i in range(0, lock_run.output(), 1):
-                port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-                time.sleep(lock_time.output())
-                port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-                time.sleep(lock_time.output())
-                if (((port_status1 & 0x3C) == 0) and
-                        ((port_status2 & 0x20) == 0)):
-                    lock_sum += int(port_status1 & 0x01)
-                else:
-                    i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PAR_ERR_LO)
-                    #clear parity error
-                time.sleep(lock_time.output())
-            i2ctemp.close()
-            lock_avg = round(float(lock_sum) / lock_run.output(), 2)
-            lock_str = f"{lock_avg:.1f}"
-            eq_wert = float(lock_sum/lock_run.output())
-            a_array.append(float(eq_wert))
-            status_color.color_output(status_color.output(), eq_wert)
-            out_string = lock_str + ","
-            table.write(out_string)
-
-        if clock_base_delay.output():
-            cdly_ctrl = 8
-        else:
-            cdly_ctrl = 0
-
-        #cdly_ctrl = 8 #(disable 6 extra delay)
-        #8 Durchlaeufe:  0xB2 = 136,152,168,184,200,216,232,248      7x8=64
-        for ddly_ctrl in range(ddly_low, ddly_high+1, 1):
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_IND_ACC_DATA, ((ddly_ctrl<<4) + cdly_ctrl))
-            # reset digital block except registers
-            i2c.write(I2C_ADDRESS_DS90UB954, REG_RESET, 0x01)
-            time.sleep(dwell_time.output())
-            i2ctemp = SMBus(which_bus, force=True)
-            port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-            port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-            lock_sum = 0
-            for i in range(0, lock_run.output(), 1):
-                port_status1 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-                time.sleep(lock_time.output())
-                port_status2 = i2ctemp.read_byte_data(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS2)
-                time.sleep(lock_time.output())
-                if (((port_status1 & 0x3C) == 0) and
-                        ((port_status2 & 0x20) == 0)):
-                    lock_sum += int(port_status1 & 0x01)
-                else:
-                    i2c.read(I2C_ADDRESS_DS90UB954, REG_RX_PAR_ERR_LO)
-                    #clear parity error
-                time.sleep(lock_time.output())
-            i2ctemp.close()
-            lock_avg = round(float(lock_sum) / lock_run.output(), 2)
-            lock_str = f"{lock_avg:.1f}"
-            eq_wert = float(lock_sum/lock_run.output())
-            a_array.append(float(eq_wert))
-            status_color.color_output(status_color.output(), eq_wert)
-            out_string = lock_str + ","
-            table.write(out_string)
-        if strobe_position.end() != 14:
-            for i in range(strobe_position.end(), 14):
-                out_string = "0.0,"
-                table.write(out_string)
-        lock_result.append(a_array)
-
-    if eq_position.end() != 14:
-        for i in range(eq_position.end(), 14):
-            if i < 9:
-                print("\n   ", i+1, end="  ")
-                out_string = ("\n " + str(i+1) + ",0.0,0.0,0.0,0.0,0.0," +
-                              "0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,")
-            else:
-                print("\n  ", i+1, end="  ")
-                out_string = ("\n" + str(i+1) + ",0.0,0.0,0.0,0.0,0.0," +
-                              "0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,")
-            table.write(out_string)
-
-    print("\n\nLock result:")
-
-    # For printing the lock_result
-    c_eq = 0
-    r_eq = 0
-    eq_0 = 0
-
-    for i in range(eq_position.end()+1 - eq_position.begin()):
-        z_0 = 0
-        sp_0 = 0
-        for j in range(strobe_position.end()+1 - strobe_position.begin()):
-            #print(lock_result[i][j], end = " ")
-            if lock_result[i][j] == 1.0:
-                #print(lock_result[i][j], end = " ")
-                print("1.0", end=" ")
-                z_0 = z_0 + 1
-                if z_0 == 4:
-                    eq_0 = eq_0 + 1
-            elif (lock_result[i][j] >= 0 and lock_result[i][j] < 1):
-                if lock_result[i][j] > 0.9:
-                    print(round(((lock_result[i][j])-0.05), 1), end=" ")
-                    #round max 0.9
-                elif lock_result[i][j] > 0 and lock_result[i][j] < 0.05:
-                    print(round(((lock_result[i][j])+0.05), 1), end=" ")
-                    #round min 0.1
-                else:
-                    print(round(lock_result[i][j], 1), end=" ")
-                z_0 = 0
-            else:
-                print("Incorrect input!")
-                z_0 = 0
-
-            if (lock_result[i][j] == 1 and
-                    lock_result[i][j] == lock_result[i-1][j]):
-                sp_0 = sp_0 + 1
-                if sp_0 >= 4:
-                    c_eq = c_eq + 1
-            else:
-                sp_0 = 0
-        if eq_0 > 0:
-            r_eq = r_eq + 1
-            eq_0 = 0
-            z_0 = 0
 
-        print()
-    print()
+def run_analysis(i2c, ports, tables, params, journal=None, history=None):  # pylint: disable=too-many-arguments
+    """
+    Margin analysis on the connected deserializer, writes the result of
+    each port to its table and adds it to the run history. The cells are
+    logged to journal, the cells already in it are not measured again.
+    """
 
-    if 3 <= r_eq < 10:
-        print("EQ-Result is at least 3  --> here: ", r_eq)
-        #Gesamt-EQ ist mindestens 3  --> hier:
-        out_string = "\nsufficiant EQ lines:,true,\n"
+    table = tables[0]
+    snapshot = None
+    if params.restore == 1:
+        # the registers of before the test instead of the final reset
+        snapshot = snapshot_registers(i2c, ports)
+    run_steps(setup_steps(i2c, ports, params.digital_reset), i2c.clock)
 
-    elif r_eq >= 10:
-        print("EQ-Result is at least 3  --> here:", r_eq)
-        #Gesamt-EQ nicht ausreichend
-        out_string = "\nsufficiant EQ lines:,true,\n"
-    else:
-        print("EQ-Result is NOT sufficiant!\nFewer than three EQ Levels\n")
-        out_string = "\nsufficiant EQ lines:,false,\n"
-    table.write(out_string)
-
-    if 1 <= c_eq < 10:
-        print("4x2 rectangle available  --> here: ", c_eq)
-        #4x2 Rechteck vorhanden      --> hier:
-        out_string = "rectangle available:,true,\n"
-    elif c_eq >= 10:
-        print("4x2 rectangle available  --> here:", c_eq)
-        out_string = "rectangle available:,true,\n"
+    lock_result = [] #initialize lock_result
+    sample_result = [] #number of lock samples taken per cell
+    latency_result = [] #relock latency per cell if the lock is polled
+    error_result = [] #parity errors per second per cell in a parity window
+    inferred_result = [] #cells not measured by the boundary trace
+    results = [] #maps of each port when testing both ports
+
+    print_remaining_time(params)
+
+    eq_range = range(params.eq_begin, params.eq_end + 1)
+    sp_range = range(params.strobe_begin, params.strobe_end + 1)
+    hooks = journal_hooks(journal, i2c.i2c, I2C_ADDRESS_DS90UB954, ports)
+    renderer = MapRenderer(params, ports if len(ports) > 1 else (None,),
+                           i2c.clock)
+    if len(ports) > 1:
+        # all ports relock after the same reset and are sampled together
+        renderer.start("Scanning port 0 and port 1")
+        port_cells = run_steps(plan_steps(
+            i2c, scan_plan(params, params.order), params, ports,
+            progress=renderer.update, journal=hooks), i2c.clock)
+        # the maps are printed with the verdict of each port
+        renderer.finish(keep=False)
+        results = [split_cells(cells) for cells in port_cells]
+    elif params.trace == 1:
+        def measure(eq, strobe):
+            """measure one eye cell, the trace decides the order"""
+            print(".", end="", flush=True)
+            known, record = hooks or ([{}], None)
+            if (eq, strobe) in known[0]:
+                return tuple(known[0][(eq, strobe)])
+            step = ScanStep(eq, strobe, eq_register(eq),
+                            strobe_register(strobe, params.clock_base_delay,
+                                            params.data_base_delay))
+            start = i2c.clock.monotonic()
+            point = measure_point(i2c, eq, strobe, params)
+            if record:
+                record(step, point, i2c.clock.monotonic() - start)
+            return point[0]
+
+        print("Tracing the eye boundary", end="", flush=True)
+        measured, edges = trace_eye(measure, eq_range, sp_range)
+        (lock_result, sample_result, latency_result,
+         error_result, inferred_result) = split_cells(
+             infer_eye(measured, edges, eq_range, sp_range))
+        print("\n", len(measured), "of", len(eq_range) * len(sp_range),
+              "areas measured, the others are inferred")
+        print("\n################## MARGIN ANALYSIS STATUS #################")
+        print(" EQ\\SP  0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 ")
+        print_map(lock_result, inferred_result, params.eq_begin,
+                  params.strobe_begin, params.color)
+        write_lock_rows(table, lock_result,
+                        params.eq_begin, params.strobe_begin)
     else:
-        print("NO Contiguous Rectangle!")           #Kein Rechteck voranden
-        out_string = "rectangle available:,false,\n"
-    table.write(out_string)
-
-    print("\n###########################################################")
-    if status_color.output() == 1:
-        if (r_eq >= 3 and c_eq >= 1):
-            print("##########", Bcolors.OK +
-                  "RECOMMENDEND: Coax-cable is suitable!" +
-                  Bcolors.RESET, "##########")
-            #print("#######Coax-Leitung ist geeignet!#######")
-            out_string = "Coax-cable suitable:,TRUE,\n"
+        if params.order == "raster":
+            renderer.start()
         else:
-            print("######", Bcolors.FAIL +
-                  "NOT RECOMMENDEND: Coax-cable is NOT suitable!" +
-                  Bcolors.RESET, "######")
-            #print("##### Coax-Leitung ist UNGEEIGNET! #####")
-            out_string = "Coax-cable suitable:,FALSE,\n"
-    if status_color.output() == 0:
-        if (r_eq >= 3 and c_eq >= 1):
-            print("########## RECOMMENDEND: " +
-                  "Coax-cable is suitable! ##########")
-            out_string = "Coax-cable suitable:,TRUE,\n"
-        else:
-            print("###### NOT RECOMMENDEND: " +
-                  "Coax-cable is NOT suitable! ######")
-            out_string = "Coax-cable suitable:,FALSE,\n"
-    table.write(out_string)
-    print("###########################################################")
-
-    # write reg_8 default value
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_IND_ACC_DATA, 0x0)
-    time.sleep(0.1)
-
-    #do a final digital reset including registers
-    i2c.write(I2C_ADDRESS_DS90UB954, REG_RESET, 0x02)
-    time.sleep(0.1)
-
-    #readback RX_PORT_STS1 to clear Lock status changed on RX Port 0
-    i2c.read(I2C_ADDRESS_DS90UB954, REG_RX_PORT_STS1)
-    time.sleep(0.1)
+            renderer.start(f"Scanning in {params.order} order")
+        port_cells = run_steps(plan_steps(
+            i2c, scan_plan(params, params.order), params,
+            progress=renderer.update, journal=hooks), i2c.clock)
+        renderer.finish()
+        (lock_result, sample_result, latency_result,
+         error_result, inferred_result) = split_cells(port_cells[0])
+        if not (renderer.live or renderer.rows):
+            # the dots are followed by the whole map
+            print("\n\n################## MARGIN ANALYSIS STATUS #################")
+            print(" EQ\\SP  0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 ")
+            print_map(lock_result, inferred_result, params.eq_begin,
+                      params.strobe_begin, params.color)
+        write_lock_rows(table, lock_result,
+                        params.eq_begin, params.strobe_begin)
+
+    if len(ports) == 1:
+        results = [(lock_result, sample_result, latency_result,
+                    error_result, inferred_result)]
+    for port, table, result in zip(ports, tables, results):
+        (lock_result, sample_result, latency_result,
+         error_result, inferred_result) = result
+        if len(ports) > 1:
+            print(f"\n\n######################### PORT {port} #########################")
+            print(" EQ\\SP  0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 ")
+            print_map(lock_result, inferred_result, params.eq_begin,
+                      params.strobe_begin, params.color)
+            write_lock_rows(table, lock_result,
+                            params.eq_begin, params.strobe_begin)
+        print("\n\nLock result:")
+        with timed(i2c.metrics, "phase_seconds", phase="terminal"):
+            print_verdict(lock_result, params.color, table)
+
+    run_steps(teardown_steps(i2c, ports, snapshot=snapshot), i2c.clock)
     print("\n")
 
-    table.write("\nParameter\n")
-    if digital_reset.output() == 1:
-        out_string = "Digital Reset:,yes,\n"
-    else:
-        out_string = "Digital Reset:,no,\n"
-    table.write(out_string)
-    table.write("dwell time:," + str(dwell_time.output()) + ",s,\n")
-    table.write("lock runs:," + str(lock_run.output()) + ",times,\n")
-    table.write("lock time:," + str(lock_time.output()) + ",s,\n")
-    table.write("Strobe Position Begin:," +
-                str(strobe_position.begin_variable) + ",\n")
-    table.write("Strobe Position End:," +
-                str(strobe_position.end_variable) + ",\n")
-    table.write("EQ Position Begin:," +
-                str(eq_position.begin_variable) + ",\n")
-    table.write("EQ Position End:," + str(eq_position.end_variable) + ",\n")
-    if clock_base_delay.output() == 1:
-        out_string = "Clock Base Delay:,yes,\n"
-    else:
-        out_string = "Clock Base Delay:,no,\n"
-    table.write(out_string)
-    if data_base_delay.output() == 1:
-        out_string = "Data Base Delay:,yes,\n"
-    else:
-        out_string = "Data Base Delay:,no,\n"
-    table.write(out_string)
-    table.write("Remaining Time:," + str(take_seconds / 60) + ",minute(s),\n")
-
-    table.close()
+    for port, table, result in zip(ports, tables, results):
+        with timed(i2c.metrics, "phase_seconds", phase="file"):
+            write_parameters(table, port, params, result)
+        if history is not None:
+            history.add_result((i2c.i2c, I2C_ADDRESS_DS90UB954, port),
+                               params, result)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
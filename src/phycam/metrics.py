@@ -0,0 +1,159 @@
+""" phycam metrics
+Counters and latency histograms of a margin analysis run.
+
+The I2C sessions and the scan steps report to a Metrics instance if one
+is attached, otherwise the instrumentation is a single None check. At the
+end of a run the metrics are exported in the Prometheus text format and
+as a JSON summary.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+PREFIX = "phycam_"
+
+# name: type, help
+DESCRIPTIONS = {
+    "i2c_transactions_total": ("counter", "I2C transactions by operation "
+                               "and register"),
+    "i2c_retries_total": ("counter", "I2C transactions retried after an "
+                          "error"),
+    "i2c_latency_seconds": ("histogram", "I2C transaction latency"),
+    "i2c_skipped_writes_total": ("counter", "I2C writes of an unchanged "
+                                 "register skipped by the shadow cache"),
+    "cells_total": ("counter", "measured eye diagram areas"),
+    "parity_clears_total": ("counter", "parity error counter clears"),
+    "phase_seconds": ("histogram", "time of the phases of an area: dwell, "
+                      "sampling; terminal and file output of a run"),
+    "relock_latency_seconds": ("histogram", "relock latency of the polled "
+                               "areas"),
+}
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+           0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+class Histogram:
+    """bucket counts, sum, minimum and maximum of observed values"""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        """add a value"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def count(self):
+        """number of observed values"""
+        return sum(self.counts)
+
+
+def labels_text(labels):
+    """Prometheus label set of a sorted tuple of (name, value)"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """counters and histograms by name and labels, safe to use from threads"""
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """increase a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """add a value to a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """observe the wall time of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def prometheus(self):
+        """metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, (kind, text) in DESCRIPTIONS.items():
+            if kind == "counter":
+                series = sorted((labels, value) for (metric, labels), value
+                                in self.counters.items() if metric == name)
+            else:
+                series = sorted((labels, value) for (metric, labels), value
+                                in self.histograms.items() if metric == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in series:
+                if kind == "counter":
+                    lines.append(f"{PREFIX}{name}{labels_text(labels)} {value}")
+                    continue
+                total = 0
+                for bound, count in zip(value.buckets + ("+Inf",),
+                                        value.counts):
+                    total += count
+                    lines.append(f"{PREFIX}{name}_bucket"
+                                 f"{labels_text(labels + (('le', bound),))} "
+                                 f"{total}")
+                lines.append(f"{PREFIX}{name}_sum{labels_text(labels)} "
+                             f"{value.sum}")
+                lines.append(f"{PREFIX}{name}_count{labels_text(labels)} "
+                             f"{total}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """counters and histogram statistics by name and label set"""
+        histograms = {}
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            count = histogram.count()
+            histograms[name + labels_text(labels)] = {
+                "count": count, "sum": histogram.sum,
+                "mean": histogram.sum / count, "min": histogram.min,
+                "max": histogram.max}
+        return {"counters": {name + labels_text(labels): value
+                             for (name, labels), value
+                             in sorted(self.counters.items())},
+                "histograms": histograms}
+
+    def write(self, path, json_path):
+        """write the Prometheus text to path and the summary to json_path"""
+        with open(path, "w", encoding="utf-8") as prometheus_file:
+            prometheus_file.write(self.prometheus())
+        with open(json_path, "w", encoding="utf-8") as json_file:
+            json.dump(self.summary(), json_file, indent=2)
+            json_file.write("\n")
+
+
+def timed(metrics, name, **labels):
+    """timer of metrics, a no-op without metrics"""
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.timer(name, **labels)
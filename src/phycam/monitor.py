@@ -0,0 +1,289 @@
+""" phycam monitor
+Continuous margin drift monitor of an installed cable.
+
+The monitor rescans a small window of eye diagram areas around the
+operating point in rounds, e.g. during thermal or vibration soak tests.
+The margin of a round is the radius of the largest square around the
+operating point which locks completely. An alert is printed when the
+margin drops below a threshold and when it recovers.
+
+The rounds are kept in a ring buffer, the ones pushed out are merged
+into coarser levels of the history (minimum margin, mean lock ratio), so
+memory and CPU time per round stay the same over runs of several days.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import argparse
+import collections
+import copy
+import sys
+
+from phycam.deserializer import (eq_register, register_eq, register_strobe,
+                                 setup_steps, snapshot_registers,
+                                 strobe_register, teardown_steps)
+from phycam.i2c import I2C
+from phycam.registers import I2C_ADDRESS_DS90UB954, REG_RESET
+from phycam.scan import (MarginParameters, plan_steps, run_steps, scan_plan,
+                         write_point)
+from phycam.targets import check_target
+
+# a round or several merged ones: clock time of the first start and the
+# last end, number of rounds, minimum margin and mean lock ratio
+Round = collections.namedtuple("Round", "start end rounds margin ratio")
+
+HISTORY_SIZE = 360 # entries per level of the drift history
+HISTORY_FACTOR = 10 # entries of a level merged into one of the next
+HISTORY_LEVELS = 4
+
+
+def merge(rounds):
+    """one entry of a list of consecutive rounds"""
+    count = sum(entry.rounds for entry in rounds)
+    return Round(rounds[0].start, rounds[-1].end, count,
+                 min(entry.margin for entry in rounds),
+                 sum(entry.ratio * entry.rounds for entry in rounds) / count)
+
+
+class DriftHistory:
+    """rounds in a ring buffer with downsampled older levels
+
+    Level 0 holds the last size rounds. An entry pushed out of a level
+    waits until factor of them are merged into one entry of the next
+    level, the last level drops its oldest entries.
+    """
+    def __init__(self, size=HISTORY_SIZE, factor=HISTORY_FACTOR,
+                 levels=HISTORY_LEVELS):
+        self.size = size
+        self.factor = factor
+        self.levels = [collections.deque() for level in range(levels)]
+        self.pending = [[] for level in range(levels)]
+
+    def add(self, entry, level=0):
+        """add a round, or a merged entry to a level"""
+        ring = self.levels[level]
+        ring.append(entry)
+        if len(ring) <= self.size:
+            return
+        oldest = ring.popleft()
+        if level + 1 == len(self.levels):
+            return
+        pending = self.pending[level + 1]
+        pending.append(oldest)
+        if len(pending) == self.factor:
+            self.add(merge(pending), level + 1)
+            pending.clear()
+
+    def entries(self):
+        """all entries from the oldest to the newest"""
+        for ring, pending in zip(reversed(self.levels),
+                                 reversed(self.pending)):
+            yield from ring
+            yield from pending
+
+
+def window_margin(rows, radius):
+    """radius of the largest completely locked square around the center
+
+    rows is the lock ratio map of a window of 2 * radius + 1 areas, -1 if
+    the center does not lock completely.
+    """
+    for distance in range(radius + 1):
+        for i, row in enumerate(rows):
+            for j, ratio in enumerate(row):
+                if (max(abs(i - radius), abs(j - radius)) == distance and
+                        ratio < 1.0):
+                    return distance - 1
+    return radius
+
+
+def operating_point(eq_bypass, strobe_set):
+    """(eq, strobe), clock and data base delay of the port registers
+
+    With the adaptive EQ (no bypass) the EQ map row is unknown, the middle
+    row is taken.
+    """
+    strobe, clock_base_delay, data_base_delay = register_strobe(strobe_set)
+    eq = register_eq(eq_bypass) if eq_bypass & 0x01 else 7
+    return (eq, strobe), clock_base_delay, data_base_delay
+
+
+def clock_text(seconds):
+    """h:mm:ss of the monitor clock"""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class DriftMonitor:  # pylint: disable=too-many-instance-attributes
+    """rounds of scans of the window around the operating point
+
+    params holds the sampling parameters, center the (eq, strobe)
+    operating point. report is called with every printed line.
+    """
+    def __init__(self, i2c, params, center, radius=1, threshold=1,  # pylint: disable=too-many-arguments
+                 port=0, history=None, report=print):
+        self.i2c = i2c
+        self.params = copy.copy(params)
+        self.params.eq_begin = center[0] - radius
+        self.params.eq_end = center[0] + radius
+        self.params.strobe_begin = center[1] - radius
+        self.params.strobe_end = center[1] + radius
+        self.plan = scan_plan(self.params, "serpentine")
+        self.center = center
+        self.radius = radius
+        self.threshold = threshold
+        self.port = port
+        self.history = history or DriftHistory()
+        self.report = report
+        self.alerting = False
+        self.alerts = 0
+        self.start = None
+
+    def scan(self):
+        """scan the window once, returns its Round"""
+        start = self.i2c.clock.monotonic()
+        port_cells = run_steps(plan_steps(self.i2c, self.plan, self.params),
+                               self.i2c.clock)
+        rows = [[cell[0] for cell in row] for row in port_cells[0]]
+        # the link stays at the operating point until the next round
+        write_point(self.i2c, eq_register(self.center[0]),
+                    strobe_register(self.center[1],
+                                    self.params.clock_base_delay,
+                                    self.params.data_base_delay))
+        self.i2c.write(I2C_ADDRESS_DS90UB954, REG_RESET, 0x01)
+        return Round(start - self.start, self.i2c.clock.monotonic() -
+                     self.start, 1, window_margin(rows, self.radius),
+                     sum(map(sum, rows)) / len(self.plan))
+
+    def check(self, entry):
+        """report a round, alert on a margin below the threshold"""
+        self.report(f"{clock_text(entry.start)}  margin {entry.margin:2d}  "
+                    f"mean lock ratio {entry.ratio:.3f}")
+        if entry.margin < self.threshold and not self.alerting:
+            self.alerting = True
+            self.alerts += 1
+            self.report(f"ALERT: margin {entry.margin} below "
+                        f"{self.threshold} at {clock_text(entry.start)}")
+        elif entry.margin >= self.threshold and self.alerting:
+            self.alerting = False
+            self.report(f"margin recovered to {entry.margin} at "
+                        f"{clock_text(entry.start)}")
+
+    def run(self, interval, rounds=None, snapshot=None):
+        """scan a round every interval seconds, forever or rounds times
+
+        With params.restore the registers of snapshot are restored at the
+        end, it is taken now if not given.
+        """
+        clock = self.i2c.clock
+        self.start = clock.monotonic()
+        if self.params.restore != 1:
+            snapshot = None
+        elif snapshot is None:
+            snapshot = snapshot_registers(self.i2c, [self.port])
+        run_steps(setup_steps(self.i2c, [self.port],
+                              self.params.digital_reset), clock)
+        try:
+            done = 0
+            while rounds is None or done < rounds:
+                entry = self.scan()
+                self.history.add(entry)
+                self.check(entry)
+                done += 1
+                delay = self.start + entry.start + interval - clock.monotonic()
+                if delay > 0 and (rounds is None or done < rounds):
+                    clock.sleep(delay)
+        finally:
+            run_steps(teardown_steps(self.i2c, [self.port],
+                                     snapshot=snapshot), clock)
+
+
+def print_history(history):
+    """print the entries of a drift history"""
+    print("\n      start         end  rounds  margin  mean lock ratio")
+    for entry in history.entries():
+        print(f"{clock_text(entry.start):>11} {clock_text(entry.end):>11}  "
+              f"{entry.rounds:6d}  {entry.margin:6d}  {entry.ratio:15.3f}")
+
+
+def main(argv=None, i2c_factory=None):
+    """monitor command line"""
+    parser = argparse.ArgumentParser(
+        prog="python -m phycam.monitor",
+        description="monitor the margin drift of an installed cable by "
+        "rescanning the areas around its operating point")
+    parser.add_argument("-b", "--bus", type=int, required=True,
+                        help="I2C bus number")
+    parser.add_argument("-p", "--port", type=int, choices=(0, 1), default=0,
+                        help="FPD-Link III port")
+    parser.add_argument("--center", type=int, nargs=2,
+                        metavar=("EQ", "STROBE"),
+                        help="operating point, read from the EQ and strobe "
+                        "registers of the port by default")
+    parser.add_argument("--radius", type=int, default=1,
+                        help="areas scanned around the operating point")
+    parser.add_argument("--threshold", type=int, default=1,
+                        help="alert when the margin drops below it")
+    parser.add_argument("--interval", type=float, default=60.0,
+                        metavar="SECONDS", help="start of a round every "
+                        "SECONDS, or right after the previous one")
+    parser.add_argument("--rounds", type=int,
+                        help="stop after ROUNDS rounds instead of Ctrl+C")
+    parser.add_argument("--dwell-time", type=float, default=0.9,
+                        metavar="SECONDS")
+    parser.add_argument("--lock-runs", type=int, default=10)
+    parser.add_argument("--lock-time", type=float, default=0.1,
+                        metavar="SECONDS")
+    parser.add_argument("--poll-lock", action="store_true",
+                        help="poll for the lock, the dwell time is the "
+                        "timeout")
+    parser.add_argument("--restore", action="store_true",
+                        help="restore the registers of before the monitor "
+                        "instead of the final digital reset")
+    parser.add_argument("--simulate", action="store_true",
+                        help="monitor a simulated deserializer")
+    parser.add_argument("--simulate-seed", type=int,
+                        help="random seed of the simulation")
+    args = parser.parse_args(argv)
+
+    if i2c_factory is None:
+        i2c_factory = I2C
+        if args.simulate:
+            # pylint: disable=import-outside-toplevel
+            from phycam.simulator import Simulation
+            i2c_factory = Simulation(seed=args.simulate_seed).i2c
+    if not check_target(args.bus, I2C_ADDRESS_DS90UB954, i2c_factory):
+        return 1
+    params = MarginParameters()
+    params.dwell_time = args.dwell_time
+    params.lock_runs = args.lock_runs
+    params.lock_time = args.lock_time
+    params.poll_lock = int(args.poll_lock)
+    params.restore = int(args.restore)
+
+    with i2c_factory(args.bus) as i2c:
+        # before the setup changes the registers
+        snapshot = snapshot_registers(i2c, [args.port])
+        if args.center is None:
+            (center, params.clock_base_delay,
+             params.data_base_delay) = operating_point(*snapshot.ports[args.port])
+            print(f"Operating point EQ {center[0]} strobe {center[1]}")
+        else:
+            center = tuple(args.center)
+        if not all(args.radius <= value <= 14 - args.radius
+                   for value in center):
+            parser.error("the window around the center exceeds 0..14")
+        monitor = DriftMonitor(i2c, params, center, args.radius,
+                               args.threshold, args.port)
+        try:
+            monitor.run(args.interval, args.rounds, snapshot)
+        except KeyboardInterrupt:
+            print("\nMonitor stopped")
+    print_history(monitor.history)
+    print(f"\n{monitor.alerts} alert(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
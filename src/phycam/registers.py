@@ -0,0 +1,56 @@
+""" phycam registers
+Registers of the DS90UB954 deserializer used by the margin analysis.
+
+The addresses and bit fields are taken from the datasheet. The port
+specific and the volatile registers tell the I2C session which values it
+may keep in its shadow.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+I2C_ADDRESS_DS90UB954 = 0x3d #this is the default ID if id-pin is pulled high
+I2C_ADDRESS_DS90UB953 = 0x30
+
+REG_I2C_DEV_ID = 0x00
+REG_RESET = 0x01
+REG_DEVICE_STS = 0x04
+REG_PAR_ERR_THOLD_HI = 0x05
+REG_PAR_ERR_THOLD_LO = 0x06
+REG_RX_PORT_CTL = 0x0c
+REG_AEQ_CTL1 = 0x42
+REG_FPD3_CAP = 0x4a
+REG_FPD3_PORT_SEL = 0x4c
+REG_RX_PORT_STS1 = 0x4d
+REG_RX_PORT_STS2 = 0x4e
+REG_RX_PAR_ERR_HI = 0x55
+REG_RX_PAR_ERR_LO = 0x56
+REG_IND_ACC_CTL = 0xb0
+REG_IND_ACC_ADDR = 0xb1
+REG_IND_ACC_DATA = 0xb2
+REG_FPD3_ENC_CTL = 0xba
+REG_ADAPTIVE_EQ_BYPASS = 0xd4
+
+IND_REG_OFF_STROBE_SET = 0x08
+IND_ACC_CTL_READ = 1 << 0 # writing IND_ACC_ADDR strobes a read of IND_ACC_DATA
+IND_ACC_CTL_AUTO_INC = 1 << 1 # the address increments on every access
+
+RESET_REGISTERS = 1 << 1 # REG_RESET: digital reset including registers
+
+RX_PORT_CTL_RESERVED = 0x2 << 6 # bit 7:6 default to 0x2
+RX_PORT_CTL_PORT0_EN = 1 << 0
+RX_PORT_CTL_PORT1_EN = 1 << 1
+RX_PORT_CTL_LOCK_SEL_SHIFT = 2
+
+FPD3_PORT_SEL_RX_WRITE_BOTH = 0x03 # write to port 0 and port 1 registers
+FPD3_PORT_SEL_RX_READ_PORT_SHIFT = 4
+
+# port specific registers, FPD3_PORT_SEL selects the port
+PORT_REGISTERS = frozenset(range(0x4d, 0x80)) | frozenset(range(0xd0, 0xe0))
+# registers the deserializer changes by itself or which act on a write
+# only, the shadow cache always passes them to the hardware: the
+# self-clearing reset, the device status, the port status and error
+# counters and the line and CSI-2 status of a port
+VOLATILE_REGISTERS = (frozenset((REG_RESET, REG_DEVICE_STS)) |
+                      frozenset(range(REG_RX_PORT_STS1, 0x58)) |
+                      frozenset(range(0x73, 0x7c)))
@@ -0,0 +1,385 @@
+""" phycam render
+Maps and result files of the margin analysis.
+
+The maps are printed at once or drawn live by the MapRenderer while the
+scan runs. A result file holds the lock result as 15x15 map, the verdict,
+the parameter block and the additional maps of the run.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import math
+import os
+import sys
+import time
+from phycam.budget import CostModel
+from phycam.verdict import eye_verdict
+
+
+class Bcolors:  # pylint: disable=too-few-public-methods
+    """color for the characters"""
+    OK = '\033[32m' #GREEN
+    WARNING = '\033[33m' #YELLOW
+    FAIL = '\033[31m' #RED
+    RESET = '\033[0m' #RESET COLOR
+
+
+# map text of an area by color output and lock state, built once
+CELL_GLYPHS = {
+    (1, "locked"): Bcolors.OK + "▇▇" + Bcolors.RESET,
+    (1, "unlocked"): Bcolors.FAIL + "▇▇" + Bcolors.RESET,
+    (1, "partly"): Bcolors.WARNING + "▇▇" + Bcolors.RESET,
+    (1, "inferred locked"): Bcolors.OK + "##" + Bcolors.RESET,
+    (1, "inferred unlocked"): Bcolors.FAIL + "  " + Bcolors.RESET,
+    (0, "locked"): "██",
+    (0, "unlocked"): "--",
+    (0, "partly"): "▒▒", #7x lock status
+    (0, "inferred locked"): "##",
+    (0, "inferred unlocked"): "  ",
+}
+
+
+def cell_glyph(s_c_output, ratio, inferred=False):
+    """map text of an area, blank if it is not measured yet"""
+    if ratio is None:
+        return "  "
+    if inferred:
+        state = "inferred locked" if ratio == 1 else "inferred unlocked"
+    elif ratio == 1:
+        state = "locked"
+    elif ratio == 0:
+        state = "unlocked"
+    else:
+        state = "partly"
+    return CELL_GLYPHS[(s_c_output, state)]
+
+
+def print_verdict(lock_result, s_c_output, table):
+    """print the lock result and the verdict, write the verdict to table"""
+    # For printing the lock_result
+    for row in lock_result:
+        for value in row:
+            if value == 1.0:
+                print("1.0", end=" ")
+            elif 0 <= value < 1:
+                if value > 0.9:
+                    print(round(value - 0.05, 1), end=" ")
+                    #round max 0.9
+                elif 0 < value < 0.05:
+                    print(round(value + 0.05, 1), end=" ")
+                    #round min 0.1
+                else:
+                    print(round(value, 1), end=" ")
+            else:
+                print("Incorrect input!")
+        print()
+    print()
+
+    r_eq, c_eq, _ = eye_verdict(lock_result)
+
+    if 3 <= r_eq < 10:
+        print("EQ-Result is at least 3  --> here: ", r_eq)
+        #Gesamt-EQ ist mindestens 3  --> hier:
+        out_string = "\nsufficiant EQ lines:,true,\n"
+
+    elif r_eq >= 10:
+        print("EQ-Result is at least 3  --> here:", r_eq)
+        #Gesamt-EQ nicht ausreichend
+        out_string = "\nsufficiant EQ lines:,true,\n"
+    else:
+        print("EQ-Result is NOT sufficiant!\nFewer than three EQ Levels\n")
+        out_string = "\nsufficiant EQ lines:,false,\n"
+    table.write(out_string)
+
+    if 1 <= c_eq < 10:
+        print("4x2 rectangle available  --> here: ", c_eq)
+        #4x2 Rechteck vorhanden      --> hier:
+        out_string = "rectangle available:,true,\n"
+    elif c_eq >= 10:
+        print("4x2 rectangle available  --> here:", c_eq)
+        out_string = "rectangle available:,true,\n"
+    else:
+        print("NO Contiguous Rectangle!")           #Kein Rechteck voranden
+        out_string = "rectangle available:,false,\n"
+    table.write(out_string)
+
+    print("\n###########################################################")
+    if s_c_output == 1:
+        if (r_eq >= 3 and c_eq >= 1):
+            print("##########", Bcolors.OK +
+                  "RECOMMENDEND: Coax-cable is suitable!" +
+                  Bcolors.RESET, "##########")
+            #print("#######Coax-Leitung ist geeignet!#######")
+            out_string = "Coax-cable suitable:,TRUE,\n"
+        else:
+            print("######", Bcolors.FAIL +
+                  "NOT RECOMMENDEND: Coax-cable is NOT suitable!" +
+                  Bcolors.RESET, "######")
+            #print("##### Coax-Leitung ist UNGEEIGNET! #####")
+            out_string = "Coax-cable suitable:,FALSE,\n"
+    if s_c_output == 0:
+        if (r_eq >= 3 and c_eq >= 1):
+            print("########## RECOMMENDEND: " +
+                  "Coax-cable is suitable! ##########")
+            out_string = "Coax-cable suitable:,TRUE,\n"
+        else:
+            print("###### NOT RECOMMENDEND: " +
+                  "Coax-cable is NOT suitable! ######")
+            out_string = "Coax-cable suitable:,FALSE,\n"
+    table.write(out_string)
+    print("###########################################################")
+
+
+def open_table(path, date):
+    """create a lock result file and write its header"""
+    table = open(path, "w+", encoding="utf-8")
+    table.write(f"date: {date}")
+    table.write(",,,,,,,,LOCK-RESULT,,,,,,,,")
+    table.write("\n")
+    table.write(",,,,,,,,SP,,,,,,,,")
+    table.write("\n")
+    table.write("EQ,0,1,2,3,4,5,6,7,8,9,10,11,12,13,14")
+    return table
+
+
+def split_cells(rows):
+    """split rows of (ratio, samples, latency, errors, inferred) cells
+    into maps"""
+    return tuple([[cell[k] for cell in row] for row in rows] for k in range(5))
+
+
+def map_row(eq, row, inferred_row, sp_begin, s_c_output):
+    """text of a map row, the areas start at strobe sp_begin"""
+    return (f"   {eq:2d}  " + "   " * sp_begin +
+            "".join(cell_glyph(s_c_output, ratio, inferred) + " "
+                    for ratio, inferred in zip(row, inferred_row)))
+
+
+def print_map(lock_result, inferred_result, eq_begin, sp_begin, s_c_output):
+    """print a whole map at once, inferred areas are marked"""
+    lines = []
+    for eq in range(0, 15):
+        i = eq - eq_begin
+        if 0 <= i < len(lock_result):
+            lines.append(map_row(eq, lock_result[i], inferred_result[i],
+                                 sp_begin, s_c_output))
+        else:
+            lines.append(f"   {eq:2d}  ")
+    print("\n" + "\n".join(lines), end="")
+
+
+class MapRenderer:  # pylint: disable=too-many-instance-attributes
+    """live map of a scan with the remaining time
+
+    On a terminal the maps are kept in a buffer and every update redraws
+    the whole frame in a single write, the remaining time is estimated
+    from the measured time per area. Otherwise the output is append-only
+    for log files: the rows of a raster scan as they are finished, else a
+    dot per area.
+    """
+    def __init__(self, params, ports=(None,), clock=time, stream=None):
+        self.params = params
+        self.ports = ports
+        self.clock = clock
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty()
+        self.rows = params.order == "raster" and len(ports) == 1
+        self.maps = [[[None] * 15 for eq in range(15)] for port in ports]
+        self.total = ((params.eq_end + 1 - params.eq_begin) *
+                      (params.strobe_end + 1 - params.strobe_begin))
+        self.done = 0
+        self.measured = 0 # areas not taken from the cell log and their time
+        self.measure_time = 0.0
+        self.last = clock.monotonic()
+        self.lines = 0 # lines of the frame on the terminal
+
+    def remaining_seconds(self):
+        """estimated time of the areas left"""
+        if self.measured:
+            per_area = self.measure_time / self.measured
+        else:
+            per_area = CostModel().cell_seconds(self.params, len(self.ports))
+        return per_area * (self.total - self.done)
+
+    def frame(self):
+        """text of the whole frame"""
+        lines = []
+        for port, port_map in zip(self.ports, self.maps):
+            if port is None:
+                lines.append("################## MARGIN ANALYSIS STATUS "
+                             "#################")
+            else:
+                lines.append(f"######################### PORT {port} "
+                             "#########################")
+            lines.append(" EQ\\SP  0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 ")
+            lines += [map_row(eq, row, [0] * 15, 0, self.params.color)
+                      for eq, row in enumerate(port_map)]
+            lines.append("")
+        if self.done < self.total:
+            seconds = math.ceil(self.remaining_seconds())
+            lines.append(f"REMAINING TIME: about {seconds // 60}:"
+                         f"{seconds % 60:02d} min, "
+                         f"{self.done} of {self.total} areas done")
+        else:
+            lines.append(f"{self.total} areas done")
+        return "".join(line + "\033[K\n" for line in lines)
+
+    def draw(self, text):
+        """write text in place of the frame drawn before"""
+        if self.lines:
+            text = f"\033[{self.lines}F" + text
+        self.lines = text.count("\n")
+        self.stream.write(text)
+        self.stream.flush()
+
+    def start(self, title=""):
+        """begin the output of the scan"""
+        if self.live:
+            self.draw(self.frame())
+        elif self.rows:
+            print("\n################## MARGIN ANALYSIS STATUS #################",
+                  file=self.stream)
+            print(" EQ\\SP  0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 ",
+                  file=self.stream)
+            self.stream.write("".join(f"\n   {eq:2d}  "
+                                      for eq in range(self.params.eq_begin)))
+        else:
+            print(title, end="", flush=True, file=self.stream)
+
+    def update(self, step, point):
+        """add the measured point of a scan step, progress of plan_steps"""
+        now = self.clock.monotonic()
+        if now > self.last:
+            self.measured += 1
+            self.measure_time += now - self.last
+        self.last = now
+        self.done += 1
+        for port_map, cell in zip(self.maps, point):
+            port_map[step.eq][step.strobe] = cell[0]
+        if self.live:
+            self.draw(self.frame())
+        elif self.rows:
+            text = cell_glyph(self.params.color, point[0][0]) + " "
+            if step.strobe == self.params.strobe_begin:
+                text = (f"\n   {step.eq:2d}  " + "   " * step.strobe) + text
+            self.stream.write(text)
+            self.stream.flush()
+        else:
+            self.stream.write(".")
+            self.stream.flush()
+
+    def finish(self, keep=True):
+        """end the output of the scan, a live frame is cleared unless kept"""
+        if self.live:
+            if not keep:
+                self.draw("\033[J")
+        elif self.rows:
+            self.stream.write("".join(f"\n   {eq:2d}  " for eq in
+                                      range(self.params.eq_end + 1, 15)))
+
+
+def write_lock_rows(table, rows, eq_begin, sp_begin):
+    """write the lock result rows of a whole map at once
+
+    The ratios are written to four places, so a rescan tells the fractional
+    areas from the solid ones.
+    """
+    for eq in range(15):
+        line = f"\n{eq:2d},"
+        for strobe in range(15):
+            i = eq - eq_begin
+            j = strobe - sp_begin
+            if 0 <= i < len(rows) and 0 <= j < len(rows[i]):
+                line += f"{round(float(rows[i][j]), 4)},"
+            else:
+                line += "0.0,"
+        table.write(line)
+
+
+def write_map(table, title, rows, eq_begin, sp_begin, fmt="{}"):
+    """write a 15x15 map section in the layout of the lock result"""
+    table.write(f"\n,,,,,,,,{title},,,,,,,,\n")
+    table.write(",,,,,,,,SP,,,,,,,,\n")
+    table.write("EQ,0,1,2,3,4,5,6,7,8,9,10,11,12,13,14\n")
+    for eq in range(15):
+        line = f"{eq:2d},"
+        for strobe in range(15):
+            i = eq - eq_begin
+            j = strobe - sp_begin
+            if 0 <= i < len(rows) and 0 <= j < len(rows[i]):
+                line += fmt.format(rows[i][j]) + ","
+            else:
+                line += fmt.format(0) + ","
+        table.write(line + "\n")
+
+
+def result_path(output, suffix=""):
+    """result file name, the suffix is added in front of the extension"""
+    if not suffix:
+        return output
+    base, extension = os.path.splitext(output)
+    return f"{base}_{suffix}{extension}"
+
+
+def write_parameters(table, port, params, result):
+    """write the parameter block and the additional maps of a port"""
+    sample_result, latency_result, error_result, inferred_result = result[1:]
+    table.write("\nParameter\n")
+    table.write("Port:," + str(port) + ",\n")
+    if params.digital_reset == 1:
+        out_string = "Digital Reset:,yes,\n"
+    else:
+        out_string = "Digital Reset:,no,\n"
+    table.write(out_string)
+    table.write("dwell time:," + str(params.dwell_time) + ",s,\n")
+    if params.poll_lock == 1:
+        out_string = "Lock Polling:,yes,\n"
+    else:
+        out_string = "Lock Polling:,no,\n"
+    table.write(out_string)
+    table.write("lock runs:," + str(params.lock_runs) + ",times,\n")
+    table.write("lock time:," + str(params.lock_time) + ",s,\n")
+    table.write("Strobe Position Begin:," + str(params.strobe_begin) + ",\n")
+    table.write("Strobe Position End:," + str(params.strobe_end) + ",\n")
+    table.write("EQ Position Begin:," + str(params.eq_begin) + ",\n")
+    table.write("EQ Position End:," + str(params.eq_end) + ",\n")
+    if params.clock_base_delay == 1:
+        out_string = "Clock Base Delay:,yes,\n"
+    else:
+        out_string = "Clock Base Delay:,no,\n"
+    table.write(out_string)
+    if params.data_base_delay == 1:
+        out_string = "Data Base Delay:,yes,\n"
+    else:
+        out_string = "Data Base Delay:,no,\n"
+    table.write(out_string)
+    table.write("Remaining Time:," + str(params.take_seconds() / 60) +
+                ",minute(s),\n")
+    table.write("Early Stop Confidence:," + str(params.early_stop) + ",\n")
+    if params.trace == 1:
+        out_string = "Scan Strategy:,boundary trace,\n"
+    else:
+        out_string = "Scan Strategy:,raster,\n"
+    table.write(out_string)
+    table.write("Scan Order:," + params.order + ",\n")
+    table.write("Parity Window:," + str(params.parity_window) + ",s,\n")
+
+    write_map(table, "LOCK-SAMPLES", sample_result,
+              params.eq_begin, params.strobe_begin)
+    if params.trace == 1:
+        # 1: value inferred from the traced boundary, 0: measured
+        write_map(table, "INFERRED", inferred_result,
+                  params.eq_begin, params.strobe_begin)
+    if params.poll_lock == 1:
+        # relock latency in ms, "-" if the cell did not lock in time
+        latency_ms = [["-" if latency is None else str(round(latency * 1000))
+                       for latency in row] for row in latency_result]
+        write_map(table, "RELOCK-LATENCY", latency_ms,
+                  params.eq_begin, params.strobe_begin)
+    if params.parity_window:
+        # parity errors per second, "-" if the cell did not lock
+        error_rates = [["-" if rate is None else f"{rate:g}" for rate in row]
+                       for row in error_result]
+        write_map(table, "PARITY-ERROR-RATE", error_rates,
+                  params.eq_begin, params.strobe_begin)
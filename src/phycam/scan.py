@@ -0,0 +1,476 @@
+""" phycam scan
+Scan steps of the margin analysis.
+
+An eye cell is set, the receiver relocks after a digital reset and its
+lock status is sampled. The steps are generators which yield the time to
+wait, run_steps runs them blocking and the engine drives many of them at
+once. A scan measures the cells of a scan plan or traces the eye boundary.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import math
+import time
+from collections import namedtuple
+from phycam.budget import CostModel
+from phycam.deserializer import (eq_register, read_order, read_port,
+                                 read_status, select_port, setup_steps,
+                                 snapshot_registers, strobe_register,
+                                 teardown_steps)
+from phycam.metrics import timed
+from phycam.registers import (I2C_ADDRESS_DS90UB954, REG_ADAPTIVE_EQ_BYPASS,
+                              REG_IND_ACC_CTL, REG_IND_ACC_DATA, REG_RESET,
+                              REG_RX_PAR_ERR_LO)
+
+
+POLL_INTERVAL = 0.01 # port status poll interval while waiting for the lock
+POLL_STABLE = 5 # number of good polls in a row for a stable lock
+
+
+def early_stop_samples(confidence):
+    """number of identical lock samples needed to decide a cell
+
+    A run of n identical samples rules out a lock ratio between 0.5 and
+    the observed value with probability 1 - 0.5**n. 0 disables early stop.
+    """
+    if not 0 < confidence < 1:
+        return 0
+    return math.ceil(math.log(1 - confidence) / math.log(0.5))
+
+
+def port_locked(port_status1, port_status2):
+    """port is locked without any error flags set"""
+    return (((port_status1 & 0x3C) == 0) and
+            ((port_status2 & 0x20) == 0) and
+            (port_status1 & 0x01) == 1)
+
+
+def run_steps(steps, clock=time):
+    """run a step generator, sleeping the delays it yields on clock
+
+    Scan steps yield the time to wait before they continue, so a scheduler
+    may serve other deserializers meanwhile. Returns the generator result.
+    """
+    result = []
+
+    def delegate():
+        """yield the delays of steps and keep their result"""
+        value = yield from steps
+        result.append(value)
+
+    for delay in delegate():
+        clock.sleep(delay)
+    return result[0]
+
+
+def wait_for_lock_steps(i2c, timeout, ports=(None,),
+                        addr=I2C_ADDRESS_DS90UB954):
+    """poll the port status after a digital reset until the lock is stable
+
+    Returns the relock latency in seconds per port, that is the time until
+    the first of POLL_STABLE good polls in a row, or None if the port did
+    not lock stable within timeout.
+    """
+    start = i2c.clock.monotonic()
+    latencies = {}
+    good_polls = dict.fromkeys(ports, 0)
+    locked_since = {}
+    while True:
+        now = i2c.clock.monotonic() - start
+        for port in read_order(i2c, ports, addr):
+            if port in latencies:
+                continue
+            status = read_status(i2c, port, addr)
+            if port_locked(status.sts1, status.sts2):
+                if good_polls[port] == 0:
+                    locked_since[port] = now
+                good_polls[port] += 1
+                if good_polls[port] >= POLL_STABLE:
+                    latencies[port] = locked_since[port]
+            else:
+                if status.sts1 & 0x3C:
+                    read_port(i2c, port, REG_RX_PAR_ERR_LO, addr)
+                    #clear parity error
+                    if i2c.metrics is not None:
+                        i2c.metrics.inc("parity_clears_total")
+                good_polls[port] = 0
+        if len(latencies) == len(ports) or now >= timeout:
+            return [latencies.get(port) for port in ports]
+        yield POLL_INTERVAL
+
+
+def dwell_steps(i2c, dwell_time, poll=0, ports=(None,),
+                addr=I2C_ADDRESS_DS90UB954):
+    """wait for the receiver to relock after a digital reset
+
+    Waits the whole dwell time or polls for the lock with dwell_time as
+    timeout. Returns the relock latency per port, None if not polled.
+    """
+    if poll:
+        return (yield from wait_for_lock_steps(i2c, dwell_time, ports, addr))
+    yield dwell_time
+    return [None for port in ports]
+
+
+def measure_cell_steps(i2c, lock_runs, lock_time, decide_after=0,
+                       ports=(None,), addr=I2C_ADDRESS_DS90UB954):
+    """sample the lock status of the currently set eye cell
+
+    Returns the lock ratio and the number of samples taken per port. A
+    sample is a status snapshot of every port, taken every 3 lock times.
+    Sampling stops after decide_after samples if all of them are locked or
+    all unlocked.
+    """
+    lock_sum = dict.fromkeys(ports, 0)
+    samples = dict.fromkeys(ports, 0)
+    for port in read_order(i2c, ports, addr):
+        # clear the status flags latched while the receiver relocked
+        read_status(i2c, port, addr)
+    sampling = list(ports)
+    while sampling:
+        for port in read_order(i2c, sampling, addr):
+            status = read_status(i2c, port, addr)
+            if (((status.sts1 & 0x3C) == 0) and
+                    ((status.sts2 & 0x20) == 0)):
+                lock_sum[port] += int(status.sts1 & 0x01)
+            else:
+                read_port(i2c, port, REG_RX_PAR_ERR_LO, addr)
+                #clear parity error
+                if i2c.metrics is not None:
+                    i2c.metrics.inc("parity_clears_total")
+        yield 3 * lock_time
+        for port in list(sampling):
+            samples[port] += 1
+            if (samples[port] >= lock_runs or
+                    (0 < decide_after <= samples[port] and
+                     lock_sum[port] in (0, samples[port]))):
+                sampling.remove(port)
+    return [(float(lock_sum[port] / samples[port]), samples[port])
+            for port in ports]
+
+
+def parity_cell_steps(i2c, window, ports=(None,), addr=I2C_ADDRESS_DS90UB954):
+    """count the parity errors of the currently set eye cell
+
+    A status snapshot up to the parity error counter clears the counter
+    and the latched flags, a second one after window seconds covers the
+    whole window. Returns the lock ratio of the window (1.0 if the port
+    stayed locked without errors, else 0.0), the number of snapshots and
+    the parity errors per second per port, None if the port is unlocked
+    and counted no errors.
+    """
+    for port in read_order(i2c, ports, addr):
+        read_status(i2c, port, addr, parity=True)
+    yield window
+    cells = {}
+    for port in read_order(i2c, ports, addr):
+        status = read_status(i2c, port, addr, parity=True)
+        locked = port_locked(status.sts1, status.sts2)
+        rate = None
+        if status.parity_errors or status.sts1 & 0x01:
+            rate = status.parity_errors / window
+        cells[port] = (float(locked and not status.parity_errors), 1, rate)
+    return [cells[port] for port in ports]
+
+
+def write_point(i2c, eq_value, strobe_value, ports=(None,),
+                addr=I2C_ADDRESS_DS90UB954):
+    """write the EQ and strobe register values of an eye cell to ports
+
+    A value of None is not written.
+    """
+    if eq_value is not None:
+        select_port(i2c, ports[0], addr)
+        i2c.write(addr, REG_ADAPTIVE_EQ_BYPASS, eq_value)
+    if strobe_value is not None:
+        # the port of the indirect page selected already first, the page
+        # select is written once per cell then
+        page = i2c.cached(addr, REG_IND_ACC_CTL)
+        for port in sorted(ports, key=lambda port: (port is not None and
+                                                    0x01 << (2 + port) != page)):
+            if port is not None:
+                i2c.write(addr, REG_IND_ACC_CTL, 0x01 << (2 + port))
+            i2c.write(addr, REG_IND_ACC_DATA, strobe_value)
+
+
+def relock_steps(i2c, params, ports=(None,), addr=I2C_ADDRESS_DS90UB954):
+    """relock after a digital reset and measure the current eye cell
+
+    Returns (lock ratio, samples, relock latency, parity error rate) per
+    port, the error rate is None unless a parity window is set. All ports
+    relock after a single digital reset and are sampled at the same time.
+    """
+    # reset digital block except registers
+    start = i2c.clock.monotonic()
+    i2c.write(addr, REG_RESET, 0x01)
+    latencies = yield from dwell_steps(i2c, params.dwell_time,
+                                       params.poll_lock, ports, addr)
+    sampled = i2c.clock.monotonic()
+    if params.parity_window:
+        cells = yield from parity_cell_steps(i2c, params.parity_window,
+                                             ports, addr)
+    else:
+        cells = yield from measure_cell_steps(i2c, params.lock_runs,
+                                              params.lock_time,
+                                              params.decide_after(), ports,
+                                              addr)
+    if i2c.metrics is not None:
+        i2c.metrics.inc("cells_total", len(ports))
+        i2c.metrics.observe("phase_seconds", sampled - start, phase="dwell")
+        i2c.metrics.observe("phase_seconds", i2c.clock.monotonic() - sampled,
+                            phase="sampling")
+        for latency in latencies:
+            if latency is not None:
+                i2c.metrics.observe("relock_latency_seconds", latency)
+    return [cell[:2] + (latency, cell[2] if params.parity_window else None)
+            for cell, latency in zip(cells, latencies)]
+
+
+def measure_point_steps(i2c, eq, strobe, params, ports=(None,),
+                        addr=I2C_ADDRESS_DS90UB954):
+    """set an eye cell and measure it
+
+    Returns (lock ratio, samples, relock latency, parity error rate) per
+    port.
+    """
+    write_point(i2c, eq_register(eq),
+                strobe_register(strobe, params.clock_base_delay,
+                                params.data_base_delay), ports, addr)
+    return (yield from relock_steps(i2c, params, ports, addr))
+
+
+def dwell(i2c, *args, **kwargs):
+    """blocking dwell_steps"""
+    return run_steps(dwell_steps(i2c, *args, **kwargs), i2c.clock)
+
+
+def measure_cell(i2c, *args, **kwargs):
+    """blocking measure_cell_steps"""
+    return run_steps(measure_cell_steps(i2c, *args, **kwargs), i2c.clock)
+
+
+def measure_point(i2c, *args, **kwargs):
+    """blocking measure_point_steps"""
+    return run_steps(measure_point_steps(i2c, *args, **kwargs), i2c.clock)
+
+
+def plan_steps(i2c, plan, params, ports=(None,),  # pylint: disable=too-many-arguments
+               addr=I2C_ADDRESS_DS90UB954, progress=None, journal=None):
+    """measure the cells of a scan plan in its order
+
+    A register is only written if its value differs from the previous
+    step. progress is called with every step and its measured point.
+    journal is a tuple of the cells known per port, which are not measured
+    again, and a function recording every measured point.
+    Returns the cells of each port as rows of (lock ratio, samples,
+    relock latency, parity error rate, inferred) of the scan window.
+    """
+    if journal is None:
+        known, record = [{} for port in ports], None
+    else:
+        known, record = journal
+    port_cells = [[[None] * (params.strobe_end + 1 - params.strobe_begin)
+                   for eq in range(params.eq_begin, params.eq_end + 1)]
+                  for port in ports]
+    eq_value = None
+    strobe_value = None
+    for step in plan:
+        cell = (step.eq, step.strobe)
+        if all(cell in port_known for port_known in known):
+            point = [tuple(port_known[cell]) for port_known in known]
+        else:
+            write_point(i2c,
+                        step.eq_value if step.eq_value != eq_value else None,
+                        step.strobe_value if step.strobe_value != strobe_value
+                        else None, ports, addr)
+            eq_value = step.eq_value
+            strobe_value = step.strobe_value
+            start = i2c.clock.monotonic()
+            point = yield from relock_steps(i2c, params, ports, addr)
+            if record is not None:
+                record(step, point, i2c.clock.monotonic() - start)
+        for cells, cell in zip(port_cells, point):
+            cells[step.eq - params.eq_begin][
+                step.strobe - params.strobe_begin] = cell + (0,)
+        if progress:
+            with timed(i2c.metrics, "phase_seconds", phase="terminal"):
+                progress(step, point)
+    return port_cells
+
+
+def scan_steps(i2c, ports, params, addr=I2C_ADDRESS_DS90UB954, journal=None):
+    """whole scan of one deserializer, from setup to teardown"""
+    snapshot = None
+    if params.restore == 1:
+        snapshot = snapshot_registers(i2c, ports, addr)
+    yield from setup_steps(i2c, ports, params.digital_reset, addr)
+    port_cells = yield from plan_steps(
+        i2c, scan_plan(params, params.order), params,
+        ports if len(ports) > 1 else (None,), addr,
+        journal=journal_hooks(journal, i2c.i2c, addr, ports))
+    yield from teardown_steps(i2c, ports, addr, snapshot)
+    return port_cells
+
+
+def journal_hooks(journal, bus, addr, ports):
+    """known cells and record function of a target for plan_steps"""
+    if journal is None:
+        return None
+    return ([journal.known(bus, addr, port) for port in ports],
+            journal.recorder(bus, addr, ports))
+
+
+class MarginParameters:  # pylint: disable=too-many-instance-attributes
+    """parameters of a margin analysis run, defaults as in the prompts"""
+    def __init__(self):
+        self.digital_reset = 0
+        self.color = 0
+        self.poll_lock = 0
+        self.dwell_time = 0.9
+        self.lock_runs = 10
+        self.lock_time = 0.1
+        self.early_stop = 0
+        self.strobe_begin = 0
+        self.strobe_end = 14
+        self.eq_begin = 0
+        self.eq_end = 14
+        self.clock_base_delay = 0
+        self.data_base_delay = 0
+        self.trace = 0
+        self.order = "raster"
+        self.parity_window = 0.0
+        self.restore = 0
+
+    def decide_after(self):
+        """number of identical samples which end the sampling of a cell"""
+        return early_stop_samples(self.early_stop)
+
+    def take_seconds(self):
+        """estimated duration of a scan, at most"""
+        return CostModel().scan_seconds(self)
+
+
+ScanStep = namedtuple("ScanStep", "eq strobe eq_value strobe_value")
+SCAN_ORDERS = ("raster", "serpentine", "column", "column-serpentine")
+
+
+def scan_plan(params, order="raster"):
+    """compile the scan window into a list of ScanSteps in order
+
+    raster and serpentine go row by row and change the EQ register once
+    per row, serpentine reverses every other row, so the strobe register
+    moves a single step between cells. column and column-serpentine go
+    column by column and change the strobe register once per column.
+    """
+    eq_range = range(params.eq_begin, params.eq_end + 1)
+    sp_range = range(params.strobe_begin, params.strobe_end + 1)
+    if order in ("raster", "serpentine"):
+        lines = [[(eq, strobe) for strobe in sp_range] for eq in eq_range]
+    elif order in ("column", "column-serpentine"):
+        lines = [[(eq, strobe) for eq in eq_range] for strobe in sp_range]
+    else:
+        raise ValueError(f"unknown scan order {order}")
+    if order.endswith("serpentine"):
+        lines = [line[::-1] if index % 2 else line
+                 for index, line in enumerate(lines)]
+    return [ScanStep(eq, strobe, eq_register(eq),
+                     strobe_register(strobe, params.clock_base_delay,
+                                     params.data_base_delay))
+            for line in lines for eq, strobe in line]
+
+
+def trace_eye(measure, eq_range, sp_range):
+    """trace the pass/fail boundary of the eye row by row
+
+    measure(eq, strobe) is only called for the cells needed to locate the
+    boundary and returns the lock ratio as first item. Starting from the
+    locked cell next to the window centre, the locked interval of each row
+    is searched from the edges of the neighbouring row, followed by the
+    partly locked transition band outside of it. Then the band is followed
+    around the eye, above and below the traced rows and at the corners,
+    until it is enclosed by unlocked cells. Assumes one contiguous locked
+    interval per row.
+    Returns the measured cells and the locked interval of each traced row.
+    """
+    measured = {}
+
+    def ratio(eq, strobe):
+        if (eq, strobe) not in measured:
+            measured[(eq, strobe)] = measure(eq, strobe)
+        return measured[(eq, strobe)][0]
+
+    def edge(eq, guess, step):
+        """outermost locked column of the row in direction step"""
+        strobe = guess
+        if ratio(eq, strobe) == 1.0:
+            while strobe + step in sp_range and ratio(eq, strobe + step) == 1.0:
+                strobe += step
+        else:
+            # walk inwards, ends at the known locked column at the latest
+            while ratio(eq, strobe) < 1.0:
+                strobe -= step
+        band = strobe + step
+        while band in sp_range and ratio(eq, band) > 0.0:
+            band += step
+        return strobe
+
+    edges = {}
+    eq_mid = (eq_range[0] + eq_range[-1]) // 2
+    sp_mid = (sp_range[0] + sp_range[-1]) // 2
+    cells = sorted(((eq, strobe) for eq in eq_range for strobe in sp_range),
+                   key=lambda cell: abs(cell[0] - eq_mid) + abs(cell[1] - sp_mid))
+    seed = next((cell for cell in cells if ratio(*cell) == 1.0), None)
+    if seed is None:
+        return measured, edges
+    edges[seed[0]] = (edge(seed[0], seed[1], -1), edge(seed[0], seed[1], 1))
+    for step in (-1, 1):
+        left, right = edges[seed[0]]
+        eq = seed[0] + step
+        while eq in eq_range:
+            middle = (left + right) // 2
+            inner = next((strobe for strobe in sorted(range(left, right + 1),
+                                                      key=lambda s, middle=middle: abs(s - middle))
+                          if ratio(eq, strobe) == 1.0), None)
+            if inner is None:
+                break
+            # inner lies between the edges of the previous row
+            left = edge(eq, left, -1)
+            right = edge(eq, right, 1)
+            edges[eq] = (left, right)
+            eq += step
+
+    # every cell next to a locking one outside of the locked intervals
+    border = [cell for cell, point in measured.items() if point[0] > 0.0]
+    while border:
+        eq, strobe = border.pop()
+        for cell in ((eq + i, strobe + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+            if (cell[0] in eq_range and cell[1] in sp_range and
+                    cell not in measured and
+                    not (cell[0] in edges and
+                         edges[cell[0]][0] <= cell[1] <= edges[cell[0]][1]) and
+                    ratio(*cell) > 0.0):
+                border.append(cell)
+    return measured, edges
+
+
+def infer_eye(measured, edges, eq_range, sp_range):
+    """complete a traced eye to rows of
+    (ratio, samples, latency, errors, inferred)
+
+    Cells not measured count as locked inside the locked interval of a row,
+    else as unlocked, the trace measured all cells around the eye up to
+    unlocked ones.
+    """
+    rows = []
+    for eq in eq_range:
+        row = []
+        for strobe in sp_range:
+            if (eq, strobe) in measured:
+                row.append(tuple(measured[(eq, strobe)]) + (0,))
+            elif eq in edges and edges[eq][0] <= strobe <= edges[eq][1]:
+                row.append((1.0, 0, None, None, 1))
+            else:
+                row.append((0.0, 0, None, None, 1))
+        rows.append(row)
+    return rows
@@ -0,0 +1,322 @@
+""" phycam simulator
+Simulated DS90UB954 deserializer for the margin analysis without hardware.
+
+The simulated device models the registers used by the margin analysis:
+the EQ bypass, the indirect STROBE_SET register, the digital resets, the
+port status and the parity error counter. The lock of each eye cell
+follows a configurable eye shape with noise and a relock latency. All
+waits go to a virtual clock, so a full scan takes milliseconds.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import errno
+import random
+
+from phycam.i2c import I2C
+from phycam.registers import (
+    I2C_ADDRESS_DS90UB954, REG_I2C_DEV_ID, REG_RESET, REG_FPD3_PORT_SEL,
+    REG_RX_PORT_STS1, REG_RX_PORT_STS2, REG_RX_PAR_ERR_HI, REG_RX_PAR_ERR_LO,
+    REG_IND_ACC_CTL, REG_IND_ACC_ADDR, REG_IND_ACC_DATA,
+    REG_ADAPTIVE_EQ_BYPASS, IND_REG_OFF_STROBE_SET, IND_ACC_CTL_READ,
+    FPD3_PORT_SEL_RX_READ_PORT_SHIFT)
+
+STS1_LOCK_STS = 0x01
+STS1_PORT_PASS = 0x02
+STS1_PARITY_ERROR = 0x04
+STS2_FREQ_STABLE = 0x04
+
+
+class VirtualClock:
+    """clock whose sleep advances the time instead of blocking"""
+    def __init__(self, start=0.0):
+        self.now = start
+        self.sleeps = 0
+
+    def monotonic(self):
+        """current virtual time in seconds"""
+        return self.now
+
+    def sleep(self, seconds):
+        """advance the virtual time"""
+        self.sleeps += 1
+        self.now += max(seconds, 0)
+
+
+class EyeShape:  # pylint: disable=too-few-public-methods
+    """rectangular eye with a fractional edge
+
+    Cells within eq and strobe (inclusive ranges) always lock, the lock
+    probability drops linearly over edge cells outside of them. noise is
+    the probability of a flipped lock sample. The strobe position is the
+    effective one, 7 + data delay - clock delay, so base delays move the
+    scan window over the eye.
+    """
+    def __init__(self, eq=(3, 10), strobe=(4, 10), edge=1, noise=0.0):
+        self.eq = eq
+        self.strobe = strobe
+        self.edge = edge
+        self.noise = noise
+
+    def __call__(self, eq, strobe):
+        """lock probability of an eye cell"""
+        distance = max(self.eq[0] - eq, eq - self.eq[1],
+                       self.strobe[0] - strobe, strobe - self.strobe[1], 0)
+        if distance == 0:
+            probability = 1.0
+        elif distance <= self.edge:
+            probability = 1 - distance / (self.edge + 1)
+        else:
+            probability = 0.0
+        return probability * (1 - self.noise) + (1 - probability) * self.noise
+
+
+class SimulatedPort:  # pylint: disable=too-few-public-methods
+    """state of one FPD-Link III receive port"""
+    def __init__(self, eye, relock, now):
+        self.eye = eye
+        self.relock = relock
+        self.eq_bypass = 0
+        self.strobe_set = 0
+        self.relock_start = now
+        self.parity_errors = 0.0
+        self.updated = now
+
+    def cell(self):
+        """eq and effective strobe position of the current setting"""
+        eq = ((self.eq_bypass >> 5) & 0x7) + ((self.eq_bypass >> 1) & 0xf)
+        clock_delay = self.strobe_set & 0xf
+        data_delay = self.strobe_set >> 4
+        return eq, 7 + data_delay - clock_delay
+
+
+class SimulatedDS90UB954:  # pylint: disable=too-many-instance-attributes
+    """DS90UB954 register model on a clock
+
+    eyes is an eye shape, a callable (eq, strobe) -> lock probability, or a
+    list of one per port. relock is the relock latency in seconds after a
+    reset or a new eye cell, a callable (eq, strobe) -> seconds, or a list
+    of one per port.
+    parity_rate is the number of parity errors per second of a cell which
+    locks never. access_time advances the clock on every register access,
+    error_rate is the probability of a failing access.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, clock, addr=I2C_ADDRESS_DS90UB954, eyes=None,
+                 relock=0.05, parity_rate=1000, access_time=0.0,
+                 error_rate=0.0, seed=None):
+        self.clock = clock
+        self.addr = addr
+        if eyes is None:
+            eyes = EyeShape()
+        if not isinstance(eyes, (list, tuple)):
+            eyes = [eyes, eyes]
+        if not isinstance(relock, (list, tuple)):
+            relock = [relock] * len(eyes)
+        self.ports = [SimulatedPort(eye, port_relock, clock.monotonic())
+                      for eye, port_relock in zip(eyes, relock)]
+        self.parity_rate = parity_rate
+        self.access_time = access_time
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.registers = {}
+        self.indirect = {}
+        self.read_data = 0
+        self.reset_registers()
+
+    def reset_registers(self):
+        """register defaults after power up or a reset including registers"""
+        self.registers = {REG_I2C_DEV_ID: self.addr << 1,
+                          REG_FPD3_PORT_SEL: 0x01}
+        self.indirect = {}
+        self.read_data = 0
+        for port in self.ports:
+            port.eq_bypass = 0
+            port.strobe_set = 0
+
+    def read_port(self):
+        """port selected for reads"""
+        return self.ports[(self.registers[REG_FPD3_PORT_SEL]
+                           >> FPD3_PORT_SEL_RX_READ_PORT_SHIFT) & 0x3]
+
+    def write_ports(self):
+        """ports selected for writes"""
+        return [port for index, port in enumerate(self.ports)
+                if self.registers[REG_FPD3_PORT_SEL] & (1 << index)]
+
+    def relock_time(self, port):
+        """relock latency of the current eye cell of port"""
+        if callable(port.relock):
+            return port.relock(*port.cell())
+        return port.relock
+
+    def lock_probability(self, port):
+        """lock probability of port, 0 while it relocks"""
+        if self.clock.monotonic() - port.relock_start < self.relock_time(port):
+            return 0.0
+        return port.eye(*port.cell())
+
+    def restart(self, ports):
+        """start relocking ports"""
+        for port in ports:
+            self.update_parity(port)
+            port.relock_start = self.clock.monotonic()
+            port.parity_errors = 0.0
+
+    def update_parity(self, port):
+        """count the parity errors since the last update"""
+        now = self.clock.monotonic()
+        probability = self.lock_probability(port)
+        if probability > 0:
+            port.parity_errors += ((now - port.updated) * self.parity_rate
+                                   * (1 - probability))
+        port.updated = now
+
+    def access(self):
+        """time and failures of a register access"""
+        if self.access_time:
+            self.clock.sleep(self.access_time)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise OSError(errno.EIO, "simulated I2C error")
+
+    def read(self, reg):
+        """read a register"""
+        self.access()
+        return self.value(reg)
+
+    def read_block(self, reg, length):
+        """read length registers from reg on in one access"""
+        self.access()
+        return [self.value(reg + offset) for offset in range(length)]
+
+    def value(self, reg):
+        """current value of a register, reading may change the state"""
+        port = self.read_port()
+        if reg == REG_RX_PORT_STS1:
+            probability = self.lock_probability(port)
+            if self.random.random() < probability:
+                return STS1_LOCK_STS | STS1_PORT_PASS
+            self.update_parity(port)
+            if probability > 0 or port.parity_errors >= 1:
+                return STS1_PARITY_ERROR
+            return 0x00
+        if reg == REG_RX_PORT_STS2:
+            if self.lock_probability(port) > 0:
+                return STS2_FREQ_STABLE
+            return 0x00
+        if reg == REG_RX_PAR_ERR_HI:
+            self.update_parity(port)
+            return min(int(port.parity_errors), 0xffff) >> 8
+        if reg == REG_RX_PAR_ERR_LO:
+            # reading the low byte clears the counter
+            self.update_parity(port)
+            count = min(int(port.parity_errors), 0xffff)
+            port.parity_errors = 0.0
+            return count & 0xff
+        if reg == REG_ADAPTIVE_EQ_BYPASS:
+            return port.eq_bypass
+        if reg == REG_IND_ACC_DATA:
+            # the value of the last read strobe
+            return self.read_data
+        return self.registers.get(reg, 0)
+
+    def indirect_address(self):
+        """page and offset of the indirect register access"""
+        return (self.registers.get(REG_IND_ACC_CTL, 0) & ~IND_ACC_CTL_READ,
+                self.registers.get(REG_IND_ACC_ADDR, 0))
+
+    def write(self, reg, data):
+        """write a register"""
+        self.access()
+        if reg == REG_RESET:
+            if data & 0x02:
+                self.reset_registers()
+            if data & 0x03:
+                self.restart(self.ports)
+            return
+        self.registers[reg] = data
+        if reg == REG_ADAPTIVE_EQ_BYPASS:
+            ports = self.write_ports()
+            for port in ports:
+                port.eq_bypass = data
+            self.restart(ports)
+        elif (reg == REG_IND_ACC_ADDR and
+              self.registers.get(REG_IND_ACC_CTL, 0) & IND_ACC_CTL_READ):
+            self.read_data = self.indirect.get(self.indirect_address(), 0)
+        elif reg == REG_IND_ACC_DATA:
+            page, offset = self.indirect_address()
+            self.indirect[(page, offset)] = data
+            for index, port in enumerate(self.ports):
+                # page 0x04 << index holds the port test registers
+                if page == 0x04 << index and offset == IND_REG_OFF_STROBE_SET:
+                    port.strobe_set = data
+                    self.restart([port])
+
+
+class SimulatedSMBus:
+    """SMBus stand-in for the devices of a simulated bus"""
+    def __init__(self, devices):
+        self.devices = devices
+
+    def device(self, addr):
+        """device at addr, fails like a missing device on a real bus"""
+        if addr not in self.devices:
+            raise OSError(errno.ENXIO, "no such device")
+        return self.devices[addr]
+
+    def read_byte_data(self, addr, reg):
+        """read a register"""
+        return self.device(addr).read(reg)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        """read a register block"""
+        return self.device(addr).read_block(reg, length)
+
+    def write_byte_data(self, addr, reg, data):
+        """write a register"""
+        self.device(addr).write(reg, data)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        """probe a device like i2cdetect"""
+        device = self.device(addr)
+        for offset, value in enumerate(data):
+            device.write(reg + offset, value)
+
+    def close(self):
+        """nothing to release"""
+
+
+class Simulation:
+    """simulated buses with a DS90UB954 each
+
+    Every bus has its own virtual clock, so buses scanned by different
+    workers do not share the time. The device options are passed to
+    SimulatedDS90UB954.
+    """
+    def __init__(self, buses=range(8), addresses=(I2C_ADDRESS_DS90UB954,),
+                 seed=None, **options):
+        self.clocks = {}
+        self.devices = {}
+        for bus in buses:
+            clock = VirtualClock()
+            self.clocks[bus] = clock
+            self.devices[bus] = {}
+            for addr in addresses:
+                if seed is not None:
+                    options["seed"] = f"{seed}-{bus}-{addr}"
+                self.devices[bus][addr] = SimulatedDS90UB954(clock, addr,
+                                                             **options)
+        self.opens = 0
+
+    def open(self, bus):
+        """open a session on a simulated bus, transport of I2C"""
+        if bus not in self.devices:
+            raise FileNotFoundError(errno.ENOENT, "no such bus", bus)
+        self.opens += 1
+        return SimulatedSMBus(self.devices[bus])
+
+    def i2c(self, bus):
+        """I2C session on a simulated bus and its clock"""
+        return I2C(bus, transport=self.open,
+                   clock=self.clocks.get(bus, VirtualClock()))
@@ -0,0 +1,188 @@
+""" phycam targets
+Targets of a concurrent margin analysis.
+
+A target is a deserializer given as BUS[:ADDRESS[:PORT]]. The targets are
+checked before the scan and then scanned concurrently by the engine, every
+port gets its own result file.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import asyncio
+import contextlib
+from phycam.cli import RESULT_FILE
+from phycam.engine import ScanEngine
+from phycam.i2c import I2C
+from phycam.metrics import timed
+from phycam.registers import I2C_ADDRESS_DS90UB954, REG_I2C_DEV_ID
+from phycam.render import (open_table, print_map, print_verdict, result_path,
+                           split_cells, write_lock_rows, write_parameters)
+from phycam.scan import scan_steps
+
+
+def open_bus(which_bus, i2c_factory=I2C):
+    """check the BUS input, returns the I2C session or None"""
+    try:
+        which_bus = int(which_bus)
+        i2c = i2c_factory(which_bus)  # Create a new I2C bus session
+        dev_id = i2c.read(I2C_ADDRESS_DS90UB954, REG_I2C_DEV_ID)
+        # bit 0 id dev_id indicates if id is overwritten by register,
+        # alternative id strappings or set by register not supported
+        if which_bus >= 0 and (dev_id >> 1) == I2C_ADDRESS_DS90UB954:
+            print("\tBUS-check: OK")
+            return i2c
+        print("\tIncorrect BUS address input, please try again!")
+        i2c.close()
+    except ValueError:
+        print("\tIncorrect input, please insert an integer value!")
+    except FileNotFoundError:
+        print("\tBus does not exist, please try again!")
+    return None
+
+
+def select_ports(which_port=None):
+    """check the Port input, returns the list of ports or None"""
+    if which_port is None:
+        print("Which Port is the phyCAM-L interface connected to (enter for default)?")
+        print("Enter 'both' to test port 0 and port 1 in one run.")
+        which_port = input()
+    match which_port:
+        case "":
+            print("\tTesting on default port 0")
+            return [0]
+        case "0" | "1":
+            print(f"\tTesting on port {which_port}")
+            return [int(which_port)]
+        case "both" | "b":
+            print("\tTesting on port 0 and port 1")
+            return [0, 1]
+        case _:
+            print("\tIncorrect Port input, please try again!")
+    return None
+
+
+def select_targets(which_bus, i2c_factory=I2C):
+    """check a list of targets, returns them or None"""
+    try:
+        targets = [parse_target(target) for target in which_bus.split()]
+    except ValueError:
+        print("\tIncorrect target input, please try again!")
+        return None
+    if len({target[:2] for target in targets}) != len(targets):
+        print("\tA deserializer can only be listed once, " +
+              "use PORT 'both' to test both of its ports!")
+        return None
+    # every target is checked, so all the wrong ones are reported at once
+    checked = [check_target(bus, addr, i2c_factory)
+               for bus, addr, _ in targets]
+    if not all(checked):
+        return None
+    return targets
+
+
+def parse_target(text):
+    """parse a BUS[:ADDRESS[:PORT]] target, PORT is 0, 1 or both
+
+    Returns bus, deserializer address and list of ports.
+    """
+    fields = text.split(":")
+    if len(fields) > 3:
+        raise ValueError(f"invalid target {text}")
+    bus = int(fields[0])
+    addr = I2C_ADDRESS_DS90UB954
+    if len(fields) > 1 and fields[1]:
+        addr = int(fields[1], 0)
+    ports = [0]
+    if len(fields) > 2 and fields[2]:
+        if fields[2] in ("both", "b"):
+            ports = [0, 1]
+        else:
+            ports = [int(fields[2])]
+    if bus < 0 or not 0 <= addr < 0x80 or ports[0] not in (0, 1):
+        raise ValueError(f"invalid target {text}")
+    return bus, addr, ports
+
+
+def check_target(bus, addr, i2c_factory=I2C):
+    """check for a DS90UB954 at addr on bus"""
+    try:
+        with i2c_factory(bus) as i2c:
+            dev_id = i2c.read(addr, REG_I2C_DEV_ID)
+    except FileNotFoundError:
+        print(f"\tBus {bus} does not exist, please try again!")
+        return False
+    except OSError:
+        print(f"\tNo device at address 0x{addr:02x} on bus {bus}, " +
+              "please try again!")
+        return False
+    # bit 0 id dev_id indicates if id is overwritten by register
+    if (dev_id >> 1) != addr:
+        print(f"\tIncorrect device at address 0x{addr:02x} on bus {bus}, " +
+              "please try again!")
+        return False
+    print(f"\tBUS-check {bus}:0x{addr:02x}: OK")
+    return True
+
+
+async def scan_targets(targets, params, i2c_factory=I2C, journal=None):
+    """scan a list of (bus, address, ports) targets on the running event loop
+
+    The targets of a bus share its I2C session and executor, while one of
+    them waits for its dwell or lock time the others continue.
+    Returns the cells of each port or the error per target.
+    """
+    with contextlib.ExitStack() as stack, ScanEngine() as engine:
+        sessions = {}
+        scans = []
+        for bus, addr, ports in targets:
+            if bus not in sessions:
+                sessions[bus] = stack.enter_context(i2c_factory(bus))
+            i2c = sessions[bus]
+            scans.append(engine.drive(bus, i2c.clock, scan_steps(
+                i2c, ports, params, addr, journal)))
+        results = await asyncio.gather(*scans, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, OSError):
+            raise result
+    return results
+
+
+def run_targets(targets, params, date, output=RESULT_FILE,  # pylint: disable=too-many-arguments
+                i2c_factory=I2C, journal=None, history=None, metrics=None):
+    """scan a list of (bus, address, ports) targets concurrently
+
+    One event loop drives all targets, every bus has its own I2C executor.
+    Every port of a target gets its own result file and is added to the
+    run history. The output times are reported to metrics.
+    """
+    print("Scanning", len(targets), "target(s) on",
+          len({bus for bus, _, _ in targets}), "bus(es)")
+    results = asyncio.run(scan_targets(targets, params, i2c_factory, journal))
+
+    for (bus, addr, ports), port_cells in zip(targets, results):
+        for index, port in enumerate(ports):
+            name = f"BUS {bus} ADDRESS 0x{addr:02x} PORT {port}"
+            table = open_table(result_path(
+                output, f"bus{bus}_0x{addr:02x}_port{port}"), date)
+            print(f"\n\n{name:#^59}")
+            if isinstance(port_cells, Exception):
+                print("Test failed:", port_cells)
+                table.write(f"\nError:,{port_cells},\n")
+                table.close()
+                continue
+            result = split_cells(port_cells[index])
+            with timed(metrics, "phase_seconds", phase="terminal"):
+                print(" EQ\\SP  0  1  2  3  4  5  6  7  8  9 10 11 12 13 14 ")
+                print_map(result[0], result[4], params.eq_begin,
+                          params.strobe_begin, params.color)
+            write_lock_rows(table, result[0],
+                            params.eq_begin, params.strobe_begin)
+            print("\n\nLock result:")
+            with timed(metrics, "phase_seconds", phase="terminal"):
+                print_verdict(result[0], params.color, table)
+            with timed(metrics, "phase_seconds", phase="file"):
+                write_parameters(table, port, params, result)
+                table.close()
+            if history is not None:
+                history.add_result((bus, addr, port), params, result)
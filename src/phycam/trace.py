@@ -0,0 +1,286 @@
+""" phycam trace
+Recording and replay of the I2C transactions of a margin analysis run.
+
+A trace holds every register access that went over the bus: the bus,
+the operation, the device address, the register, the data and the
+monotonic time of the session clock. Failed accesses are recorded with
+their errno. A record is 16 bytes plus its data.
+
+The replay serves a recorded trace as the buses of a run. The scan code
+must issue the same accesses as in the recording, i.e. use the same
+parameters, then it sees exactly the recorded values and errors. The
+replay runs at full speed on virtual clocks or at the original timing.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import argparse
+import collections
+import json
+import struct
+import sys
+import threading
+import time
+
+from phycam.i2c import I2C
+from phycam.simulator import VirtualClock
+
+MAGIC = b"PHYCAMTR"
+VERSION = 2
+HEADER = struct.Struct("<8sBI") # magic, version, length of the JSON info
+RECORD = struct.Struct("<dIBBBB") # time, bus, operation, addr, reg, length
+
+READ = 0
+WRITE = 1
+READ_BLOCK = 2
+PROBE = 3
+ERROR = 0x80 # flag of a failed access, the data is the errno
+
+OPERATIONS = {READ: "read", WRITE: "write", READ_BLOCK: "read_block",
+              PROBE: "probe"}
+
+Record = collections.namedtuple("Record", "time bus operation addr reg data")
+
+
+def read_trace(path):
+    """info and records of a trace file"""
+    with open(path, "rb") as trace_file:
+        magic, version, length = HEADER.unpack(trace_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is no I2C trace of version {VERSION}")
+        info = json.loads(trace_file.read(length))
+        records = []
+        while True:
+            head = trace_file.read(RECORD.size)
+            if len(head) < RECORD.size:
+                break # the end or cut off by an interruption
+            timestamp, bus, operation, addr, reg, length = RECORD.unpack(head)
+            data = trace_file.read(length)
+            if len(data) < length:
+                break
+            records.append(Record(timestamp, bus, operation, addr, reg,
+                                  list(data)))
+    return info, records
+
+
+def describe(record):
+    """one line description of a record"""
+    name = OPERATIONS[record.operation & ~ERROR]
+    if record.operation & ERROR:
+        value = f"error {record.data[0]}"
+    else:
+        value = " ".join(f"0x{byte:02x}" for byte in record.data)
+    return (f"{record.time:12.6f}  bus {record.bus}  0x{record.addr:02x}  "
+            f"{name:10}  0x{record.reg:02x}  {value}")
+
+
+class TraceRecorder:
+    """trace file the sessions of an I2C factory are recorded to
+
+    Use the instance as a context manager to close the trace file.
+    """
+    def __init__(self, path, info=None):
+        self.file = open(path, "wb")  # pylint: disable=consider-using-with
+        encoded = json.dumps(info or {}).encode()
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(encoded)) + encoded)
+        self.lock = threading.Lock() # buses are scanned in threads
+        self.records = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """close the trace file"""
+        self.file.close()
+
+    def write(self, clock, bus, operation, addr, reg, data):
+        """append a record"""
+        with self.lock:
+            self.file.write(RECORD.pack(clock.monotonic(), bus, operation,
+                                        addr, reg, len(data)) + bytes(data))
+            self.records += 1
+
+    def recording(self, i2c_factory):
+        """i2c_factory whose sessions are recorded"""
+        def factory(bus):
+            i2c = i2c_factory(bus)
+            transport = i2c.transport
+            i2c.transport = lambda number: RecordingSMBus(
+                transport(number), self, number, i2c.clock)
+            return i2c
+        return factory
+
+
+class RecordingSMBus:
+    """SMBus wrapper which records the accesses"""
+    def __init__(self, bus, recorder, number, clock):
+        self.bus = bus
+        self.recorder = recorder
+        self.number = number
+        self.clock = clock
+
+    def access(self, operation, addr, reg, func, data=()):
+        """run an access, record its data or error"""
+        try:
+            result = func()
+        except OSError as error:
+            self.recorder.write(self.clock, self.number, operation | ERROR,
+                                addr, reg, [(error.errno or 0) & 0xff])
+            raise
+        if operation == READ:
+            data = [result]
+        elif operation == READ_BLOCK:
+            data = result
+        self.recorder.write(self.clock, self.number, operation, addr, reg,
+                            data)
+        return result
+
+    def read_byte_data(self, addr, reg):
+        """read a register"""
+        return self.access(READ, addr, reg,
+                           lambda: self.bus.read_byte_data(addr, reg))
+
+    def read_i2c_block_data(self, addr, reg, length):
+        """read a register block"""
+        return self.access(READ_BLOCK, addr, reg,
+                           lambda: self.bus.read_i2c_block_data(addr, reg,
+                                                                length))
+
+    def write_byte_data(self, addr, reg, data):
+        """write a register"""
+        self.access(WRITE, addr, reg,
+                    lambda: self.bus.write_byte_data(addr, reg, data), [data])
+
+    def write_i2c_block_data(self, addr, reg, data):
+        """probe a device"""
+        self.access(PROBE, addr, reg,
+                    lambda: self.bus.write_i2c_block_data(addr, reg, data),
+                    data)
+
+    def close(self):
+        """close the bus"""
+        self.bus.close()
+
+
+class TraceReplay:
+    """recorded trace served as the buses of a run
+
+    With timing every access waits for its recorded time relative to the
+    first access of its bus and the sessions use the real clock, otherwise
+    they use virtual clocks. A run which accesses the bus differently than
+    recorded raises a ValueError.
+    """
+    def __init__(self, path, timing=False):
+        self.info, records = read_trace(path)
+        self.timing = timing
+        self.records = {}
+        for record in records:
+            self.records.setdefault(record.bus, collections.deque()).append(
+                record)
+        self.started = {}
+
+    def open(self, bus):
+        """open a session on a recorded bus, transport of I2C"""
+        if bus not in self.records:
+            raise FileNotFoundError(f"bus {bus} is not in the trace")
+        return ReplaySMBus(self, bus)
+
+    def i2c(self, bus):
+        """I2C session on a recorded bus"""
+        return I2C(bus, transport=self.open,
+                   clock=time if self.timing else VirtualClock())
+
+    def next_record(self, bus, operation, addr, reg, data=None):
+        """recorded access matching the current one"""
+        if not self.records[bus]:
+            raise ValueError(f"replay of bus {bus} goes beyond the trace")
+        record = self.records[bus].popleft()
+        if ((record.operation & ~ERROR, record.addr, record.reg) !=
+                (operation, addr, reg) or
+                (data is not None and not record.operation & ERROR
+                 and record.data != list(data))):
+            raise ValueError(
+                f"replay diverged on bus {bus}: {OPERATIONS[operation]} "
+                f"0x{addr:02x} 0x{reg:02x}, recorded {describe(record)}, "
+                f"arguments of the recording: "
+                f"{' '.join(self.info.get('argv', []))}")
+        if self.timing:
+            # the recorded time relative to the first access of the bus
+            origin = self.started.setdefault(
+                bus, (time.monotonic(), record.time))
+            delay = origin[0] + record.time - origin[1] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if record.operation & ERROR:
+            raise OSError(record.data[0], "replayed I2C error")
+        return record.data
+
+
+class ReplaySMBus:
+    """SMBus stand-in serving the recorded accesses of a bus"""
+    def __init__(self, replay, bus):
+        self.replay = replay
+        self.bus = bus
+
+    def read_byte_data(self, addr, reg):
+        """read a register"""
+        return self.replay.next_record(self.bus, READ, addr, reg)[0]
+
+    def read_i2c_block_data(self, addr, reg, length):
+        """read a register block"""
+        data = self.replay.next_record(self.bus, READ_BLOCK, addr, reg)
+        if len(data) != length:
+            raise ValueError(f"replay diverged on bus {self.bus}: block "
+                             f"of {length} bytes, recorded {len(data)}")
+        return data
+
+    def write_byte_data(self, addr, reg, data):
+        """write a register"""
+        self.replay.next_record(self.bus, WRITE, addr, reg, [data])
+
+    def write_i2c_block_data(self, addr, reg, data):
+        """probe a device"""
+        self.replay.next_record(self.bus, PROBE, addr, reg, data)
+
+    def close(self):
+        """nothing to release"""
+
+
+def main(argv=None):
+    """trace command line, prints a recorded trace"""
+    parser = argparse.ArgumentParser(
+        prog="python -m phycam.trace",
+        description="print an I2C trace of phycam-margin-analysis --record")
+    parser.add_argument("trace")
+    parser.add_argument("-s", "--summary", action="store_true",
+                        help="only the accesses per operation and register")
+    args = parser.parse_args(argv)
+    try:
+        info, records = read_trace(args.trace)
+    except (OSError, ValueError, struct.error) as error:
+        print("Invalid trace:", error)
+        return 1
+    print("arguments:", " ".join(info.get("argv", [])))
+    print("date:", info.get("date", "-"))
+    print("records:", len(records))
+    if args.summary:
+        counts = collections.Counter(
+            (record.bus, record.addr, record.operation, record.reg)
+            for record in records)
+        for (bus, addr, operation, reg), count in sorted(counts.items()):
+            name = OPERATIONS[operation & ~ERROR]
+            if operation & ERROR:
+                name += " error"
+            print(f"bus {bus}  0x{addr:02x}  {name:16}  0x{reg:02x}  {count:8}")
+        return 0
+    for record in records:
+        print(describe(record))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
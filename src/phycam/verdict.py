@@ -0,0 +1,140 @@
+""" phycam verdict
+Pass/fail verdict of lock_result maps.
+
+A cable is suitable if at least three EQ lines have a run of four
+completely permissible eye diagram areas (1.0) and a 4 x 2 rectangle of
+them exists. The criteria are evaluated on all maps of a batch at once:
+the maps are packed into one integer with a byte per area, the sliding
+windows are shifts and ANDs of that integer.
+
+SPDX-License-Identifier: MIT
+Copyright: (C) 2021 PHYTEC Messtechnik GmbH
+"""
+
+import itertools
+from collections import namedtuple
+
+Verdict = namedtuple("Verdict", "eq_lines rectangles suitable")
+PackedMaps = namedtuple("PackedMaps", "bits count height stride")
+
+RUN_LENGTH = 4 # consecutive 1.0 areas of an EQ line
+RECT_WIDTH = 4
+RECT_HEIGHT = 2
+MIN_EQ_LINES = 3
+MIN_RECTANGLES = 1
+
+
+def row_stride(width):
+    """areas per packed row, a power of two with at least one guard area"""
+    stride = 1
+    while stride < width + 1:
+        stride *= 2
+    return stride
+
+
+def pack_maps(maps):
+    """pack the 1.0 areas of a list of maps, one byte per area
+
+    Row i of map k starts at byte (k * (height + 1) + i) * stride. The
+    guard areas and the zero row after every map stop the windows from
+    reaching into the next row or map. Pack archived maps once to evaluate
+    them with several criteria.
+    """
+    height = max((len(lock_result) for lock_result in maps), default=0)
+    widths = {len(row) for lock_result in maps for row in lock_result}
+    width = max(widths, default=0)
+    stride = row_stride(width)
+    packed = bytearray(len(maps) * (height + 1) * stride)
+    if len(widths) == 1 and all(len(lock_result) == height
+                                for lock_result in maps):
+        # complete maps, compare all areas at once and copy them by column
+        guard = [[0.0] * width]
+        areas = bytes(map((1.0).__eq__, itertools.chain.from_iterable(
+            itertools.chain.from_iterable(list(lock_result) + guard
+                                          for lock_result in maps))))
+        for column in range(width):
+            packed[column::stride] = areas[column::width]
+    else:
+        offset = 0
+        for lock_result in maps:
+            for row in lock_result:
+                packed[offset:offset + len(row)] = bytes(
+                    map((1.0).__eq__, row))
+                offset += stride
+            offset += (height + 1 - len(lock_result)) * stride
+    return PackedMaps(int.from_bytes(packed, "little"), len(maps),
+                      height, stride)
+
+
+def pack_areas(areas, count, height, width):
+    """pack count complete height x width maps like pack_maps
+
+    areas holds a byte per area, 1 for a 1.0 area else 0, the maps one
+    after another. Every area is copied for all maps at once.
+    """
+    stride = row_stride(width)
+    map_bytes = (height + 1) * stride
+    packed = bytearray(count * map_bytes)
+    for row in range(height):
+        for column in range(width):
+            packed[row * stride + column::map_bytes] = areas[
+                row * width + column::height * width]
+    return PackedMaps(int.from_bytes(packed, "little"), count, height, stride)
+
+
+def windows(bits, width, height, stride):
+    """areas where a width x height window of 1.0 areas starts"""
+    result = bits
+    for offset in range(1, width):
+        result &= bits >> (8 * offset)
+    rows = result
+    for offset in range(1, height):
+        result &= rows >> (8 * offset * stride)
+    return result
+
+
+def count_maps(bits, count, map_bytes):
+    """number of marked areas in each of count maps"""
+    packed = bits.to_bytes(count * map_bytes, "little")
+    return [packed.count(1, offset, offset + map_bytes)
+            for offset in range(0, count * map_bytes, map_bytes)]
+
+
+def eye_verdict(lock_result, **criteria):
+    """verdict of one lock_result map, see batch_verdicts"""
+    return batch_verdicts([lock_result], **criteria)[0]
+
+
+def batch_verdicts(maps, run_length=RUN_LENGTH, rect_width=RECT_WIDTH,  # pylint: disable=too-many-arguments
+                   rect_height=RECT_HEIGHT, min_eq_lines=MIN_EQ_LINES,
+                   min_rectangles=MIN_RECTANGLES):
+    """verdicts of a batch of lock_result maps
+
+    A map is a list of rows of lock ratios, the batch is a list of maps or
+    the PackedMaps of pack_maps(). Returns a Verdict per map of the number
+    of EQ lines with a run of run_length 1.0 areas, the number of
+    rect_width x rect_height rectangles of 1.0 areas and if the cable is
+    suitable.
+    """
+    if not isinstance(maps, PackedMaps):
+        maps = pack_maps(maps)
+    bits, count, height, stride = maps
+    map_bytes = (height + 1) * stride
+
+    # collapse every row into its first area to count the rows with a run
+    runs = windows(bits, run_length, 1, stride)
+    shift = 1
+    while shift < stride:
+        runs |= runs >> (8 * shift)
+        shift *= 2
+    row_starts = int.from_bytes(
+        ((b"\x01" + bytes(stride - 1)) * height + bytes(stride)) * count,
+        "little")
+    rectangles = windows(bits, rect_width, rect_height, stride)
+
+    verdicts = [Verdict(eq_lines, rects,
+                        eq_lines >= min_eq_lines and rects >= min_rectangles)
+                for eq_lines, rects in zip(
+                    count_maps(runs & row_starts, count, map_bytes),
+                    count_maps(rectangles, count, map_bytes))]
+    return verdicts
@@ -0,0 +1,19 @@
+"""Tests for the scan benchmark"""
+import json
+
+from phycam import benchmark
+
+
+def test_benchmark_report(tmp_path):
+    output = tmp_path / "benchmark.json"
+    assert benchmark.main(["-o", str(output), "default", "window-center"]) == 0
+    results = json.loads(output.read_text())["results"]
+    assert list(results) == ["default", "window-center"]
+    default = results["default"]
+    assert default["returncode"] == 0
+    assert default["opens"] == default["closes"] == 1
+    assert default["transactions"] == default["reads"] + default["writes"]
+    assert default["bytes_written"] > 0
+    # 25 instead of 225 cells
+    assert (results["window-center"]["virtual_time"] <
+            default["virtual_time"] / 5)
@@ -0,0 +1,62 @@
+"""Tests for the boundary tracing eye scan"""
+import pytest
+
+from phycam import deserializer, render, scan
+from phycam.simulator import EyeShape, Simulation
+
+WINDOW = range(15)
+
+
+def raster_map(eye):
+    """lock ratio map of a raster scan of a simulated eye"""
+    simulation = Simulation(buses=[1], seed=1, eyes=eye)
+    params = scan.MarginParameters()
+    with simulation.i2c(1) as i2c:
+        port_cells = scan.run_steps(
+            scan.scan_steps(i2c, [0], params), i2c.clock)
+    return render.split_cells(port_cells[0])[0]
+
+
+@pytest.mark.parametrize("eye", [
+    EyeShape(),
+    EyeShape(eq=(5, 5), strobe=(7, 7)),
+    EyeShape(eq=(0, 6), strobe=(9, 14), edge=2),
+    EyeShape(eq=(4, 12), strobe=(2, 6), edge=3),
+])
+def test_trace_matches_raster(eye):
+    raster = raster_map(eye)
+    # the trace measures the same ratios, so its map must equal the raster
+    measured, edges = scan.trace_eye(
+        lambda eq, strobe: (raster[eq][strobe], 10, None, None),
+        WINDOW, WINDOW)
+    rows = scan.infer_eye(measured, edges, WINDOW, WINDOW)
+    assert [[cell[0] for cell in row] for row in rows] == raster
+    assert all(cell[4] == ((eq, strobe) not in measured)
+               for eq, row in enumerate(rows)
+               for strobe, cell in enumerate(row))
+
+
+def test_trace_skips_the_inner_and_outer_areas():
+    raster = raster_map(EyeShape())
+    measured = scan.trace_eye(
+        lambda eq, strobe: (raster[eq][strobe], 10, None, None),
+        WINDOW, WINDOW)[0]
+    assert len(measured) < 225 // 2
+
+
+def test_trace_measures_the_rows_beside_a_small_eye():
+    simulation = Simulation(buses=[1], seed=1,
+                            eyes=EyeShape(eq=(5, 5), strobe=(7, 7)))
+    params = scan.MarginParameters()
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, [0]),
+                       i2c.clock)
+        measured, edges = scan.trace_eye(
+            lambda eq, strobe: scan.measure_point(
+                i2c, eq, strobe, params)[0], WINDOW, WINDOW)
+    rows = scan.infer_eye(measured, edges, WINDOW, WINDOW)
+    for eq in (4, 6):
+        for strobe in (6, 7, 8):
+            assert 0.0 < rows[eq][strobe][0] < 1.0
+            assert not rows[eq][strobe][4]
+    assert rows[5][7][0] == 1.0
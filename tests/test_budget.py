@@ -0,0 +1,71 @@
+"""Tests for the cost model and the time budget"""
+import contextlib
+import io
+import json
+
+from phycam import budget, margin_analysis, scan
+from phycam.simulator import Simulation
+
+
+def write_log(path, parameters, cells):
+    with open(path, "w", encoding="utf-8") as log:
+        log.write(json.dumps({"type": "run", "parameters": parameters}) + "\n")
+        for eq, (samples, duration, latency) in enumerate(cells):
+            for port in (0, 1):
+                log.write(json.dumps({
+                    "type": "cell", "bus": 1, "addr": 0x3d, "port": port,
+                    "eq": eq, "strobe": 0, "ratio": 1.0, "samples": samples,
+                    "latency": latency, "duration": duration}) + "\n")
+
+
+def test_budget_calibration(tmp_path):
+    # 5 ms per area and 1 ms per snapshot of each of the two ports
+    write_log(tmp_path / "a.log", {"dwell_time": 0.5, "lock_time": 0.1},
+              [(samples, 0.5 + 0.005 + samples * (0.3 + 0.002), None)
+               for samples in (10, 4, 7)])
+    write_log(tmp_path / "b.log", {"dwell_time": 2.0, "lock_time": 0.1,
+                                   "poll_lock": 1},
+              [(10, 9.0, 0.4), (10, 9.0, None)])
+    model = budget.CostModel.calibrate([str(tmp_path / "a.log"),
+                                        str(tmp_path / "b.log"),
+                                        str(tmp_path / "missing.log")])
+    assert model.areas == 3
+    assert abs(model.cell_overhead - 0.005) < 1e-9
+    assert abs(model.sample_overhead - 0.001) < 1e-9
+    assert model.relock == 0.4
+    assert abs(model.dwell_floor(0.5) - 0.6) < 1e-9
+
+    default = budget.CostModel.calibrate([str(tmp_path / "missing.log")])
+    assert default.cell_overhead == budget.CELL_OVERHEAD
+    assert default.dwell_floor(0.5) is None
+
+
+def test_budget_chooses_window_and_lock_runs():
+    params = scan.MarginParameters()
+    model = budget.CostModel(0.0, 0.0)
+    assert abs(model.scan_seconds(params) - (0.1 + 225 * 3.9)) < 1e-6
+
+    # the full window with more lock runs
+    chosen = budget.choose_parameters(params, 1200, model)
+    assert (chosen.eq_begin, chosen.eq_end) == (0, 14)
+    assert chosen.lock_runs == 14
+    assert params.lock_runs == 10
+
+    # a window shrunk towards the eye center
+    chosen = budget.choose_parameters(params, 400, model)
+    assert (chosen.eq_begin, chosen.eq_end,
+            chosen.strobe_begin, chosen.strobe_end) == (3, 12, 3, 12)
+    assert chosen.lock_runs == 10
+    assert model.scan_seconds(chosen) <= 400
+
+    assert budget.choose_parameters(params, 40, model) is None
+    assert list(budget.windows(params))[-1] == (6, 9, 6, 9)
+
+
+def test_budget_command_line(tmp_path):
+    output = str(tmp_path / "r.txt")
+    argv = ["-b", "1", "-n", "-o", output, "--time-budget", "300"]
+    with contextlib.redirect_stdout(io.StringIO()) as text:
+        assert margin_analysis.main(argv, Simulation(seed=1).i2c) == 0
+    assert "EQ 3..11, strobe 4..11, 10 lock runs" in text.getvalue()
+    assert "Strobe Position Begin:,4," in open(output, encoding="utf-8").read()
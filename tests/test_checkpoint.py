@@ -0,0 +1,67 @@
+"""Tests for the cell log and the resume of an interrupted scan"""
+import contextlib
+import io
+import json
+
+from phycam import margin_analysis, scan
+from phycam.checkpoint import CellLog
+from phycam.simulator import Simulation
+
+
+class InterruptingSimulation(Simulation):
+    """simulation interrupted by the user after a virtual time"""
+    def __init__(self, interrupt_at, **options):
+        super().__init__(**options)
+        self.interrupt_at = interrupt_at
+
+    def i2c(self, bus):
+        i2c = super().i2c(bus)
+        sleep = i2c.clock.sleep
+
+        def interrupted_sleep(seconds):
+            if i2c.clock.monotonic() >= self.interrupt_at:
+                raise KeyboardInterrupt
+            sleep(seconds)
+        i2c.clock.sleep = interrupted_sleep
+        return i2c
+
+
+def run_main(argv, i2c_factory):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return margin_analysis.main(argv, i2c_factory)
+
+
+def test_checkpoint_load_skips_cut_off_record(tmp_path):
+    path = tmp_path / "cells.log"
+    with CellLog(path) as journal:
+        journal.start({"bus": "1"})
+        step = scan.ScanStep(2, 3, 0x33, 0x04)
+        journal.recorder(1, 0x3d, [0])(step, [(1.0, 10, 0.05, None)], 3.9)
+    with open(path, "a", encoding="utf-8") as log:
+        log.write('{"type": "cell", "bus": 1, "ad')
+    journal = CellLog(path)
+    assert journal.load()["bus"] == "1"
+    assert journal.known(1, 0x3d, 0) == {(2, 3): (1.0, 10, 0.05, None)}
+    assert journal.known(1, 0x3d, 1) == {}
+
+
+def test_checkpoint_resume_measures_missing_cells(tmp_path):
+    output = str(tmp_path / "ma_lock_result.txt")
+    argv = ["-b", "1", "-n", "-o", output]
+    assert run_main(argv, InterruptingSimulation(300, seed=1).i2c) == 130
+    with open(tmp_path / "ma_lock_result.log", encoding="utf-8") as log:
+        interrupted = len(log.readlines()) - 1
+    assert 0 < interrupted < 225
+
+    simulation = Simulation(seed=1)
+    assert run_main(["--resume", "-o", output], simulation.i2c) == 0
+    with open(tmp_path / "ma_lock_result.log", encoding="utf-8") as log:
+        records = [json.loads(line) for line in log]
+    cells = [(record["eq"], record["strobe"]) for record in records[1:]]
+    assert len(cells) == len(set(cells)) == 225
+    # only the missing cells of 3.9 s each were measured, plus the reset of
+    # the teardown
+    assert abs(simulation.clocks[1].monotonic() -
+               ((225 - interrupted) * 3.9 + 0.1)) < 1e-6
+    with open(output, encoding="utf-8") as result:
+        assert "Scan Order:,raster," in result.read()
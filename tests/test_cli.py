@@ -1,8 +1,49 @@
 """Tests for the cli calls"""
 import subprocess
+import sys
 
-def test_cli_display():
-    command = "python3 src/python_phycam_margin_analysis.py -o display -som PCL-066 -kit 3022210I.A0 -rev 1"
+import pytest
+
+from phycam import cli, margin_analysis
+
+
+def test_cli_help():
+    command = [sys.executable, "-m", "phycam.margin_analysis", "--help"]
     print(command)
-    result = subprocess.run(command.split(' '))
+    result = subprocess.run(command, check=False)
     assert result.returncode == 0
+
+
+def test_cli_invalid_parameter():
+    assert margin_analysis.main(["--eq-begin", "9", "--eq-end", "3"]) == 2
+    assert margin_analysis.main(["--lock-time", "2"]) == 2
+
+
+def test_cli_arguments_override_profile(tmp_path):
+    profile = tmp_path / "cable.ini"
+    profile.write_text("[margin-analysis]\n"
+                       "bus = 1\n"
+                       "port = both\n"
+                       "color = yes\n"
+                       "dwell-time = 0.5\n"
+                       "early_stop = 95\n"
+                       "no_prompt = yes\n")
+    args = cli.parse_arguments(
+        ["-c", str(profile), "--no-color", "--lock-runs", "20"])
+    given = cli.given_parameters(args)
+    assert given == {"bus": "1", "port": "both", "color": 0,
+                     "dwell_time": 0.5, "early_stop": 95, "no_prompt": 1,
+                     "lock_runs": 20}
+
+    params = cli.ask_parameters([0, 1], given, prompt=False)
+    assert params.dwell_time == 0.5
+    assert params.early_stop == 0.95
+    assert params.lock_runs == 20
+    assert params.eq_end == 14
+
+
+def test_cli_unknown_profile_parameter(tmp_path):
+    profile = tmp_path / "cable.ini"
+    profile.write_text("[margin-analysis]\ndwel_time = 0.5\n")
+    with pytest.raises(ValueError):
+        cli.read_profile(profile)
@@ -0,0 +1,36 @@
+"""Tests for the scan of both ports of a deserializer"""
+from phycam import deserializer, scan
+from phycam.simulator import Simulation
+
+
+def test_dual_port_relock_latency_per_port():
+    simulation = Simulation(buses=[1], relock=[0.05, 0.07])
+    params = scan.MarginParameters()
+    params.poll_lock = 1
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, [0, 1]),
+                       i2c.clock)
+        point = scan.measure_point(i2c, 7, 7, params, [0, 1])
+    assert point[0][0] == point[1][0] == 1.0
+    assert abs(point[0][2] - 0.05) <= scan.POLL_INTERVAL
+    assert abs(point[1][2] - 0.07) <= scan.POLL_INTERVAL
+    assert point[0][2] < point[1][2]
+
+
+def measure_transactions(ports):
+    simulation = Simulation(buses=[1])
+    params = scan.MarginParameters()
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, ports),
+                       i2c.clock)
+        start = i2c.transactions()
+        for strobe in range(-7, 8):
+            scan.measure_point(i2c, 3, strobe, params, ports)
+        return i2c.transactions() - start
+
+
+def test_dual_port_selects_each_port_once_per_sample():
+    single = measure_transactions([0])
+    both = measure_transactions([0, 1])
+    # the status reads double, the port selection changes once per sample
+    assert both < 3 * single
@@ -0,0 +1,36 @@
+"""Tests for the early stopping lock sampling"""
+import contextlib
+import io
+
+from phycam import margin_analysis, scan
+from phycam.history import read_result_file
+from phycam.simulator import EyeShape, Simulation
+
+
+def test_early_stop_samples():
+    assert scan.early_stop_samples(0) == 0
+    assert scan.early_stop_samples(0.5) == 1
+    assert scan.early_stop_samples(0.95) == 5
+    assert scan.early_stop_samples(0.999) == 10
+
+
+def test_early_stop_samples_per_cell(tmp_path):
+    eye = EyeShape()
+    output = str(tmp_path / "ma_lock_result.txt")
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert margin_analysis.main(
+            ["-b", "1", "-n", "-o", output, "--early-stop", "95"],
+            Simulation(seed=1, eyes=eye).i2c) == 0
+    _, lock_result, sample_result = read_result_file(output)
+    fractional = 0
+    for eq in range(15):
+        for strobe in range(15):
+            if eye(eq, strobe) in (0.0, 1.0):
+                # clearly locked or unlocked, decided after 5 samples
+                assert sample_result[eq][strobe] == 5
+                assert lock_result[eq][strobe] == eye(eq, strobe)
+            elif 0.0 < lock_result[eq][strobe] < 1.0:
+                # a marginal cell gets all lock runs
+                assert sample_result[eq][strobe] == 10
+                fractional += 1
+    assert fractional > 0
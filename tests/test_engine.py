@@ -0,0 +1,49 @@
+"""Tests for the asyncio scan engine"""
+import asyncio
+import time
+
+from phycam import scan
+from phycam.engine import ScanEngine
+from phycam.simulator import Simulation
+from phycam.targets import scan_targets
+
+
+def wait_steps(delays, log, name):
+    for delay in delays:
+        log.append(name)
+        yield delay
+    return name
+
+
+def test_engine_real_timers_overlap():
+    log = []
+
+    async def drive_both():
+        with ScanEngine() as engine:
+            return await asyncio.gather(
+                engine.drive(1, time, wait_steps([0.05, 0.05], log, "a")),
+                engine.drive(2, time, wait_steps([0.05, 0.05], log, "b")))
+
+    start = time.monotonic()
+    assert asyncio.run(drive_both()) == ["a", "b"]
+    assert time.monotonic() - start < 0.19
+    assert sorted(log) == ["a", "a", "b", "b"]
+
+
+def test_engine_scans_targets_on_one_loop():
+    simulation = Simulation(buses=[1, 2], addresses=(0x3d, 0x30), seed=1)
+    params = scan.MarginParameters()
+    params.eq_begin = 5
+    params.eq_end = 9
+    targets = [(1, 0x3d, [0]), (1, 0x30, [0, 1]), (2, 0x3d, [0]),
+               (2, 0x31, [0])]
+    results = asyncio.run(scan_targets(
+        targets, params, simulation.i2c))
+    assert [len(port_cells) for port_cells in results[:3]] == [1, 2, 1]
+    assert all(cell[0] == 1.0 for port_cells in results[:3]
+               for cells in port_cells for cell in cells[3][4:11])
+    assert isinstance(results[3], OSError)
+    # the targets of a bus share its time, 75 cells of 3.9 s and the reset
+    # of the teardown
+    assert abs(simulation.clocks[1].monotonic() - (75 * 3.9 + 0.1)) < 1e-6
+    assert abs(simulation.clocks[2].monotonic() - (75 * 3.9 + 0.1)) < 1e-6
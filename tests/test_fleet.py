@@ -0,0 +1,91 @@
+"""Tests for the fleet statistics"""
+import contextlib
+import io
+import random
+
+from phycam import fleet, margin_analysis, verdict
+from phycam.simulator import EyeShape, Simulation
+
+
+def eye(eq_begin, eq_end, sp_begin, sp_end, edge=0.5):
+    """15 x 15 lock map of a rectangular eye with a partly locked edge"""
+    return [[1.0 if eq_begin <= eq <= eq_end and sp_begin <= strobe <= sp_end
+             else edge if eq_begin - 1 <= eq <= eq_end + 1 else 0.0
+             for strobe in range(15)] for eq in range(15)]
+
+
+def longest_run(lock_result):
+    """longest run of 1.0 areas along the EQ lines"""
+    text = " ".join("".join("1" if ratio == 1.0 else " " for ratio in row)
+                    for row in lock_result)
+    return max(map(len, text.split()), default=0)
+
+
+def test_fleet_statistics_in_batches():
+    rng = random.Random(1)
+    maps = [eye(rng.randint(0, 7), rng.randint(5, 14),
+                rng.randint(0, 7), rng.randint(5, 14)) for run in range(100)]
+    statistics = fleet.FleetStatistics(batch_size=16)
+    for lock_result in maps:
+        statistics.add_map(lock_result)
+    probability = statistics.pass_probability()
+    assert statistics.runs == 100
+    for eq, strobe in ((0, 0), (7, 7), (12, 3)):
+        assert probability[eq][strobe] == sum(
+            lock_result[eq][strobe] == 1.0 for lock_result in maps) / 100
+        assert abs(statistics.mean_ratio()[eq][strobe] - sum(
+            lock_result[eq][strobe] for lock_result in maps) / 100) < 1e-9
+
+    verdicts = verdict.batch_verdicts(maps)
+    assert statistics.suitable == sum(result.suitable for result in verdicts)
+    assert statistics.eq_lines == [
+        sum(result.eq_lines == lines for result in verdicts)
+        for lines in range(16)]
+    widths = sorted(longest_run(lock_result) for lock_result in maps)
+    assert statistics.widths == [widths.count(width) for width in range(16)]
+    percentiles = statistics.percentiles()
+    assert percentiles["eye width"][0] == widths[0]
+    assert percentiles["eye width"][3] == widths[49]
+    assert percentiles["eye width"][-1] == widths[-1]
+
+
+def test_fleet_extents():
+    lock_result = eye(3, 9, 4, 10, edge=0.0)
+    lock_result[5][11:14] = [1.0] * 3
+    lock_result[13][0] = 1.0
+    maps = verdict.pack_maps([lock_result, eye(0, 14, 0, 14), eye(0, 0, 0, 0)])
+    widths = fleet.extents(maps)
+    assert len(widths) == 16
+    assert [width for width, runs in enumerate(widths) if runs] == [1, 10, 15]
+    assert fleet.extents(maps, horizontal=False)[7] == 1
+    assert fleet.percentile([0, 2, 0, 1], 50) == 1
+    assert fleet.percentile([0, 2, 0, 1], 100) == 3
+
+
+def test_fleet_command_line(tmp_path):
+    database = str(tmp_path / "history.sqlite")
+    for seed, cable, shape in ((1, "LOT1-0001", EyeShape()),
+                               (2, "LOT1-0002", EyeShape()),
+                               (3, "LOT2-0001", EyeShape(eq=(7, 8)))):
+        argv = ["-b", "1", "-n", "-o", str(tmp_path / f"{cable}.txt"),
+                "--history", database, "--cable", cable]
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert margin_analysis.main(
+                argv, Simulation(seed=seed, eyes=shape).i2c) == 0
+
+    # other text files next to the results are no unreadable results
+    (tmp_path / "notes.txt").write_text("cables of lot 1 and 2\n")
+    output = str(tmp_path / "fleet.csv")
+    with contextlib.redirect_stdout(io.StringIO()) as text:
+        assert fleet.main([str(tmp_path), "-o", output]) == 0
+    assert "RUNS: 3, suitable 2 (66.7 %)" in text.getvalue()
+    assert "    7    0   0   0   0 100 100" in text.getvalue()
+    table = open(output, encoding="utf-8").read()
+    assert " 3,0.000,0.000,0.000,0.000,0.667," in table
+    assert "\nr_eq,runs,\n2,1,\n8,2,\n" in table
+
+    with contextlib.redirect_stdout(io.StringIO()) as text:
+        assert fleet.main(["-d", database, "--lot", "LOT1"]) == 0
+    assert "RUNS: 2, suitable 2 (100.0 %)" in text.getvalue()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert fleet.main(["-d", database, "--lot", "LOT3"]) == 1
@@ -0,0 +1,67 @@
+"""Tests for the run history store"""
+import contextlib
+import io
+import time
+
+from phycam import history, margin_analysis
+from phycam.simulator import EyeShape, Simulation
+
+
+def test_history_maps_round_trip():
+    lock_result = history.full_map([[0.2, 1.0, 0.96], [1 / 3, 0.0]], 4, 5, 0.0)
+    data = history.pack_ratios(lock_result)
+    assert len(data) == 225
+    ratios = history.unpack_ratios(data)
+    assert ratios[4][5:8] == [0.2, 1.0, 0.96]
+    assert abs(ratios[5][5] - 1 / 3) < 1 / history.RATIO_STEPS
+    samples = history.full_map([[10, 500, 70000]])
+    assert history.unpack_samples(history.pack_samples(samples))[0][:3] == [
+        10, 500, 0xffff]
+
+
+def test_history_scans_and_queries(tmp_path):
+    database = str(tmp_path / "history.sqlite")
+    simulation = Simulation(seed=1, eyes=[EyeShape(), EyeShape(eq=(7, 8))])
+    argv = ["-b", "3", "-p", "both", "-n", "-o", str(tmp_path / "r.txt"),
+            "--history", database, "--cable", "C42"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert margin_analysis.main(argv, simulation.i2c) == 0
+
+    with history.RunHistory(database) as runs:
+        assert sorted(run.port for run in runs.query(cable="C42")) == [0, 1]
+        failing = runs.query(since=time.time() - 7 * 86400, bus=3,
+                             suitable=False)
+        assert [(run.port, run.eq_lines) for run in failing] == [(1, 2)]
+        assert failing[0].parameters["dwell_time"] == 0.9
+        assert runs.query(parameters={"lock_runs": 20}) == []
+        indexes = {name for name, in runs.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert "runs_parameters" not in indexes
+        assert "runs_time" in indexes
+        lock_result, sample_result = runs.maps(failing[0].id)
+        assert lock_result[7][4:11] == [1.0] * 7
+        assert sample_result[0][0] == 10
+
+
+def test_history_import_result_files(tmp_path):
+    # the rows of older files end with the scan window
+    result = tmp_path / "ma_lock_result.txt"
+    result.write_text("date: 18.10.2026\ntime: 14:30:19\n"
+                      ",,,,,,,,LOCK-RESULT,,,,,,,,\n,,,,,,,,SP,,,,,,,,\n"
+                      "EQ,0,1,2,3,4,5,6,7,8,9,10,11,12,13,14\n" +
+                      "".join(f"{eq:2d},0.0,1.0,1.0,1.0,1.0,\n"
+                              for eq in range(4)) +
+                      "\nsufficiant EQ lines:,true,\n"
+                      "rectangle available:,true,\n"
+                      "Coax-cable suitable:,TRUE,\n"
+                      "\nParameter\nPort:,1,\ndwell time:,0.5,s,\n"
+                      "Lock Polling:,yes,\n")
+    with history.RunHistory(str(tmp_path / "history.sqlite")) as runs:
+        run_id = runs.import_file(str(result), cable="C7")
+        assert runs.import_file(str(result)) == run_id
+        run, = runs.query(cable="C7")
+        assert (run.port, run.eq_lines, run.rectangles) == (1, 4, 3)
+        assert run.suitable
+        assert run.parameters == {"dwell_time": 0.5, "poll_lock": 1}
+        assert time.localtime(run.time)[:6] == (2026, 10, 18, 14, 30, 19)
+        assert runs.maps(run_id)[1] is None
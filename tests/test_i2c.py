@@ -0,0 +1,75 @@
+"""Tests for the I2C bus session"""
+import errno
+
+import pytest
+
+from phycam.i2c import I2C
+
+
+class FakeBus:
+    """SMBus stand-in which fails the next failures transactions"""
+    def __init__(self, failures):
+        self.failures = failures
+        self.closed = False
+
+    def transfer(self, value):
+        if self.failures:
+            self.failures.pop()
+            raise OSError(errno.EIO, "bus error")
+        return value
+
+    def read_byte_data(self, addr, reg):
+        return self.transfer(reg + 1)
+
+    def write_byte_data(self, addr, reg, data):
+        self.transfer(None)
+
+    def close(self):
+        self.closed = True
+
+
+def session(failures=()):
+    """I2C session without shadow and its opened fake buses"""
+    buses = []
+    failures = list(failures)
+
+    def transport(number):
+        assert number == 3
+        buses.append(FakeBus(failures))
+        return buses[-1]
+    return I2C(3, transport=transport, shadow=False), buses
+
+
+def test_i2c_keeps_the_bus_open():
+    i2c, buses = session()
+    with i2c:
+        assert i2c.read(0x3d, 0x10) == 0x11
+        i2c.write(0x3d, 0x10, 0x01)
+        assert i2c.read(0x3d, 0x20) == 0x21
+    assert len(buses) == 1 and buses[0].closed
+    assert (i2c.opens, i2c.closes, i2c.retries) == (1, 1, 0)
+    assert (i2c.reads, i2c.writes) == (2, 1)
+    assert i2c.transactions() == 3
+
+
+def test_i2c_retries_once_on_a_new_bus():
+    i2c, buses = session([True])
+    with i2c:
+        assert i2c.read(0x3d, 0x10) == 0x11
+        i2c.write(0x3d, 0x10, 0x01)
+    # the failing bus is closed and a new one opened for the retry
+    assert len(buses) == 2 and all(bus.closed for bus in buses)
+    assert (i2c.opens, i2c.closes, i2c.retries) == (2, 2, 1)
+    assert i2c.transactions() == 2
+
+
+def test_i2c_gives_up_after_the_second_failure():
+    i2c, buses = session([True, True])
+    with i2c:
+        with pytest.raises(OSError):
+            i2c.read(0x3d, 0x10)
+        assert i2c.bus is None
+        # the next access opens the bus again
+        assert i2c.read(0x3d, 0x10) == 0x11
+    assert len(buses) == 3
+    assert (i2c.opens, i2c.closes, i2c.retries) == (3, 3, 1)
@@ -0,0 +1,44 @@
+"""Tests for the run metrics"""
+import contextlib
+import io
+import json
+
+from phycam import margin_analysis
+from phycam.benchmark import SessionRecorder
+from phycam.metrics import Metrics
+from phycam.simulator import Simulation
+
+
+def test_metrics_prometheus_histogram():
+    metrics = Metrics()
+    metrics.inc("cells_total", 2)
+    for value in (0.0001, 0.0003, 20.0):
+        metrics.observe("i2c_latency_seconds", value, operation="read")
+    text = metrics.prometheus()
+    assert "phycam_cells_total 2\n" in text
+    assert 'phycam_i2c_latency_seconds_bucket{operation="read",le="0.0001"} 1\n' in text
+    assert 'phycam_i2c_latency_seconds_bucket{operation="read",le="0.0005"} 2\n' in text
+    assert 'phycam_i2c_latency_seconds_bucket{operation="read",le="+Inf"} 3\n' in text
+    assert 'phycam_i2c_latency_seconds_count{operation="read"} 3\n' in text
+    assert metrics.summary()["histograms"][
+        'i2c_latency_seconds{operation="read"}']["max"] == 20.0
+
+
+def test_metrics_of_a_run(tmp_path):
+    recorder = SessionRecorder(Simulation(seed=1))
+    argv = ["-b", "1", "-n", "-o", str(tmp_path / "r.txt"),
+            "--metrics", str(tmp_path / "metrics.prom")]
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert margin_analysis.main(argv, recorder) == 0
+    assert (tmp_path / "metrics.prom").read_text().startswith("# HELP")
+    with open(tmp_path / "metrics.json", encoding="utf-8") as summary_file:
+        summary = json.load(summary_file)
+    counters = summary["counters"]
+    assert counters["cells_total"] == 225
+    assert sum(value for name, value in counters.items()
+               if name.startswith("i2c_transactions_total")) == \
+        recorder.total("reads") + recorder.total("writes")
+    dwell = summary["histograms"]['phase_seconds{phase="dwell"}']
+    assert dwell["count"] == 225
+    assert abs(dwell["mean"] - 0.9) < 1e-9
+    assert summary["histograms"]['phase_seconds{phase="terminal"}']["count"] > 225
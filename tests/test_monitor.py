@@ -0,0 +1,66 @@
+"""Tests for the margin drift monitor"""
+from phycam import deserializer, monitor, registers, scan
+from phycam.simulator import EyeShape, Simulation
+
+
+def test_monitor_history_is_bounded():
+    history = monitor.DriftHistory(size=4, factor=2, levels=3)
+    for index in range(100):
+        history.add(monitor.Round(index, index + 0.5, 1, index % 3, 1.0))
+    entries = list(history.entries())
+    assert sum(len(ring) for ring in history.levels) == 12
+    assert [entry.rounds for entry in entries] == [4] * 4 + [2] * 4 + [1] * 4
+    assert entries[-1].start == 99
+    assert entries[0].margin == 0
+    # no gap between the levels
+    assert all(newer.start == older.end + 0.5
+               for older, newer in zip(entries, entries[1:]))
+
+
+def test_monitor_window_margin():
+    assert monitor.window_margin([[1.0] * 5] * 5, 2) == 2
+    rows = [[1.0] * 5 for i in range(5)]
+    rows[0][4] = 0.9
+    assert monitor.window_margin(rows, 2) == 1
+    rows[2][2] = 0.5
+    assert monitor.window_margin(rows, 2) == -1
+
+
+def test_monitor_alerts_on_drift():
+    simulation = Simulation(buses=[1], seed=1)
+    clock = simulation.clocks[1]
+    wide = EyeShape(eq=(3, 10))
+    narrow = EyeShape(eq=(7, 10))
+    device = simulation.devices[1][registers.I2C_ADDRESS_DS90UB954]
+    # the eye shrinks in the second quarter of an hour
+    device.ports[0].eye = lambda eq, strobe: (
+        narrow if 900 <= clock.monotonic() < 1800 else wide)(eq, strobe)
+    lines = []
+    with simulation.i2c(1) as i2c:
+        drift = monitor.DriftMonitor(i2c, scan.MarginParameters(),
+                                     (7, 7), report=lines.append)
+        drift.run(300, rounds=8)
+    assert [entry.margin for entry in drift.history.entries()] == [
+        1, 1, 1, 0, 0, 0, 1, 1]
+    assert drift.alerts == 1
+    assert "ALERT: margin 0 below 1 at 0:15:00" in lines
+    assert "margin recovered to 1 at 0:30:00" in lines
+
+
+def test_monitor_reads_the_operating_point(capsys):
+    for eq in range(15):
+        assert deserializer.register_eq(
+            deserializer.eq_register(eq)) == eq
+    for strobe in range(15):
+        assert deserializer.register_strobe(
+            deserializer.strobe_register(strobe, 1, 0)) == (strobe, 1, 0)
+
+    simulation = Simulation(buses=[1], seed=1)
+    device = simulation.devices[1][registers.I2C_ADDRESS_DS90UB954]
+    device.ports[0].eq_bypass = deserializer.eq_register(6)
+    device.indirect[(0x04, 0x08)] = deserializer.strobe_register(8)
+    assert monitor.main(["-b", "1", "--rounds", "1", "--interval", "0"],
+                        simulation.i2c) == 0
+    assert "Operating point EQ 6 strobe 8" in capsys.readouterr().out
+    # a fresh deserializer has the adaptive EQ and no strobe delay
+    assert monitor.operating_point(0x00, 0x00) == ((7, 7), 0, 0)
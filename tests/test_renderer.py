@@ -0,0 +1,57 @@
+"""Tests for the terminal output of the scan map"""
+import io
+
+from phycam import render, scan
+from phycam.simulator import VirtualClock
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def run_scan(renderer, params, clock, seconds):
+    for step in scan.scan_plan(params):
+        clock.sleep(seconds)
+        renderer.update(step, [(1.0 if step.strobe > 1 else 0.5, 10, None)])
+
+
+def test_renderer_redraws_frame_with_remaining_time():
+    params = scan.MarginParameters()
+    params.eq_begin, params.eq_end = 3, 4
+    clock = VirtualClock()
+    terminal = Terminal()
+    renderer = render.MapRenderer(params, clock=clock, stream=terminal)
+    renderer.start()
+    frame = terminal.getvalue()
+    assert frame.count("\n") == 19
+    # the estimate of the parameters before an area is measured
+    assert "about 1:58 min, 0 of 30 areas done" in frame
+
+    writes = []
+    terminal.write = writes.append
+    run_scan(renderer, params, clock, 2.0)
+    assert len(writes) == 30
+    assert all(text.startswith("\033[19F") for text in writes)
+    assert "about 0:58 min, 1 of 30" in writes[0]
+    assert "30 areas done" in writes[-1]
+    rows = writes[-1].split("\n")
+    assert rows[5].startswith("    3  ▒▒ ▒▒ ██ ██")
+    assert rows[3] == "    1  " + "   " * 15 + "\033[K"
+
+
+def test_renderer_appends_rows_without_terminal():
+    params = scan.MarginParameters()
+    params.eq_begin, params.eq_end = 3, 4
+    params.strobe_begin = 2
+    output = io.StringIO()
+    clock = VirtualClock()
+    renderer = render.MapRenderer(params, clock=clock, stream=output)
+    renderer.start()
+    run_scan(renderer, params, clock, 2.0)
+    renderer.finish()
+    lines = output.getvalue().split("\n")
+    assert "\033" not in output.getvalue()
+    assert len(lines) == 19
+    assert lines[7] == "    3        " + "██ " * 13
+    assert lines[9] == "    5  "
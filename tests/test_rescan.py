@@ -0,0 +1,65 @@
+"""Tests for the rescan of the marginal areas of a previous result"""
+import contextlib
+import io
+
+from phycam import margin_analysis
+from phycam.history import read_result_file
+from phycam.simulator import EyeShape, Simulation
+
+
+def run_main(argv, i2c_factory):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return margin_analysis.main(argv, i2c_factory)
+
+
+def test_rescan_keeps_solid_areas(tmp_path):
+    output = str(tmp_path / "ma_lock_result.txt")
+    argv = ["-b", "1", "-n", "-o", output]
+    assert run_main(argv, Simulation(seed=1).i2c) == 0
+    lock_result = read_result_file(output)[1]
+    fractional = sum(0.0 < ratio < 1.0 for row in lock_result for ratio in row)
+    assert fractional > 0
+
+    # the reseated cable locks everywhere, only the rescanned areas show it
+    simulation = Simulation(seed=2, eyes=EyeShape(eq=(0, 14), strobe=(0, 14)))
+    assert run_main(argv + ["--rescan", "--rescan-ring", "0"],
+                    simulation.i2c) == 0
+    assert abs(simulation.clocks[1].monotonic() -
+               (fractional * 3.9 + 0.1)) < 1e-6
+    rescanned = read_result_file(output)[1]
+    for eq, row in enumerate(lock_result):
+        for strobe, ratio in enumerate(row):
+            assert rescanned[eq][strobe] == (1.0 if 0.0 < ratio < 1.0
+                                             else ratio)
+
+
+def test_rescan_ring(tmp_path):
+    previous = str(tmp_path / "previous.txt")
+    assert run_main(["-b", "1", "-n", "-o", previous, "--eq-begin", "2",
+                     "--eq-end", "11"], Simulation(seed=1).i2c) == 0
+    cells, path = margin_analysis.previous_cells(
+        previous, [(1, 0x3d, [0])], True, 1)[(1, 0x3d, 0)]
+    assert path == previous
+    # the eye edge is EQ 2 and 11 and strobe 3 and 11, plus the ring
+    assert {strobe for eq, strobe in cells} == {0, 1, 5, 6, 7, 8, 9, 13, 14}
+    assert {eq for eq, strobe in cells if strobe == 7} == {4, 5, 6, 7, 8, 9}
+    assert cells[(2, 0)] == (0.0, 10, None)
+    assert cells[(6, 7)] == (1.0, 10, None)
+    assert (0, 0) not in cells # outside of the previous window
+
+
+def test_rescan_exact_ratios(tmp_path):
+    def eye(eq, strobe):
+        return {(7, 6): 0.96, (7, 8): 0.04}.get((eq, strobe), float(eq == 7))
+
+    previous = str(tmp_path / "previous.txt")
+    assert run_main(["-b", "1", "-n", "-o", previous, "--lock-runs", "25"],
+                    Simulation(seed=5, eyes=eye).i2c) == 0
+    # 24 of 25 samples locked is no solid area
+    lock_result = read_result_file(previous)[1]
+    assert lock_result[7][6] == 0.96
+    assert 0.0 < lock_result[7][8] < 0.1
+    cells = margin_analysis.previous_cells(
+        previous, [(1, 0x3d, [0])], True, 0)[(1, 0x3d, 0)][0]
+    assert (7, 6) not in cells and (7, 8) not in cells
+    assert cells[(7, 7)][0] == 1.0
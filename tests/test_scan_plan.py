@@ -0,0 +1,48 @@
+"""Tests for the scan plan"""
+import pytest
+
+from phycam import scan
+
+
+def window(strobe_begin=0, strobe_end=14, eq_begin=0, eq_end=14):
+    params = scan.MarginParameters()
+    params.strobe_begin = strobe_begin
+    params.strobe_end = strobe_end
+    params.eq_begin = eq_begin
+    params.eq_end = eq_end
+    return params
+
+
+@pytest.mark.parametrize("order", scan.SCAN_ORDERS)
+def test_scan_plan_covers_window(order):
+    plan = scan.scan_plan(window(3, 9, 2, 12), order)
+    assert sorted((step.eq, step.strobe) for step in plan) == [
+        (eq, strobe) for eq in range(2, 13) for strobe in range(3, 10)]
+
+
+def test_scan_plan_orders():
+    params = window(0, 2, 6, 8)
+    cells = {order: [(step.eq, step.strobe)
+                     for step in scan.scan_plan(params, order)]
+             for order in scan.SCAN_ORDERS}
+    assert cells["raster"][:4] == [(6, 0), (6, 1), (6, 2), (7, 0)]
+    assert cells["serpentine"][:6] == [(6, 0), (6, 1), (6, 2),
+                                       (7, 2), (7, 1), (7, 0)]
+    assert cells["column"][:4] == [(6, 0), (7, 0), (8, 0), (6, 1)]
+    assert cells["column-serpentine"][:6] == [(6, 0), (7, 0), (8, 0),
+                                              (8, 1), (7, 1), (6, 1)]
+    with pytest.raises(ValueError):
+        scan.scan_plan(params, "spiral")
+
+
+def test_scan_plan_register_values():
+    params = window()
+    params.data_base_delay = 1
+    plan = scan.scan_plan(params)
+    # EQ 0..7 by eq_sel1, EQ 8..14 by eq_sel2 with eq_sel1 = 7
+    assert [step.eq_value for step in plan[::15]] == [
+        1, 33, 65, 97, 129, 161, 193, 225, 227, 229, 231, 233, 235, 237, 239]
+    # clock delay 7..1 for strobe 0..6, then data delay 0..7
+    assert [step.strobe_value for step in plan[:15]] == [
+        0x87, 0x86, 0x85, 0x84, 0x83, 0x82, 0x81,
+        0x80, 0x90, 0xa0, 0xb0, 0xc0, 0xd0, 0xe0, 0xf0]
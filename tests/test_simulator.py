@@ -0,0 +1,205 @@
+"""Tests for the simulated DS90UB954"""
+import pytest
+
+from phycam import deserializer, render, scan, targets
+from phycam.registers import (I2C_ADDRESS_DS90UB954, REG_ADAPTIVE_EQ_BYPASS,
+                              REG_AEQ_CTL1, REG_FPD3_CAP, REG_FPD3_ENC_CTL,
+                              REG_FPD3_PORT_SEL, REG_IND_ACC_ADDR,
+                              REG_IND_ACC_CTL, REG_IND_ACC_DATA, REG_RESET)
+from phycam.simulator import EyeShape, Simulation
+
+
+def test_simulator_scan_follows_eye():
+    simulation = Simulation(buses=[1], seed=1,
+                            eyes=EyeShape(eq=(3, 10), strobe=(4, 10)))
+    params = scan.MarginParameters()
+    with simulation.i2c(1) as i2c:
+        port_cells = scan.run_steps(
+            scan.scan_steps(i2c, [0], params), i2c.clock)
+    lock_result = render.split_cells(port_cells[0])[0]
+    for eq, row in enumerate(lock_result):
+        for strobe, ratio in enumerate(row):
+            if 3 <= eq <= 10 and 4 <= strobe <= 10:
+                assert ratio == 1.0
+            elif eq < 2 or eq > 11 or strobe < 3 or strobe > 11:
+                assert ratio == 0.0
+    # 225 cells of 0.9 s dwell and 10 * 0.3 s lock runs, 0.1 s reset of the
+    # teardown
+    assert abs(simulation.clocks[1].monotonic() - (225 * 3.9 + 0.1)) < 1e-6
+
+
+def test_simulator_relock_latency():
+    simulation = Simulation(buses=[1], relock=0.2)
+    params = scan.MarginParameters()
+    params.poll_lock = 1
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, [0]),
+                       i2c.clock)
+        locked = scan.measure_point(i2c, 7, 7, params)
+        unlocked = scan.measure_point(i2c, 0, 0, params)
+    assert locked[0][0] == 1.0
+    assert abs(locked[0][2] - 0.2) <= scan.POLL_INTERVAL
+    assert unlocked[0][0] == 0.0
+    assert unlocked[0][2] is None
+
+
+def test_simulator_missing_bus_and_device():
+    simulation = Simulation(buses=[1])
+    assert targets.open_bus("2", simulation.i2c) is None
+    assert not targets.check_target(1, 0x30, simulation.i2c)
+    assert targets.check_target(1, 0x3d, simulation.i2c)
+
+
+def test_simulator_status_snapshot():
+    simulation = Simulation(buses=[1], relock=0.0, parity_rate=100)
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, [0]),
+                       i2c.clock)
+        scan.measure_point(i2c, 7, 7, scan.MarginParameters())
+        reads = i2c.reads
+        status = deserializer.read_status(i2c, None)
+        assert i2c.reads == reads + 1
+        assert scan.port_locked(status.sts1, status.sts2)
+        assert status.parity_errors is None
+
+        # an edge cell of the eye collects parity errors while it is unlocked
+        scan.write_point(i2c, deserializer.eq_register(2), None)
+        i2c.clock.sleep(1.0)
+        assert deserializer.read_status(i2c, None, parity=True).parity_errors > 0
+        assert deserializer.read_status(i2c, None, parity=True).parity_errors == 0
+
+
+def test_simulator_parity_window():
+    simulation = Simulation(buses=[1], seed=1, relock=0.0, parity_rate=100)
+    params = scan.MarginParameters()
+    params.parity_window = 0.5
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, [0]),
+                       i2c.clock)
+        reads = i2c.reads
+        start = i2c.clock.monotonic()
+        locked = scan.measure_point(i2c, 7, 7, params)
+        assert abs(i2c.clock.monotonic() - start - 1.4) < 1e-6
+        assert i2c.reads == reads + 2
+        edge = scan.measure_point(i2c, 2, 7, params)
+        unlocked = scan.measure_point(i2c, 0, 0, params)
+    assert locked[0] == (1.0, 1, None, 0.0)
+    # half of the samples of the edge fail, i.e. 50 errors per second
+    assert edge[0][0] == 0.0
+    assert abs(edge[0][3] - 50) <= 2
+    assert unlocked[0] == (0.0, 1, None, None)
+
+
+def test_simulator_setup_waits_for_resets_only():
+    simulation = Simulation(buses=[1])
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, [0, 1]),
+                       i2c.clock)
+        assert i2c.clock.monotonic() == 0.0
+        scan.run_steps(deserializer.setup_steps(
+            i2c, [0], digital_reset=1), i2c.clock)
+        assert abs(i2c.clock.monotonic() - 0.1) < 1e-9
+
+        # a register which does not take its value fails the setup
+        device = simulation.devices[1][I2C_ADDRESS_DS90UB954]
+        value = device.value
+        device.value = lambda reg: (0x30 if reg == REG_AEQ_CTL1
+                                    else value(reg))
+        with pytest.raises(OSError, match="register 0x42 reads back 0x30"):
+            scan.run_steps(deserializer.setup_steps(i2c, [0]),
+                           i2c.clock)
+
+
+def registers(device):
+    """registers the test changes and the port registers of device"""
+    return ({reg: device.registers.get(reg, 0)
+             for reg in deserializer.SNAPSHOT_REGISTERS},
+            [(port.eq_bypass, port.strobe_set) for port in device.ports])
+
+
+def test_simulator_restores_registers():
+    simulation = Simulation(buses=[1], seed=1)
+    device = simulation.devices[1][I2C_ADDRESS_DS90UB954]
+    params = scan.MarginParameters()
+    params.eq_begin, params.eq_end = 6, 8
+    params.strobe_begin, params.strobe_end = 6, 8
+    params.restore = 1
+    with simulation.i2c(1) as i2c:
+        # a configuration of the application before the test
+        for port, eq_bypass, strobe_set in ((0, 0x41, 0x23), (1, 0x61, 0x05)):
+            i2c.write(0x3d, REG_FPD3_PORT_SEL, 0x01 << port)
+            i2c.write(0x3d, REG_ADAPTIVE_EQ_BYPASS, eq_bypass)
+            i2c.write(0x3d, REG_IND_ACC_CTL, 0x04 << port)
+            i2c.write(0x3d, REG_IND_ACC_ADDR, 0x08)
+            i2c.write(0x3d, REG_IND_ACC_DATA, strobe_set)
+        i2c.write(0x3d, REG_AEQ_CTL1, 0x02)
+        i2c.write(0x3d, REG_FPD3_ENC_CTL, 0x80)
+        state = registers(device)
+        reads = i2c.reads
+        snapshot = deserializer.snapshot_registers(i2c, [0, 1])
+        # the adjacent thresholds and the indirect access registers in
+        # blocks, the other five one by one, two reads per port
+        assert i2c.reads == reads + 7 + 4
+        assert snapshot.ports == {0: (0x41, 0x23), 1: (0x61, 0x05)}
+        scan.run_steps(deserializer.teardown_steps(
+            i2c, [0, 1], snapshot=snapshot), i2c.clock)
+        assert registers(device) == state
+
+        port_cells = scan.run_steps(
+            scan.scan_steps(i2c, [0, 1], params), i2c.clock)
+    assert port_cells[1][1][1][0] == 1.0
+    assert registers(device) == state
+    # no digital reset, no wait besides the 9 areas of 3.9 s
+    assert abs(simulation.clocks[1].monotonic() - 9 * 3.9) < 1e-6
+
+
+def test_simulator_restore_detects_a_dropped_strobe_set():
+    simulation = Simulation(buses=[1])
+    device = simulation.devices[1][I2C_ADDRESS_DS90UB954]
+    with simulation.i2c(1) as i2c:
+        snapshot = deserializer.snapshot_registers(i2c, [0])
+        snapshot.ports[0] = (0x41, 0x23)
+        # the indirect register does not take the STROBE_SET value
+        write = device.write
+        device.write = lambda reg, data: (
+            None if reg == REG_IND_ACC_DATA
+            else write(reg, data))
+        with pytest.raises(OSError, match="register 0xb2 reads back 0x00 "
+                           "instead of 0x23"):
+            scan.run_steps(deserializer.teardown_steps(
+                i2c, [0], snapshot=snapshot), i2c.clock)
+
+
+def test_simulator_shadow_skips_unchanged_writes():
+    simulation = Simulation(buses=[1], relock=0.0)
+    params = scan.MarginParameters()
+    with simulation.i2c(1) as i2c:
+        scan.run_steps(deserializer.setup_steps(i2c, [0, 1]),
+                       i2c.clock)
+        writes, reads, skipped = i2c.writes, i2c.reads, i2c.skipped_writes
+        # the boundary trace writes both registers of every area
+        scan.measure_point(i2c, 7, 7, params)
+        scan.measure_point(i2c, 7, 8, params)
+        assert i2c.writes == writes + 2 * 3 - 1
+        assert i2c.skipped_writes == skipped + 1
+        # the status always comes from the hardware, the setup from the shadow
+        assert i2c.reads > reads + 2 * 10
+        reads = i2c.reads
+        deserializer.read_status(i2c, None)
+        assert i2c.read(0x3d, REG_FPD3_CAP) & 0x10
+        assert i2c.reads == reads + 1
+
+        # the EQ bypass of each port
+        i2c.write(0x3d, REG_FPD3_PORT_SEL, 0x02)
+        i2c.write(0x3d, REG_ADAPTIVE_EQ_BYPASS, 0x21)
+        reads = i2c.reads
+        assert deserializer.read_port(
+            i2c, 0, REG_ADAPTIVE_EQ_BYPASS) == 0xe1
+        assert deserializer.read_port(
+            i2c, 1, REG_ADAPTIVE_EQ_BYPASS) == 0x21
+        assert i2c.reads == reads
+
+        # a digital reset including registers drops the shadow
+        i2c.write(0x3d, REG_RESET, 0x02)
+        assert i2c.read(0x3d, REG_FPD3_PORT_SEL) == 0x01
+        assert i2c.reads == reads + 1
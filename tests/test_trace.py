@@ -0,0 +1,64 @@
+"""Tests for the I2C trace recording and replay"""
+import contextlib
+import io
+
+import pytest
+
+from phycam import margin_analysis, registers
+from phycam.benchmark import SessionRecorder
+from phycam.simulator import Simulation
+from phycam.trace import ERROR, TraceRecorder, TraceReplay, read_trace
+
+
+def run_main(argv, i2c_factory):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return margin_analysis.main(argv, i2c_factory)
+
+
+def result_map(path):
+    with open(path, encoding="utf-8") as result:
+        return result.read().split("\n", 2)[2]
+
+
+def test_trace_replays_flaky_run(tmp_path):
+    trace = str(tmp_path / "run.trc")
+    argv = ["-b", "1", "-n", "--eq-begin", "5", "--eq-end", "8"]
+    recorded = SessionRecorder(Simulation(seed=1, error_rate=0.002))
+    assert run_main(argv + ["-o", str(tmp_path / "recorded.txt"),
+                            "--record", trace], recorded) == 0
+    info, records = read_trace(trace)
+    assert info["argv"][:2] == ["-b", "1"]
+    # a failed access is recorded with its error and again for the retry
+    errors = sum(bool(record.operation & ERROR) for record in records)
+    assert errors == recorded.total("retries") > 0
+    assert len(records) == (recorded.total("reads") + recorded.total("writes")
+                            + errors)
+    # the readback of the teardown at the virtual time of the end
+    assert records[-1].reg == registers.REG_RX_PORT_STS1
+    assert records[-1].time > 60
+
+    replay = TraceReplay(trace)
+    assert run_main(argv + ["-o", str(tmp_path / "replayed.txt")],
+                    replay.i2c) == 0
+    assert not any(replay.records.values())
+    assert (result_map(tmp_path / "recorded.txt") ==
+            result_map(tmp_path / "replayed.txt"))
+
+
+def test_trace_replay_diverges(tmp_path):
+    trace = str(tmp_path / "run.trc")
+    argv = ["-b", "1", "-n", "-o", str(tmp_path / "r.txt")]
+    assert run_main(argv + ["--record", trace], Simulation(seed=1).i2c) == 0
+    with pytest.raises(ValueError):
+        run_main(argv + ["--lock-runs", "20"], TraceReplay(trace).i2c)
+
+
+def test_trace_records_large_bus_numbers(tmp_path):
+    trace = str(tmp_path / "bus.trc")
+    simulation = Simulation(buses=[300])
+    with TraceRecorder(trace) as recorder:
+        with recorder.recording(simulation.i2c)(300) as i2c:
+            i2c.read(0x3d, registers.REG_I2C_DEV_ID)
+    records = read_trace(trace)[1]
+    assert [(record.bus, record.reg, record.data)
+            for record in records] == [(300, 0x00, [0x3d << 1])]
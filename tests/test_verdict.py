@@ -0,0 +1,38 @@
+"""Tests for the eye verdict"""
+from phycam.verdict import Verdict, batch_verdicts, eye_verdict, pack_maps
+
+
+def eye(rows, columns, size=15):
+    """map with 1.0 areas at rows x columns, 0.5 around them"""
+    return [[1.0 if i in rows and j in columns else
+             0.5 if i in rows else 0.0
+             for j in range(size)] for i in range(size)]
+
+
+def test_verdict_single_map():
+    assert eye_verdict(eye(range(3, 11), range(4, 11))) == Verdict(8, 28, True)
+    assert eye_verdict(eye(range(3, 5), range(4, 11))) == Verdict(2, 4, False)
+    assert eye_verdict(eye(range(3, 11), range(4, 7))) == Verdict(0, 0, False)
+
+
+def test_verdict_no_wraparound():
+    # the first and the last row must not form a rectangle
+    lock_result = eye([0, 14, 7], range(4, 11))
+    assert eye_verdict(lock_result) == Verdict(3, 0, False)
+
+
+def test_verdict_batch():
+    maps = [eye(range(3, 11), range(4, 11)), eye(range(5, 7), range(0, 15)),
+            [[1.0] * 4] * 3]
+    expected = [Verdict(8, 28, True), Verdict(2, 12, False),
+                Verdict(3, 2, True)]
+    assert batch_verdicts(maps) == expected
+    assert batch_verdicts(pack_maps(maps)) == expected
+    assert batch_verdicts(pack_maps(maps), rect_width=5) == [
+        Verdict(8, 21, True), Verdict(2, 11, False), Verdict(3, 0, False)]
+
+
+def test_verdict_batch_starting_with_an_empty_map():
+    maps = [[], eye(range(3, 11), range(4, 11))]
+    assert batch_verdicts(maps) == [Verdict(0, 0, False), Verdict(8, 28, True)]
+    assert eye_verdict([]) == Verdict(0, 0, False)